@@ -4,8 +4,62 @@ from abc import ABC
 import otf2.definitions
 import constants
 
+KIND_EVENT = 0
+KIND_CREATE_HANDLE = 1
+KIND_DESTROY_HANDLE = 2
+KIND_IO = 3
+KIND_SEEK = 4
+
+PARADIGMS = [None, "MPI", "HDF5", "POSIX", "ISOC"]
+PARADIGM_IDS = {paradigm: i for i, paradigm in enumerate(PARADIGMS)}
+
+# calls on an ISO C stream, their handles are ISOC even where the call itself is recorded as POSIX or without paradigm
+STREAM_FUNCTIONS = ["fopen", "fopen64", "fdopen", "fclose", "fflush", "fread", "fwrite", "fseek", "fseeko", "ftell", "ftello"]
+
+
+# positions of the recorder arguments every I/O function needs, size lists all arguments that are multiplied
+ARG_LAYOUTS = {
+    "creat": {"path": 0, "flags": 1},
+    "creat64": {"path": 0, "flags": 1},
+    "open": {"path": 0, "flags": 1},
+    "open64": {"path": 0, "flags": 1},
+    "fopen": {"path": 0, "mode": 1},
+    "fopen64": {"path": 0, "mode": 1},
+    "fdopen": {"path": 0, "mode": 1},
+    "close": {"path": 0},
+    "fclose": {"path": 0},
+    "read": {"path": 0, "size": (2,)},
+    "write": {"path": 0, "size": (2,)},
+    "readv": {"path": 0, "size": (1,), "num_chunks": 2},
+    "writev": {"path": 0, "size": (1,), "num_chunks": 2},
+    "fread": {"path": 3, "size": (1, 2)},
+    "fwrite": {"path": 3, "size": (1, 2)},
+    "pread": {"path": 0, "size": (2,), "offset": 3},
+    "pread64": {"path": 0, "size": (2,), "offset": 3},
+    "pwrite": {"path": 0, "size": (2,), "offset": 3},
+    "pwrite64": {"path": 0, "size": (2,), "offset": 3},
+    "lseek": {"path": 0, "offset": 1, "whence": 2},
+    "lseek64": {"path": 0, "offset": 1, "whence": 2},
+    "fseek": {"path": 0, "offset": 1, "whence": 2},
+}
+
+
+def get_paradigm(function):
+    if "MPI_" in function:
+        return "MPI"
+    elif "H5" in function:
+        return "HDF5"
+    elif function in ["creat", "creat64", "open", "open64", "close", "read", "write", "pread", "pwrite", "pread64", "pwrite64", "readv", "writev", "lseek", "lseek64", "unlink", "getcwd", "umask", "fcntl"]:
+        return "POSIX"
+    elif function in ["fopen", "fopen64", "fseek", "fread", "fwrite", "ftell", "fsync", "fdatasync", "fctrl", "dup", "dup2", "fdopen", "fseeko", "ftello"]:
+        return "ISOC"
+    return None
+
 
 class Event(ABC):
+    # slots keep the per event footprint small
+    __slots__ = ("rank_id", "function", "start_time", "end_time", "level", "tid", "paradigm")
+    kind = KIND_EVENT
 
     def __init__(self, rank_id, function, start_time, end_time, level, tid):
         self.rank_id = rank_id
@@ -14,17 +68,7 @@ class Event(ABC):
         self.end_time = end_time
         self.level = level
         self.tid = tid
-        self.paradigm = None
-
-        # set paradigm
-        if "MPI_" in function:
-            self.paradigm = "MPI"
-        elif "H5" in function:
-            self.paradigm = "HDF5"
-        elif function in ["creat", "creat64", "open", "open64", "close", "read", "write", "pread", "pwrite", "pread64", "pwrite64", "readv", "writev", "lseek", "lseek64", "unlink", "getcwd", "umask", "fcntl"]:
-            self.paradigm = "POSIX"
-        elif function in ["fopen", "fopen64", "fseek", "fread", "fwrite", "ftell", "fsync", "fdatasync", "fctrl", "dup", "dup2", "fdopen", "fseeko", "ftello"]:
-            self.paradigm = "ISOC"
+        self.paradigm = get_paradigm(function)
 
     def get_start_time_ticks(self, timer_resolution):
         return math.ceil(self.start_time*timer_resolution)
@@ -33,189 +77,243 @@ class Event(ABC):
         return math.ceil(self.end_time*timer_resolution)
 
     @classmethod
-    def get_event(cls, rank_id, function, start_time, end_time, level, tid, args):
+    def get_event_class(cls, function):
 
         if function in ["creat", "creat64", "open", "open64", "fopen", "fopen64", "fdopen"]:
-            return IoCreateHandleEvent(rank_id, function, start_time, end_time, level, tid, args)
+            return IoCreateHandleEvent
         elif function in ["close", "fclose"]:
-            return IoDestroyHandleEvent(rank_id, function, start_time, end_time, level, tid, args)
+            return IoDestroyHandleEvent
         elif function in ["read", "write", "pread", "pwrite", "pread64", "pwrite64", "readv", "writev", "fread", "fwrite"]:
-            return IoEvent(rank_id, function, start_time, end_time, level, tid, args)
+            return IoEvent
         elif function in ["lseek", "lseek64", "fseek", "fseeko"]:
-            return IoSeekEvent(rank_id, function, start_time, end_time, level, tid, args)
+            return IoSeekEvent
         else:
-            return PlaceholderEvent(rank_id, function, start_time, end_time, level, tid, args)
+            return PlaceholderEvent
 
     def __repr__(self):
         return f"{self.start_time} : {self.function}"
 
 
 class IoCreateHandleEvent(Event):
+    __slots__ = ("path_name", "flags", "mode", "status", "creation")
+    kind = KIND_CREATE_HANDLE
 
     def __init__(self, rank_id, function, start_time, end_time, level, tid, args):
         super(IoCreateHandleEvent, self).__init__(rank_id, function, start_time, end_time, level, tid)
+        self.path_name, self.flags, self.mode, self.status, self.creation = self.parse_args(function, args)
 
-        self.path_name = None
-
-        self.mode = None
-        self.status = []
-        self.creation = []
+    @staticmethod
+    def parse_args(function, args):
+        layout = ARG_LAYOUTS.get(function, {})
+        path_name = None
+        flags = None
+        mode = None
+        status = [otf2.IoStatusFlag.NONE.value]
+        creation = [otf2.IoCreationFlag.NONE.value]
 
         # posix
-        if self.paradigm == "POSIX":
+        if "flags" in layout:
+            path_name = args[layout["path"]].decode("utf-8")
+            flags = int(args[layout["flags"]])
+            mode, status, creation = IoCreateHandleEvent.posix_access(flags)
+
+        # isoc
+        if "mode" in layout:
+            path_name = args[layout["path"]].decode("utf-8")
+            mode = IoCreateHandleEvent.isoc_access(args[layout["mode"]].decode("utf-8"))
 
-            self.path_name = args[0].decode("utf-8")
-            self.flags = int(args[1].decode("utf-8"))
+        return path_name, flags, mode, status, creation
 
-            # io mode
+    @staticmethod
+    def posix_access(flags):
+        # returns the access mode and the lists of status and creation flags of open(2) style flags
+        status = []
+        creation = []
 
-            if constants.check_flag(self.flags, constants.O_WRONLY):
-                self.mode = otf2.IoAccessMode.WRITE_ONLY.value
-            elif constants.check_flag(self.flags, constants.O_RDWR):
-                self.mode = otf2.IoAccessMode.READ_WRITE.value
-            else:
-                self.mode = otf2.IoAccessMode.READ_ONLY.value
+        # io mode
 
-            # creation flags
+        if constants.check_flag(flags, constants.O_WRONLY):
+            mode = otf2.IoAccessMode.WRITE_ONLY.value
+        elif constants.check_flag(flags, constants.O_RDWR):
+            mode = otf2.IoAccessMode.READ_WRITE.value
+        else:
+            mode = otf2.IoAccessMode.READ_ONLY.value
 
-            if constants.check_flag(self.flags, constants.O_CREAT):
-                self.creation.append(otf2.IoCreationFlag.CREATE.value)
+        # creation flags
 
-            if constants.check_flag(self.flags, constants.O_TRUNC):
-                self.creation.append(otf2.IoCreationFlag.TRUNCATE.value)
+        if constants.check_flag(flags, constants.O_CREAT):
+            creation.append(otf2.IoCreationFlag.CREATE.value)
 
-            # directory missing
+        if constants.check_flag(flags, constants.O_TRUNC):
+            creation.append(otf2.IoCreationFlag.TRUNCATE.value)
 
-            if constants.check_flag(self.flags, constants.O_EXCL):
-                self.creation.append(otf2.IoCreationFlag.EXCLUSIVE.value)
+        # directory missing
 
-            if constants.check_flag(self.flags, constants.O_NOCTTY):
-                self.creation.append(otf2.IoCreationFlag.NO_CONTROLLING_TERMINAL.value)
+        if constants.check_flag(flags, constants.O_EXCL):
+            creation.append(otf2.IoCreationFlag.EXCLUSIVE.value)
 
-            if constants.check_flag(self.flags, constants.O_NOFOLLOW):
-                self.creation.append(otf2.IoCreationFlag.NO_FOLLOW.value)
+        if constants.check_flag(flags, constants.O_NOCTTY):
+            creation.append(otf2.IoCreationFlag.NO_CONTROLLING_TERMINAL.value)
 
-            # path missing
-            # temporary_file missing
-            # large file not implemented/not working in otf2 -> __O_LARGEFILE does nothing
-            # no_seek missing
-            # unique missing
+        if constants.check_flag(flags, constants.O_NOFOLLOW):
+            creation.append(otf2.IoCreationFlag.NO_FOLLOW.value)
 
-            # status flags
+        # path missing
+        # temporary_file missing
+        # large file not implemented/not working in otf2 -> __O_LARGEFILE does nothing
+        # no_seek missing
+        # unique missing
 
-            if constants.check_flag(self.flags, constants.O_CLOEXEC):
-                self.status.append(otf2.IoStatusFlag.CLOSE_ON_EXEC.value)
+        # status flags
 
-            if constants.check_flag(self.flags, constants.O_APPEND):
-                self.creation.append(otf2.IoStatusFlag.APPEND.value)
+        if constants.check_flag(flags, constants.O_CLOEXEC):
+            status.append(otf2.IoStatusFlag.CLOSE_ON_EXEC.value)
 
-            if constants.check_flag(self.flags, constants.O_NONBLOCK):
-                self.status.append(otf2.IoStatusFlag.NON_BLOCKING.value)
+        if constants.check_flag(flags, constants.O_APPEND):
+            creation.append(otf2.IoStatusFlag.APPEND.value)
 
-            if constants.check_flag(self.flags, constants.FASYNC):
-                self.status.append(otf2.IoStatusFlag.ASYNC.value)
+        if constants.check_flag(flags, constants.O_NONBLOCK):
+            status.append(otf2.IoStatusFlag.NON_BLOCKING.value)
 
-            # sync missing
-            # data_sync missing
+        if constants.check_flag(flags, constants.FASYNC):
+            status.append(otf2.IoStatusFlag.ASYNC.value)
 
-            if constants.check_flag(self.flags, constants.O_DIRECT):
-                self.status.append(otf2.IoStatusFlag.AVOID_CACHING.value)
+        # sync missing
+        # data_sync missing
 
-            if constants.check_flag(self.flags, constants.O_NOATIME):
-                self.status.append(otf2.IoStatusFlag.NO_ACCESS_TIME.value)
+        if constants.check_flag(flags, constants.O_DIRECT):
+            status.append(otf2.IoStatusFlag.AVOID_CACHING.value)
 
-        # isoc
-        if self.paradigm == "ISOC":
+        if constants.check_flag(flags, constants.O_NOATIME):
+            status.append(otf2.IoStatusFlag.NO_ACCESS_TIME.value)
+
+        if len(status) == 0:
+            status.append(otf2.IoStatusFlag.NONE.value)
 
-            self.path_name = args[0].decode("utf-8")
-            self.mode = args[1].decode("utf-8")
-            if self.mode in ["r"]:
-                self.mode = otf2.IoAccessMode.READ_ONLY.value
-            elif self.mode in ["w", "a"]:
-                self.mode = otf2.IoAccessMode.WRITE_ONLY.value
-            elif self.mode in ["r+", "w+", "a+"]:
-                self.mode = otf2.IoAccessMode.READ_WRITE.value
+        if len(creation) == 0:
+            creation.append(otf2.IoCreationFlag.NONE.value)
 
-        if len(self.status) == 0:
-            self.status.append(otf2.IoStatusFlag.NONE.value)
+        return mode, status, creation
 
-        if len(self.creation) == 0:
-            self.creation.append(otf2.IoCreationFlag.NONE.value)
+    @staticmethod
+    def isoc_access(mode):
+        # the binary flag does not change the access mode
+        mode = mode.replace("b", "")
+        if mode in ["r"]:
+            return otf2.IoAccessMode.READ_ONLY.value
+        elif mode in ["w", "a"]:
+            return otf2.IoAccessMode.WRITE_ONLY.value
+        elif mode in ["r+", "w+", "a+"]:
+            return otf2.IoAccessMode.READ_WRITE.value
+        return mode
 
 
 class IoDestroyHandleEvent(Event):
+    __slots__ = ("path_name",)
+    kind = KIND_DESTROY_HANDLE
 
     def __init__(self, rank_id, function, start_time, end_time, level, tid, args):
         super(IoDestroyHandleEvent, self).__init__(rank_id, function, start_time, end_time, level, tid)
+        self.path_name = self.parse_args(function, args)
 
-        if function in ["close", "fclose"]:
-
-            self.path_name = args[0].decode("utf-8")
+    @staticmethod
+    def parse_args(function, args):
+        layout = ARG_LAYOUTS.get(function, {})
+        if "path" in layout:
+            return args[layout["path"]].decode("utf-8")
+        return None
 
 
 class IoDuplicateHandleEvent(Event):
+    __slots__ = ()
 
     def __init__(self, rank_id, function, start_time, end_time, level, tid):
         super(IoDuplicateHandleEvent, self).__init__(rank_id, function, start_time, end_time, level, tid)
 
 
 class IoDeleteFileEvent(Event):
+    __slots__ = ()
+
     def __init__(self, rank_id, function, start_time, end_time, level, tid):
         super(IoDeleteFileEvent, self).__init__(rank_id, function, start_time, end_time, level, tid)
 
 
 class IoEvent(Event):
+    __slots__ = ("offset", "num_chunks", "type", "path_name", "size")
+    kind = KIND_IO
 
     def __init__(self, rank_id, function, start_time, end_time, level, tid, args):
         super(IoEvent, self).__init__(rank_id, function, start_time, end_time, level, tid)
+        self.type, self.path_name, self.size, self.offset, self.num_chunks = self.parse_args(function, args)
 
-        self.offset = None
-        self.num_chunks = 1
+    @staticmethod
+    def parse_args(function, args):
+        layout = ARG_LAYOUTS.get(function, {})
+        operation_type = IoEvent.get_operation_type(function)
+        path_name = None
+        size = None
+        offset = None
+        num_chunks = 1
 
-        if function in ["write", "pwrite", "pwrite64", "writev", "fwrite"]:
-            self.type = otf2.IoOperationMode.WRITE.value
+        if "path" in layout:
+            path_name = args[layout["path"]].decode("utf-8")
 
-        if function in ["read", "pread", "pread64", "readv", "fread"]:
-            self.type = otf2.IoOperationMode.READ.value
+        if "size" in layout:
+            # fread/fwrite pass the item size and the item count
+            size = 1
+            for j in layout["size"]:
+                size *= int(args[j])
 
-        if function in ["read", "write"]:
-            self.path_name = args[0].decode("utf-8")
-            self.size = int(args[2].decode("utf-8"))
+        if "offset" in layout:
+            offset = int(args[layout["offset"]])
 
-        if function in ["readv", "writev"]:
-            self.path_name = args[0].decode("utf-8")
-            self.size = int(args[1].decode("utf-8"))
-            self.num_chunks = int(args[2].decode("utf-8"))
+        if "num_chunks" in layout:
+            num_chunks = int(args[layout["num_chunks"]])
 
-        if function in ["fread", "fwrite"]:
+        return operation_type, path_name, size, offset, num_chunks
 
-            self.size = int(args[1].decode("utf-8")) * int(args[2].decode("utf-8"))
-            self.path_name = args[3].decode("utf-8")
+    @staticmethod
+    def get_operation_type(function):
+        if function in ["write", "pwrite", "pwrite64", "writev", "fwrite"]:
+            return otf2.IoOperationMode.WRITE.value
+
+        if function in ["read", "pread", "pread64", "readv", "fread"]:
+            return otf2.IoOperationMode.READ.value
 
-        if function in ["pread", "pwrite", "pread64", "pwrite64"]:
-            self.offset = int(args[3].decode("utf-8"))
-            self.path_name = args[0].decode("utf-8")
-            self.size = int(args[2].decode("utf-8"))
+        return None
 
 
 # scorep_posix_io_wrap.c
 class IoSeekEvent(Event):
+    __slots__ = ("path_name", "offset", "whence")
+    kind = KIND_SEEK
 
     def __init__(self, rank_id, function, start_time, end_time, level, tid, args):
         super(IoSeekEvent, self).__init__(rank_id, function, start_time, end_time, level, tid)
-
-        if function in ["lseek", "lseek64", "fseek"]:
+        self.path_name, self.offset, self.whence = self.parse_args(function, args)
+        if self.path_name is not None:
             self.paradigm = "POSIX"
-            self.path_name = args[0].decode("utf-8")
-            self.offset = int(args[1].decode("utf-8"))
-            self.whence = int(args[2].decode("utf-8"))
+
+    @staticmethod
+    def parse_args(function, args):
+        layout = ARG_LAYOUTS.get(function, {})
+        if "path" in layout:
+            return args[layout["path"]].decode("utf-8"), int(args[layout["offset"]]), int(args[layout["whence"]])
+        return None, None, None
 
 
 class PlaceholderEvent(Event):
+    __slots__ = ()
 
     def __init__(self, rank_id, function, start_time, end_time, level, tid, args):
         super(PlaceholderEvent, self).__init__(rank_id, function, start_time, end_time, level, tid)
-        #print(args)
+
+
+EVENT_CLASSES = {KIND_EVENT: PlaceholderEvent,
+                 KIND_CREATE_HANDLE: IoCreateHandleEvent,
+                 KIND_DESTROY_HANDLE: IoDestroyHandleEvent,
+                 KIND_IO: IoEvent,
+                 KIND_SEEK: IoSeekEvent}
 
 
 # #creat
@@ -0,0 +1,78 @@
+import numpy as np
+import otf2
+
+import Events
+from event_table import NO_HANDLE, NO_VALUE
+
+# (name, unit, mode, type) of the metric members written per bin. the counters accumulate from the start of the
+# trace, so viewers show them as rates, open files is the number of open handles at the end of the bin
+METRIC_MEMBERS = [
+    ("read bytes", "B", otf2.MetricMode.ACCUMULATED_START, otf2.Type.UINT64),
+    ("write bytes", "B", otf2.MetricMode.ACCUMULATED_START, otf2.Type.UINT64),
+    ("read operations", "operations", otf2.MetricMode.ACCUMULATED_START, otf2.Type.UINT64),
+    ("write operations", "operations", otf2.MetricMode.ACCUMULATED_START, otf2.Type.UINT64),
+    ("metadata calls", "calls", otf2.MetricMode.ACCUMULATED_START, otf2.Type.UINT64),
+    ("open files", "files", otf2.MetricMode.ABSOLUTE_POINT, otf2.Type.INT64),
+]
+
+# group of the samples that cover all files of a rank
+ALL_FILES = -1
+
+
+class BinnedRank:
+    # the samples of one rank: group (path index or ALL_FILES), bin, the accumulated values at the end of the bin
+    # and whether the group was idle in the bin before
+
+    def __init__(self, groups, bins, values, deltas, idle_before):
+        self.groups = groups
+        self.bins = bins
+        self.values = values
+        self.deltas = deltas
+        self.idle_before = idle_before
+
+    def group_slices(self):
+        firsts = np.flatnonzero(np.concatenate(([True], self.groups[1:] != self.groups[:-1])))
+        lasts = np.append(firsts[1:], len(self.groups))
+        return [(self.groups[first].item(), first, last) for first, last in zip(firsts.tolist(), lasts.tolist())]
+
+
+def bin_rank(table, bin_width):
+    # a call counts in the bin it starts in. only the first segment of a call split by overlap resolution keeps its
+    # kind, so every call is counted once. open, close and seek calls are metadata calls
+    if len(table) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return BinnedRank(empty, empty, np.empty((0, len(METRIC_MEMBERS)), dtype=np.int64),
+                          np.empty((0, len(METRIC_MEMBERS)), dtype=np.int64), np.empty(0, dtype=bool))
+    kind = table.kind
+    io = kind == Events.KIND_IO
+    read = io & (table.mode == otf2.IoOperationMode.READ.value)
+    write = io & (table.mode == otf2.IoOperationMode.WRITE.value)
+    opened = (kind == Events.KIND_CREATE_HANDLE) & (table.mode != NO_VALUE)
+    closed = kind == Events.KIND_DESTROY_HANDLE
+    metadata = (kind == Events.KIND_CREATE_HANDLE) | closed | (kind == Events.KIND_SEEK)
+    counters = np.stack([np.where(read, table.size, 0), np.where(write, table.size, 0), read, write, metadata,
+                         opened.astype(np.int64) - closed], axis=1).astype(np.int64)
+    bins = np.floor(table.start / bin_width).astype(np.int64)
+
+    # every call counts for all files and for its own file
+    has_path = table.handle != NO_HANDLE
+    groups = np.concatenate((np.full(len(table), ALL_FILES, dtype=np.int64), table.handle[has_path].astype(np.int64)))
+    bins = np.concatenate((bins, bins[has_path]))
+    counters = np.concatenate((counters, counters[has_path]))
+
+    order = np.lexsort((bins, groups))
+    groups, bins, counters = groups[order], bins[order], counters[order]
+    firsts = np.flatnonzero(np.concatenate(([True], (groups[1:] != groups[:-1]) | (bins[1:] != bins[:-1]))))
+    groups, bins = groups[firsts], bins[firsts]
+    deltas = np.add.reduceat(counters, firsts, axis=0)
+
+    # accumulated per group: the running sum minus everything before the group's first bin
+    totals = np.cumsum(deltas, axis=0)
+    group_firsts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+    group_sizes = np.diff(np.append(group_firsts, len(groups)))
+    values = totals - np.repeat(totals[group_firsts] - deltas[group_firsts], group_sizes, axis=0)
+    # the rank may have opened files before the selected time range
+    values[:, -1] = np.maximum(values[:, -1], 0)
+
+    idle_before = np.concatenate(([True], (groups[1:] != groups[:-1]) | (bins[1:] != bins[:-1] + 1)))
+    return BinnedRank(groups, bins, values, deltas, idle_before)
@@ -0,0 +1,141 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from metrics import METRICS
+from recorder_to_otf2 import write_otf2_trace
+from synthetic import SyntheticTrace, parse_mix, write_recorder_trace
+
+DEFAULT_SCALES = ["4x5000", "16x20000"]
+
+
+def parse_scale(text):
+    # "16x20000" -> 16 ranks with 20000 records each
+    ranks, _, records = text.lower().partition("x")
+    return int(ranks), int(records)
+
+
+def run_scale(ranks, records, options):
+    # runs in its own process, so that the peak rss belongs to this scale only
+    stages = {}
+
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        stages[stage] = time.perf_counter() - start
+        return result
+
+    trace = timed("generate", SyntheticTrace, ranks, records, mix=options["mix"], depth=options["depth"],
+                  readv_chunks=options["readv_chunks"], threads=options["threads"], seed=options["seed"])
+    record_count = sum(lm.total_records for lm in trace.LMs)
+
+    fp_out = tempfile.mkdtemp(prefix="recorder_to_otf2_benchmark_")
+    try:
+        # with native the trace is written in recorder's per rank format and read back by recorder_reader
+        if options.get("native"):
+            timed("write_trace", write_recorder_trace, trace, os.path.join(fp_out, "recorder"))
+            trace = os.path.join(fp_out, "recorder")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            timed("convert", write_otf2_trace, trace, os.path.join(fp_out, "trace"), int(1e9), jobs=options["jobs"],
+                  pipeline_depth=options.get("pipeline", 0), output_format=options.get("format", "otf2"),
+                  write_jobs=options.get("write_jobs", 1))
+    finally:
+        shutil.rmtree(fp_out, ignore_errors=True)
+
+    # the stages the conversion measured itself, with jobs > 1 decode and overlap add up the time of all workers
+    stages.update((stage, seconds) for stage, (seconds, _, _) in METRICS.stages.items())
+    event_count = METRICS.counters["events_written"]
+
+    return {"ranks": ranks, "records_per_rank": records, "records": record_count, "events": event_count,
+            "records_per_second": record_count / stages["convert"], "events_per_second": event_count / stages["convert"],
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            # the largest of the decode and write workers, which are joined by now
+            "peak_rss_workers_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, "stages": stages}
+
+
+def run_in_process(ranks, records, options):
+    # not a pool worker, those may not start the decode pool of the conversion
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=lambda: sender.send(run_scale(ranks, records, options)))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def print_result(result):
+    stages = "  ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result["stages"].items())
+    print(f"{result['ranks']:>6} x {result['records_per_rank']:<8} {result['records']:>10} records "
+          f"{result['events_per_second']:>10.0f} events/s {result['peak_rss_mb']:>8.1f} MB "
+          f"{result.get('peak_rss_workers_mb', 0.0):>8.1f} MB workers   {stages}")
+
+
+def compare(results, baseline, tolerance):
+    # a scale regressed if its throughput dropped by more than tolerance
+    regressions = []
+    previous = {(r["ranks"], r["records_per_rank"]): r for r in baseline}
+    for result in results:
+        old = previous.get((result["ranks"], result["records_per_rank"]))
+        if old is not None and result["events_per_second"] < old["events_per_second"] * (1 - tolerance):
+            regressions.append(f"{result['ranks']}x{result['records_per_rank']}: {result['events_per_second']:.0f} events/s, "
+                               f"baseline {old['events_per_second']:.0f} events/s")
+    return regressions
+
+
+def main():
+
+    ap = argparse.ArgumentParser(description="converts synthetic recorder traces and reports the throughput, peak memory and time per stage")
+    ap.add_argument("--scale", action="append", help=f"RANKSxRECORDS per rank, can be repeated, default is {' '.join(DEFAULT_SCALES)}")
+    ap.add_argument("--mix", type=str, help="share of calls per paradigm, default is POSIX=0.5,ISOC=0.2,MPI=0.2,OTHER=0.1")
+    ap.add_argument("--depth", type=int, default=3, help="nesting depth of MPI calls, default is 3")
+    ap.add_argument("--readv-chunks", type=int, default=4, help="maximum number of chunks of readv/writev calls, default is 4")
+    ap.add_argument("--threads", type=int, default=1, help="threads per rank, default is 1")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="number of processes used to decode ranks, default is 1")
+    ap.add_argument("--write-jobs", type=int, default=1, help="number of processes writing otf2 event files, default is 1")
+    ap.add_argument("--pipeline", type=int, default=0, metavar="DEPTH", help="convert pipelined with this queue depth, default is 0 (off)")
+    ap.add_argument("--format", choices=["otf2", "parquet"], default="otf2", help="output format to convert to, default is otf2")
+    ap.add_argument("--native", action="store_true", help="write the synthetic trace to disk in recorder's format and convert it from there")
+    ap.add_argument("--json", type=str, help="write the results to this file")
+    ap.add_argument("--baseline", type=str, help="results of an earlier run, exits with 1 if a scale got slower")
+    ap.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown against the baseline, default is 0.1")
+    args = ap.parse_args()
+
+    options = {"mix": None if args.mix is None else parse_mix(args.mix), "depth": args.depth,
+               "readv_chunks": args.readv_chunks, "threads": args.threads, "seed": args.seed, "jobs": args.jobs,
+               "pipeline": args.pipeline, "format": args.format,
+               "native": args.native, "write_jobs": args.write_jobs}
+
+    results = []
+    for scale in args.scale or DEFAULT_SCALES:
+        ranks, records = parse_scale(scale)
+        result = run_in_process(ranks, records, options)
+        print_result(result)
+        results.append(result)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"options": options, "results": results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["options"] != json.loads(json.dumps(options)):
+            print("the baseline was measured with other options", baseline["options"])
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("regression", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from event_table import COLUMNS, EventTable
+
+# bump when the layout of the cached tables changes
+CACHE_VERSION = 1
+
+# bytes of every trace file that go into the fingerprint besides its name, size and modification time
+FINGERPRINT_BLOCK = 64 * 1024
+
+
+def parse_size(text):
+    # "512M", "20G", "1T" or plain bytes
+    text = str(text).strip().upper().rstrip("B")
+    factors = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if text and text[-1] in factors:
+        return int(float(text[:-1]) * factors[text[-1]])
+    return int(text)
+
+
+def trace_fingerprint(fp):
+    # changes whenever a file of the recorder directory is added, removed, resized, touched or rewritten
+    digest = hashlib.sha1(f"recorder_to_otf2 cache {CACHE_VERSION}".encode("utf-8"))
+    for root, dirs, names in os.walk(fp):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, fp)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+            with open(path, "rb") as f:
+                digest.update(f.read(FINGERPRINT_BLOCK))
+    return digest.hexdigest()[:32]
+
+
+def directory_size(fp):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(fp) for name in names)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_stale_parts(fp):
+    # ranks are written to "<name>.tmp-<pid>" and renamed when complete, parts of conversions that died are removed
+    for name in os.listdir(fp):
+        if ".tmp-" in name and not process_alive(int(name.rsplit("-", 1)[-1])):
+            shutil.rmtree(os.path.join(fp, name), ignore_errors=True)
+
+
+def save_table(fp, table):
+    # one .npy file per column, written next to fp and renamed so that fp only appears once it is complete
+    part_path = fp + f".tmp-{os.getpid()}"
+    shutil.rmtree(part_path, ignore_errors=True)
+    os.makedirs(part_path)
+    for name, column in table.columns.items():
+        np.save(os.path.join(part_path, f"{name}.npy"), np.ascontiguousarray(column))
+    with open(os.path.join(part_path, "paths.json"), "w") as f:
+        json.dump(table.paths, f)
+    shutil.rmtree(fp, ignore_errors=True)
+    os.rename(part_path, fp)
+
+
+def load_table(fp, func_names):
+    with open(os.path.join(fp, "paths.json")) as f:
+        paths = json.load(f)
+    columns = {}
+    for name, (_, dtype) in COLUMNS.items():
+        column = np.load(os.path.join(fp, f"{name}.npy"), mmap_mode="r")
+        # empty files cannot be mapped
+        columns[name] = column if len(column) else np.empty(0, dtype=dtype)
+    return EventTable(func_names, paths, columns)
+
+
+class TraceCache:
+    # keeps the decoded, unfiltered event tables of recorder traces as memory mappable .npy columns, one entry per
+    # trace fingerprint and one directory per rank. entries are evicted least recently used first once the cache
+    # directory grows beyond max_bytes.
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        meta_path = os.path.join(self.entry_path(key), "meta.json")
+        if not os.path.isfile(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION:
+            return None
+        # the modification time of meta.json is the last use of the entry
+        os.utime(meta_path)
+        return CachedTrace(self.entry_path(key), meta)
+
+    def create(self, key, funcs, rank_count):
+        path = self.entry_path(key)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        meta = {"version": CACHE_VERSION, "funcs": list(funcs), "rank_count": rank_count}
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        return CachedTrace(path, meta)
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(path, "meta.json")
+            if os.path.isfile(meta_path):
+                remove_stale_parts(path)
+                entries.append((os.path.getmtime(meta_path), name, directory_size(path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self.entry_path(name), ignore_errors=True)
+            total -= size
+
+
+class CachedTrace:
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.funcs = meta["funcs"]
+        self.rank_count = meta["rank_count"]
+
+    def rank_path(self, rank_id):
+        return os.path.join(self.path, f"rank_{rank_id}")
+
+    def has_rank(self, rank_id):
+        return os.path.isdir(self.rank_path(rank_id))
+
+    def save_rank(self, rank_id, table):
+        # safe to call from forked workers, every rank has its own directory
+        save_table(self.rank_path(rank_id), table)
+
+    def get_rank_table(self, rank_id):
+        return load_table(self.rank_path(rank_id), self.funcs)
@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+
+# lives inside the output directory next to the otf2 archive
+CHECKPOINT_DIR = "checkpoint"
+# the otf2 archive, the parquet export and the time slices
+ARCHIVE_ENTRIES = ["traces", "traces.otf2", "traces.def", "traces.parts", "events", "metrics", "files.parquet", "handles.parquet",
+                   "slices", "slices.parts"]
+
+
+def clear_output(fp_out, keep=()):
+    # only the files of a previous conversion are removed, anything else in the output directory is left alone
+    remove_entries(fp_out, [name for name in ARCHIVE_ENTRIES + [CHECKPOINT_DIR] if name not in keep])
+
+
+def remove_entries(fp_out, names):
+    for name in names:
+        path = os.path.join(fp_out, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+class Checkpoint:
+    # progress of a conversion: the definitions made so far, in the order they were made, and the finished ranks
+    # with what the backend needs to take over their output. the events of a rank are written once, to files the
+    # backend keeps until the conversion is complete. a resumed conversion replays the definitions, so everything
+    # gets the ids the written events refer to, converts the missing ranks and writes the global definitions. a
+    # checkpoint of another trace or other options is discarded.
+
+    def __init__(self, fp_out, fingerprint, options):
+        self.path = os.path.join(fp_out, CHECKPOINT_DIR)
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+        self.definitions_path = os.path.join(self.path, "definitions.jsonl")
+        self.fingerprint = fingerprint
+        self.options = options
+        self.funcs = None
+        self.rank_count = None
+        # rank id -> the state the backend saved with it
+        self.done = {}
+        self.definitions = []
+
+        manifest = None
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        if manifest is not None and manifest["fingerprint"] == fingerprint and manifest["options"] == options:
+            self.funcs = manifest["funcs"]
+            self.rank_count = manifest["rank_count"]
+            self.done = {int(rank_id): state for rank_id, state in manifest["done"].items()}
+            self.definitions = self.read_definitions()
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        # the definitions are rewritten without a line an interrupted write may have left incomplete
+        with open(self.definitions_path, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in self.definitions)
+        self.logged = len(self.definitions)
+
+    @property
+    def is_resumed(self):
+        return self.funcs is not None
+
+    def read_definitions(self):
+        definitions = []
+        if os.path.isfile(self.definitions_path):
+            with open(self.definitions_path) as f:
+                for line in f:
+                    try:
+                        definitions.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        return definitions
+
+    def start(self, funcs, rank_count):
+        if not self.is_resumed:
+            self.funcs = list(funcs)
+            self.rank_count = rank_count
+            self.write_manifest()
+
+    def write_manifest(self):
+        manifest = {"fingerprint": self.fingerprint, "options": self.options, "funcs": self.funcs, "rank_count": self.rank_count,
+                    "done": {str(rank_id): state for rank_id, state in sorted(self.done.items())}}
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def has_rank(self, rank_id):
+        return rank_id in self.done
+
+    def finish_ranks(self, log, states):
+        # log is the definition log of the backend, the entries it got since the last call are appended and on
+        # disk before the ranks count as done. states maps the finished rank ids to what the backend saves of them
+        with open(self.definitions_path, "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in log[self.logged:])
+            f.flush()
+            os.fsync(f.fileno())
+        self.logged = len(log)
+        self.done.update(states)
+        self.write_manifest()
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
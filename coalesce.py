@@ -0,0 +1,63 @@
+import numpy as np
+
+import Events
+from event_table import NO_HANDLE, NO_OFFSET, EventTable
+
+
+def coalesce_io(table, max_gap):
+    # merges runs of I/O calls of one location into single operations. two neighbouring rows are merged if both are
+    # single chunk calls of the same function on the same handle and level, the second one starts at most max_gap
+    # seconds after the first one ended and continues where it stopped: at offset + size or, for calls without an
+    # offset like write and fwrite, right behind the file position anyway. the merged row keeps the first row's
+    # start and offset, ends with the last row, sums the sizes and counts the merged calls in an extra calls column.
+    # table has to be sorted by start and carry the io_handle column of definition_tables.DefinitionTables
+    if len(table) < 2:
+        return table
+
+    merge = merge_mask(table, max_gap)
+    if not merge.any():
+        return table
+
+    size = table.size
+    firsts = np.flatnonzero(np.concatenate(([True], ~merge)))
+    lasts = np.append(firsts[1:], len(table)) - 1
+    merged = table.take(firsts)
+    merged.columns["end"] = table.end[lasts]
+    merged.columns["size"] = np.add.reduceat(size, firsts)
+    merged.columns["calls"] = (lasts - firsts + 1).astype(np.int32)
+    return merged
+
+
+def merge_mask(table, max_gap):
+    # merge[i] is true if row i + 1 is merged into row i
+    io = (table.kind == Events.KIND_IO) & (table.io_handle != NO_HANDLE) & (table.num_chunks == 1)
+    offset, size = table.offset, table.size
+    contiguous = np.where(offset[:-1] == NO_OFFSET, offset[1:] == NO_OFFSET, offset[1:] == offset[:-1] + size[:-1])
+    return (io[1:] & io[:-1] & contiguous
+            & (table.io_handle[1:] == table.io_handle[:-1])
+            & (table.func_id[1:] == table.func_id[:-1])
+            & (table.level[1:] == table.level[:-1])
+            & (table.start[1:] - table.end[:-1] <= max_gap))
+
+
+class ChunkCoalescer:
+    # coalesce_io for a location that arrives in consecutive chunks. the rows of the last run of a chunk may merge
+    # with the next chunk, they are held back until it arrives, so the result is the same as for the whole table
+
+    def __init__(self, max_gap):
+        self.max_gap = max_gap
+        self.held = None
+
+    def add(self, table):
+        if self.held is not None:
+            table = EventTable.concat([self.held, table])
+        if len(table) == 0:
+            self.held = None
+            return table
+        last_run = np.flatnonzero(np.concatenate(([True], ~merge_mask(table, self.max_gap))))[-1]
+        self.held = table.take(slice(last_run, None))
+        return coalesce_io(table.take(slice(0, last_run)), self.max_gap)
+
+    def flush(self):
+        held, self.held = self.held, None
+        return None if held is None else coalesce_io(held, self.max_gap)
@@ -0,0 +1,126 @@
+import numpy as np
+import otf2
+
+import Events
+from event_table import NO_HANDLE, NO_VALUE, EventTable
+
+
+class DefinitionTables:
+    # the otf2 definitions of a conversion in lists indexed by integers: regions by func_id, files by file id and
+    # handles by handle id. everything a rank needs is defined in one pass over its table before its events are
+    # written, so the writer loop only indexes lists. strings are interned by the otf2 registry, a path is stored
+    # once no matter how many handles refer to it. without a trace only the ids are assigned, files then holds the
+    # paths and handles the (rank, file id, paradigm id, slot) of every handle. every definition is appended to log
+    # in the order it was made, replaying the log defines everything again with the same ids, see checkpoint.
+
+    def __init__(self, trace, dispatch, paradigms, scope):
+        self.trace = trace
+        self.dispatch = dispatch
+        self.paradigms = paradigms
+        self.scope = scope
+        self.regions = [None] * len(dispatch)
+        self.file_ids = {}
+        self.files = []
+        self.handle_ids = {}
+        self.handles = []
+        self.log = []
+
+    def define_regions(self, func_ids):
+        if self.trace is None:
+            return
+        for func_id in np.unique(func_ids).tolist():
+            self.define_region(func_id)
+
+    def define_region(self, func_id):
+        if self.regions[func_id] is None:
+            name = self.dispatch[func_id].name
+            self.regions[func_id] = self.trace.definitions.region(name,
+                source_file="MPI" if name.startswith("MPI") else "POSIX",
+                region_role=otf2.RegionRole.FILE_IO)
+            self.log.append(["region", func_id])
+
+    def file_id(self, path_name):
+        file_id = self.file_ids.get(path_name)
+        if file_id is None:
+            file_id = self.file_ids[path_name] = len(self.files)
+            self.log.append(["file", path_name])
+            self.files.append(path_name if self.trace is None else self.trace.definitions.io_regular_file(path_name, scope=self.scope))
+        return file_id
+
+    def handle_id(self, rank_id, file_id, paradigm_id, slot):
+        key = (rank_id, file_id, paradigm_id, slot)
+        handle_id = self.handle_ids.get(key)
+        if handle_id is None:
+            handle_id = self.handle_ids[key] = len(self.handles)
+            self.log.append(["handle", *key])
+            if self.trace is None:
+                self.handles.append(key)
+                return handle_id
+            # create instead of io_handle, which would return the same handle for every rank
+            self.handles.append(self.trace.definitions.io_handles.create(
+                file=self.files[file_id], name=self.files[file_id].name,
+                io_paradigm=self.paradigms.get(Events.PARADIGMS[paradigm_id]),
+                io_handle_flags=otf2.IoHandleFlag.NONE))
+        return handle_id
+
+    def replay(self, entry):
+        # defines what a log entry of another conversion defined, returns False for entries of the backend
+        kind, *values = entry
+        if kind == "region":
+            self.define_region(*values)
+        elif kind == "file":
+            self.file_id(*values)
+        elif kind == "handle":
+            self.handle_id(*values)
+        else:
+            return False
+        return True
+
+    def assign_handles(self, rank_id, table, open_count=None):
+        # recorder resolves file descriptors to paths, so a rank's handles follow the open and close calls per path:
+        # an open takes the lowest free slot of its path, a close frees the most recently opened slot of its
+        # paradigm and the other calls use that slot as well. the paradigm of a slot is the one of the call that
+        # opened it, an ISO C stream is one handle from fopen to fclose. slots are reused after close, so a file
+        # opened and closed a thousand times has one handle and only files that are open several times at once get
+        # more. a rank that comes in chunks sorted by start passes the same open_count with every chunk.
+        handle_ids = np.full(len(table), NO_HANDLE, dtype=np.int32)
+        rows = np.flatnonzero(table.handle != NO_HANDLE)
+        rows = rows[np.argsort(table.start[rows], kind="stable")]
+        file_ids = [self.file_id(path_name) for path_name in table.paths]
+        handle_paradigms = np.array([info.handle_paradigm_id for info in self.dispatch], dtype=np.int8)
+
+        # file id -> the open (slot, paradigm id) of the path in the order they were opened
+        open_count = {} if open_count is None else open_count
+        for i, path_id, kind, paradigm_id, mode in zip(rows.tolist(), table.handle[rows].tolist(), table.kind[rows].tolist(),
+                                                       handle_paradigms[table.func_id[rows]].tolist(), table.mode[rows].tolist()):
+            file_id = file_ids[path_id]
+            opened = open_count.setdefault(file_id, [])
+            if kind == Events.KIND_CREATE_HANDLE and mode != NO_VALUE:
+                taken = {slot for slot, _ in opened}
+                slot = next(slot for slot in range(len(opened) + 1) if slot not in taken)
+                opened.append((slot, paradigm_id))
+            else:
+                # a call on a file opened before the recording started uses slot 0
+                position = next((j for j in range(len(opened) - 1, -1, -1) if opened[j][1] == paradigm_id), None)
+                slot = 0 if position is None else opened[position][0]
+                if kind == Events.KIND_DESTROY_HANDLE and position is not None:
+                    del opened[position]
+            handle_ids[i] = self.handle_id(rank_id, file_id, paradigm_id, slot)
+        return handle_ids
+
+    def define_rank(self, rank_id, table, open_count=None):
+        # returns the table with the handle id of every event in an extra io_handle column
+        self.define_regions(table.func_id)
+        columns = dict(table.columns)
+        columns["io_handle"] = self.assign_handles(rank_id, table, open_count)
+        return type(table)(table.func_names, table.paths, columns)
+
+    def define_locations(self, rank_id, tables):
+        # define_rank for a rank that is already split into one table per location, handles are assigned over
+        # all locations of the rank together
+        if len(tables) <= 1:
+            return [self.define_rank(rank_id, table) for table in tables]
+        defined = self.define_rank(rank_id, EventTable.concat(tables))
+        bounds = np.cumsum([len(table) for table in tables])[:-1]
+        return [EventTable(table.func_names, table.paths, dict(table.columns, io_handle=handle_ids))
+                for table, handle_ids in zip(tables, np.split(defined.io_handle, bounds))]
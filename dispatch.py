@@ -0,0 +1,39 @@
+import Events
+
+
+class FunctionInfo:
+    # everything the converter needs to know about one recorder function, looked up by func_id
+    # the otf2 region of a function is not kept here but in definition_tables.DefinitionTables.regions, regions belong
+    # to one archive while the dispatch table is shared by all backends and the archives of the time windows
+    __slots__ = ("func_id", "name", "event_class", "kind", "paradigm", "paradigm_id", "handle_paradigm_id", "operation_mode", "layout",
+                 "required_args", "skipped")
+
+    def __init__(self, func_id, name):
+        self.func_id = func_id
+        self.name = name
+        self.event_class = Events.Event.get_event_class(name)
+        self.kind = self.event_class.kind
+        self.layout = Events.ARG_LAYOUTS.get(name, {})
+
+        self.paradigm = Events.get_paradigm(name)
+        if self.kind == Events.KIND_SEEK and "path" in self.layout:
+            self.paradigm = "POSIX"
+        self.paradigm_id = Events.PARADIGM_IDS[self.paradigm]
+        # the paradigm of the handle the call works on, fseek is recorded as POSIX and fclose without a paradigm
+        self.handle_paradigm_id = Events.PARADIGM_IDS["ISOC" if name in Events.STREAM_FUNCTIONS else self.paradigm]
+
+        self.operation_mode = Events.IoEvent.get_operation_type(name) if self.kind == Events.KIND_IO else None
+
+        # the layout is the argument schema of the function, records with fewer arguments cannot be decoded
+        positions = [j for value in self.layout.values() for j in (value if isinstance(value, tuple) else (value,))]
+        self.required_args = max(positions) + 1 if positions else 0
+
+        # set by filters.EventFilter.apply, records of skipped functions are dropped before they are decoded
+        self.skipped = False
+
+    def __repr__(self):
+        return f"{self.func_id} : {self.name}"
+
+
+def build_dispatch_table(func_names):
+    return [FunctionInfo(func_id, name) for func_id, name in enumerate(func_names)]
@@ -0,0 +1,194 @@
+import array
+import functools
+
+import numpy as np
+
+import Events
+
+NO_HANDLE = -1
+NO_VALUE = -1
+NO_OFFSET = np.iinfo(np.int64).min
+
+# column name -> (array typecode used while building, numpy dtype of the finished column)
+COLUMNS = {
+    "rank": ("i", np.int32),
+    "tid": ("i", np.int32),
+    "func_id": ("i", np.int32),
+    "level": ("h", np.int16),
+    "kind": ("b", np.int8),
+    "paradigm": ("b", np.int8),
+    "start": ("d", np.float64),
+    "end": ("d", np.float64),
+    "handle": ("i", np.int32),
+    "size": ("q", np.int64),
+    "offset": ("q", np.int64),
+    "num_chunks": ("i", np.int32),
+    "mode": ("b", np.int8),
+    "whence": ("b", np.int8),
+    "creation": ("I", np.uint32),
+    "status": ("I", np.uint32),
+}
+
+# open flags and fopen modes repeat a lot, so their decoding is cached
+posix_access = functools.lru_cache(maxsize=None)(Events.IoCreateHandleEvent.posix_access)
+isoc_access = functools.lru_cache(maxsize=None)(Events.IoCreateHandleEvent.isoc_access)
+
+
+class EventTable:
+    # struct of arrays holding the events of one or more ranks, function names and paths are stored once
+    # in func_names and paths and referenced by func_id and handle
+
+    def __init__(self, func_names, paths, columns):
+        self.func_names = func_names
+        self.paths = paths
+        self.columns = columns
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns")
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.columns["start"])
+
+    @classmethod
+    def empty(cls, func_names, paths=None):
+        return cls(func_names, [] if paths is None else paths, {name: np.empty(0, dtype=dtype) for name, (_, dtype) in COLUMNS.items()})
+
+    @classmethod
+    def concat(cls, tables):
+        # all tables have to share func_names, paths and extra columns, this holds for the tables of a single rank
+        tables = list(tables)
+        return cls(tables[0].func_names, tables[0].paths, {name: np.concatenate([t.columns[name] for t in tables]) for name in tables[0].columns})
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def start_ticks(self, timer_resolution):
+        return np.ceil(self.start * timer_resolution).astype(np.int64)
+
+    def end_ticks(self, timer_resolution):
+        return np.ceil(self.end * timer_resolution).astype(np.int64)
+
+    def take(self, index):
+        return EventTable(self.func_names, self.paths, {name: column[index] for name, column in self.columns.items()})
+
+    def is_sorted(self):
+        return bool(np.all(self.start[1:] >= self.start[:-1]))
+
+    def sort(self):
+        if self.is_sorted():
+            return self
+        return self.take(np.argsort(self.start, kind="stable"))
+
+    def split_by(self, name):
+        # keeps the row order within every part
+        column = self.columns[name]
+        values = np.unique(column)
+        if len(values) == 1:
+            return {values[0].item(): self}
+        return {value.item(): self.take(column == value) for value in values}
+
+    def event(self, i):
+        # materializes row i as an Event object, only used where per event objects are convenient
+        row = {name: column[i].item() for name, column in self.columns.items()}
+        event = Events.EVENT_CLASSES[row["kind"]].__new__(Events.EVENT_CLASSES[row["kind"]])
+        event.rank_id = row["rank"]
+        event.function = self.func_names[row["func_id"]]
+        event.start_time = row["start"]
+        event.end_time = row["end"]
+        event.level = row["level"]
+        event.tid = row["tid"]
+        event.paradigm = Events.PARADIGMS[row["paradigm"]]
+
+        path_name = None if row["handle"] == NO_HANDLE else self.paths[row["handle"]]
+        offset = None if row["offset"] == NO_OFFSET else row["offset"]
+        if row["kind"] == Events.KIND_CREATE_HANDLE:
+            event.path_name = path_name
+            event.mode = None if row["mode"] == NO_VALUE else row["mode"]
+            event.creation = [row["creation"]]
+            event.status = [row["status"]]
+        elif row["kind"] == Events.KIND_DESTROY_HANDLE:
+            event.path_name = path_name
+        elif row["kind"] == Events.KIND_IO:
+            event.path_name = path_name
+            event.type = None if row["mode"] == NO_VALUE else row["mode"]
+            event.size = row["size"]
+            event.offset = offset
+            event.num_chunks = row["num_chunks"]
+        elif row["kind"] == Events.KIND_SEEK:
+            event.path_name = path_name
+            event.offset = offset
+            event.whence = None if row["whence"] == NO_VALUE else row["whence"]
+        return event
+
+    def events(self):
+        for i in range(len(self)):
+            yield self.event(i)
+
+
+class EventTableBuilder:
+
+    def __init__(self, func_names):
+        self.func_names = func_names
+        self.paths = []
+        self.path_ids = {}
+        self.arrays = {name: array.array(typecode) for name, (typecode, _) in COLUMNS.items()}
+        self.appenders = [self.arrays[name].append for name in COLUMNS]
+
+    def path_id(self, path_name):
+        if path_name is None:
+            return NO_HANDLE
+        path_id = self.path_ids.get(path_name)
+        if path_id is None:
+            path_id = self.path_ids[path_name] = len(self.paths)
+            self.paths.append(path_name)
+        return path_id
+
+    def append(self, rank_id, tid, func_id, level, kind, paradigm, start_time, end_time,
+               handle=NO_HANDLE, size=0, offset=NO_OFFSET, num_chunks=1, mode=NO_VALUE, whence=NO_VALUE, creation=0, status=0):
+        # the argument order has to match COLUMNS
+        for append, value in zip(self.appenders, (rank_id, tid, func_id, level, kind, paradigm, start_time, end_time,
+                                                  handle, size, offset, num_chunks, mode, whence, creation, status)):
+            append(value)
+
+    def append_record(self, rank_id, info, start_time, end_time, level, tid, args):
+        # info is the dispatch table entry of the record's function
+        kind = info.kind
+        layout = info.layout
+
+        if kind == Events.KIND_IO:
+            size = 1
+            for j in layout["size"]:
+                size *= int(args[j])
+            self.append(rank_id, tid, info.func_id, level, kind, info.paradigm_id, start_time, end_time,
+                        handle=self.path_id(args[layout["path"]].decode("utf-8")), size=size,
+                        offset=int(args[layout["offset"]]) if "offset" in layout else NO_OFFSET,
+                        num_chunks=int(args[layout["num_chunks"]]) if "num_chunks" in layout else 1,
+                        mode=NO_VALUE if info.operation_mode is None else info.operation_mode)
+        elif kind == Events.KIND_SEEK and "path" in layout:
+            self.append(rank_id, tid, info.func_id, level, kind, info.paradigm_id, start_time, end_time,
+                        handle=self.path_id(args[layout["path"]].decode("utf-8")),
+                        offset=int(args[layout["offset"]]), whence=int(args[layout["whence"]]))
+        elif kind == Events.KIND_CREATE_HANDLE and "flags" in layout:
+            mode, status, creation = posix_access(int(args[layout["flags"]]))
+            self.append(rank_id, tid, info.func_id, level, kind, info.paradigm_id, start_time, end_time,
+                        handle=self.path_id(args[layout["path"]].decode("utf-8")), mode=mode,
+                        creation=creation[0], status=status[0])
+        elif kind == Events.KIND_CREATE_HANDLE and "mode" in layout:
+            mode = isoc_access(args[layout["mode"]].decode("utf-8"))
+            self.append(rank_id, tid, info.func_id, level, kind, info.paradigm_id, start_time, end_time,
+                        handle=self.path_id(args[layout["path"]].decode("utf-8")),
+                        mode=mode if isinstance(mode, int) else NO_VALUE)
+        elif kind == Events.KIND_DESTROY_HANDLE and "path" in layout:
+            self.append(rank_id, tid, info.func_id, level, kind, info.paradigm_id, start_time, end_time,
+                        handle=self.path_id(args[layout["path"]].decode("utf-8")))
+        else:
+            self.append(rank_id, tid, info.func_id, level, kind, info.paradigm_id, start_time, end_time)
+
+    def build(self):
+        columns = {name: np.frombuffer(self.arrays[name], dtype=dtype) if len(self.arrays[name]) else np.empty(0, dtype=dtype)
+                   for name, (_, dtype) in COLUMNS.items()}
+        return EventTable(self.func_names, self.paths, columns)
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from event_table import EventTable
+from metrics import METRICS
+
+# rows handed to the writer at a time, the writer turns every column of them into python lists
+WRITE_CHUNK = 1 << 18
+
+
+class SortedRank:
+    # the events of a rank whose table is larger than the sort memory, handed out in chunks sorted by start over
+    # all threads. the threads of a rank come one after the other, each cut into runs of at most run_events rows.
+    # recorder writes the calls of a thread in start order and only overlap splitting moves a few of them, so the
+    # runs of a thread almost always follow each other once each is sorted: then the table is passed through, a
+    # run is sorted just before it is written and the threads are merged. otherwise the table is cut into sorted
+    # runs that are spilled to spill_dir, the table is released and the runs are merged while they are written.
+    # a spilled rank is pickled as the paths of its runs, so a decode worker hands it on without the events.
+
+    def __init__(self, table, run_events, spill_dir=None):
+        # len and nbytes are those of the table, for memory_budget.MemoryBudget.observe
+        self.events = len(table)
+        self.nbytes = table.nbytes
+        self.func_names = table.func_names
+        self.paths = table.paths
+        self.func_ids = np.unique(table.func_id)
+        # the first start of every thread, the thread with the earliest is the master thread
+        tids = table.tid
+        self.first_starts = {tid: float(table.start[tids == tid].min()) for tid in np.unique(tids).tolist()}
+        self.path = None
+        self.runs = None
+        self.table = None
+
+        # the rows where the thread changes, every thread has to be one block of rows to be passed through
+        bounds = np.concatenate(([0], np.flatnonzero(tids[1:] != tids[:-1]) + 1, [len(table)])).tolist()
+        self.run_events = max(run_events // max(len(bounds) - 1, 1), 1)
+        if len(bounds) - 2 < len(self.first_starts) and all(
+                self.runs_in_order(table.start[first:last]) for first, last in zip(bounds[:-1], bounds[1:])):
+            self.table = table
+            self.thread_bounds = list(zip(bounds[:-1], bounds[1:]))
+            METRICS.count("sort_passed_through")
+            return
+
+        self.run_events = max(run_events, 1)
+        self.path = tempfile.mkdtemp(prefix="recorder_to_otf2_sort_", dir=spill_dir)
+        self.runs = [self.spill(k, table.take(slice(first, first + self.run_events)).sort())
+                     for k, first in enumerate(range(0, len(table), self.run_events))]
+        METRICS.count("sort_runs_spilled", len(self.runs))
+
+    def __len__(self):
+        return self.events
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.runs is not None:
+            state["runs"] = len(self.runs)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.runs is not None:
+            self.runs = [load_records(self.run_path(k), self.func_names, self.paths) for k in range(self.runs)]
+
+    def runs_in_order(self, starts):
+        # true if sorting every run on its own sorts all of them
+        firsts = range(0, len(starts), self.run_events)
+        lows = [starts[first:first + self.run_events].min() for first in firsts]
+        highs = [starts[first:first + self.run_events].max() for first in firsts]
+        return all(low >= high for low, high in zip(lows[1:], highs[:-1]))
+
+    def run_path(self, k):
+        return os.path.join(self.path, f"run-{k}.npy")
+
+    def spill(self, k, run):
+        save_records(self.run_path(k), run)
+        return load_records(self.run_path(k), self.func_names, self.paths)
+
+    def thread_chunks(self, first, last):
+        for run_first in range(first, last, self.run_events):
+            with METRICS.stage("sort"):
+                run = self.table.take(slice(run_first, min(run_first + self.run_events, last))).sort()
+            for chunk_first in range(0, len(run), WRITE_CHUNK):
+                yield run.take(slice(chunk_first, chunk_first + WRITE_CHUNK))
+
+    def tables(self):
+        # yields the events in chunks of about WRITE_CHUNK rows, in the order a stable sort by start gives them
+        if self.table is not None:
+            streams = [self.thread_chunks(first, last) for first, last in self.thread_bounds]
+        else:
+            streams = [run_chunks(run) for run in self.runs]
+        if len(streams) == 1:
+            yield from streams[0]
+        else:
+            yield from merge_sorted(streams, WRITE_CHUNK)
+
+    def remove(self):
+        self.table = None
+        self.runs = None
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+
+def save_records(fp, table):
+    # one file of records for a table, read back memory mapped by load_records
+    records = np.empty(len(table), dtype=[(name, column.dtype) for name, column in table.columns.items()])
+    for name, column in table.columns.items():
+        records[name] = column
+    np.save(fp, records)
+
+
+def load_records(fp, func_names, paths):
+    # a view per column into the memory mapped records
+    records = np.load(fp, mmap_mode="r")
+    return EventTable(func_names, paths, {name: records[name] for name in records.dtype.names})
+
+
+def run_chunks(run):
+    for first in range(0, len(run), WRITE_CHUNK):
+        yield run.take(slice(first, first + WRITE_CHUNK))
+
+
+def merge_sorted(streams, chunk_events):
+    # k-way merge of streams of tables, each stream yields one sequence sorted by start in consecutive chunks. of
+    # rows with the same start those of earlier streams come first, so if the streams are consecutive parts of one
+    # table the result is the same as a stable sort of the whole table
+    buffers = [next(stream, None) for stream in streams]
+
+    def take(k, count):
+        # the first count rows of a stream's buffer, which is refilled from the stream when it runs empty
+        piece = buffers[k].take(slice(0, count))
+        buffers[k] = buffers[k].take(slice(count, None))
+        while buffers[k] is not None and len(buffers[k]) == 0:
+            buffers[k] = next(streams[k], None)
+        return piece
+
+    while True:
+        active = [k for k in range(len(streams)) if buffers[k] is not None]
+        if not active:
+            return
+        step = max(chunk_events // len(active), 1)
+        # every row a stream has left behind its next step rows starts at or after the lowest of their last starts
+        limit = min(buffers[k].start[min(step, len(buffers[k])) - 1] for k in active)
+        with METRICS.stage("merge"):
+            pieces = []
+            for k in active:
+                count = int(np.searchsorted(buffers[k].start[:step], limit))
+                if count:
+                    pieces.append(take(k, count))
+            if pieces:
+                merged = EventTable.concat(pieces)
+                merged = merged.take(np.argsort(merged.start, kind="stable"))
+        if pieces:
+            yield merged
+            continue
+
+        # every row left starts at limit or later and at least one stream continues with rows at limit, those are
+        # passed on stream after stream
+        for k in active:
+            while buffers[k] is not None and buffers[k].start[0] == limit:
+                with METRICS.stage("merge"):
+                    piece = take(k, int(np.searchsorted(buffers[k].start, limit, side="right")))
+                    piece = EventTable(piece.func_names, piece.paths, {name: np.array(column) for name, column in piece.columns.items()})
+                yield piece
@@ -0,0 +1,163 @@
+import fnmatch
+import json
+
+import numpy as np
+
+# internal calls and broadcasts have never been written to the trace, unless a function include selects them
+DEFAULT_EXCLUDE_FUNCTIONS = ["__*", "MPI_Bcast"]
+
+
+def parse_time_range(text):
+    # "120:300", "120:" or ":300" in seconds since the start of the trace
+    first, _, last = str(text).partition(":")
+    return float(first) if first.strip() else 0.0, float(last) if last.strip() else float("inf")
+
+
+def below(path_name, prefixes):
+    # true if the path is one of the prefixes or inside one of them, /scratch covers /scratch/a but not /scratch2
+    return any(path_name == prefix.rstrip("/") or path_name.startswith(prefix.rstrip("/") + "/") for prefix in prefixes)
+
+
+def parse_rank_set(text):
+    # "0-3,8,10-11" -> {0, 1, 2, 3, 8, 10, 11}
+    ranks = set()
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            ranks.update(range(int(first), int(last) + 1))
+        else:
+            ranks.add(int(part))
+    return ranks
+
+
+class EventFilter:
+    # decides which ranks, functions and files end up in the trace. function and paradigm rules are compiled into
+    # a mask over func_id, path rules are checked once per distinct path while records are read.
+    # a rule set without includes selects everything, excludes always win over includes. the default excludes are
+    # the exception, a function matching a function include is kept even if a default exclude matches it.
+
+    def __init__(self, include_paradigms=(), exclude_paradigms=(), include_functions=(), exclude_functions=(),
+                 include_paths=(), exclude_paths=(), include_ranks=None, exclude_ranks=None, time_range=None):
+        self.include_paradigms = {p.upper() for p in include_paradigms}
+        self.exclude_paradigms = {p.upper() for p in exclude_paradigms}
+        self.include_functions = list(include_functions)
+        self.exclude_functions = list(exclude_functions)
+        self.include_paths = tuple(include_paths)
+        self.exclude_paths = tuple(exclude_paths)
+        self.include_ranks = None if include_ranks is None else set(include_ranks)
+        self.exclude_ranks = set() if exclude_ranks is None else set(exclude_ranks)
+        # calls are kept if they start within [start, end)
+        self.time_range = time_range
+        self.path_cache = {}
+
+    @classmethod
+    def from_file(cls, fp):
+        # {"include": {"paradigms": [], "functions": [], "paths": [], "ranks": "0-3"}, "exclude": {...},
+        #  "time_range": "120:300"}
+        with open(fp) as f:
+            config = json.load(f)
+        event_filter = cls()
+        event_filter.update(config.get("include", {}), config.get("exclude", {}))
+        if config.get("time_range") is not None:
+            event_filter.time_range = parse_time_range(config["time_range"])
+        return event_filter
+
+    @classmethod
+    def from_args(cls, args):
+        event_filter = cls() if args.filter is None else cls.from_file(args.filter)
+        event_filter.update({"paradigms": args.include_paradigm, "functions": args.include_function,
+                             "paths": args.include_path, "ranks": args.include_ranks},
+                            {"paradigms": args.exclude_paradigm, "functions": args.exclude_function,
+                             "paths": args.exclude_path, "ranks": args.exclude_ranks})
+        if args.time_range is not None:
+            event_filter.time_range = parse_time_range(args.time_range)
+        return event_filter
+
+    def update(self, include, exclude):
+        self.include_paradigms.update(p.upper() for p in include.get("paradigms") or [])
+        self.exclude_paradigms.update(p.upper() for p in exclude.get("paradigms") or [])
+        self.include_functions += include.get("functions") or []
+        self.exclude_functions += exclude.get("functions") or []
+        self.include_paths += tuple(include.get("paths") or [])
+        self.exclude_paths += tuple(exclude.get("paths") or [])
+        if include.get("ranks") is not None:
+            ranks = parse_rank_set(include["ranks"])
+            self.include_ranks = ranks if self.include_ranks is None else self.include_ranks & ranks
+        if exclude.get("ranks") is not None:
+            self.exclude_ranks |= parse_rank_set(exclude["ranks"])
+        self.path_cache = {}
+
+    def rules(self):
+        # json serializable, tells whether a checkpoint was written with the same rules
+        return {"include_paradigms": sorted(self.include_paradigms), "exclude_paradigms": sorted(self.exclude_paradigms),
+                "include_functions": self.include_functions, "exclude_functions": self.exclude_functions,
+                "default_exclude_functions": DEFAULT_EXCLUDE_FUNCTIONS,
+                "include_paths": list(self.include_paths), "exclude_paths": list(self.exclude_paths),
+                "include_ranks": None if self.include_ranks is None else sorted(self.include_ranks),
+                "exclude_ranks": sorted(self.exclude_ranks),
+                "time_range": None if self.time_range is None else list(self.time_range)}
+
+    def select_function(self, name, paradigm):
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in self.exclude_functions):
+            return False
+        if paradigm is not None and paradigm.upper() in self.exclude_paradigms:
+            return False
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in self.include_functions):
+            return True
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in DEFAULT_EXCLUDE_FUNCTIONS):
+            return False
+        if not self.include_functions and not self.include_paradigms:
+            return True
+        return paradigm is not None and paradigm.upper() in self.include_paradigms
+
+    def function_mask(self, dispatch):
+        return [self.select_function(info.name, info.paradigm) for info in dispatch]
+
+    def apply(self, dispatch):
+        # compiles the function rules into the dispatch table, filtered functions are dropped while reading
+        for info, selected in zip(dispatch, self.function_mask(dispatch)):
+            info.skipped = not selected
+
+    def ranks(self, rank_count):
+        return [rank_id for rank_id in range(rank_count)
+                if (self.include_ranks is None or rank_id in self.include_ranks) and rank_id not in self.exclude_ranks]
+
+    @property
+    def has_path_rules(self):
+        return bool(self.include_paths or self.exclude_paths)
+
+    def select_path(self, raw_path):
+        # raw_path is the undecoded argument, so every distinct path is decoded and matched only once
+        selected = self.path_cache.get(raw_path)
+        if selected is None:
+            path_name = raw_path.decode("utf-8") if isinstance(raw_path, bytes) else raw_path
+            selected = (not self.include_paths or below(path_name, self.include_paths)) and not below(path_name, self.exclude_paths)
+            self.path_cache[raw_path] = selected
+        return selected
+
+    def filter_table(self, table, dispatch):
+        # the same rules applied to an already decoded table, e.g. one loaded from the cache
+        keep = ~np.array([info.skipped for info in dispatch], dtype=bool)[table.func_id]
+        if self.has_path_rules:
+            # the extra entry is picked by NO_HANDLE (-1), calls without a path are never dropped by path rules
+            selected = np.array([self.select_path(path) for path in table.paths] + [True], dtype=bool)
+            keep &= selected[table.handle]
+        if self.time_range is not None:
+            keep &= (table.start >= self.time_range[0]) & (table.start < self.time_range[1])
+        return table if keep.all() else table.take(keep)
+
+
+def add_filter_arguments(ap):
+    ap.add_argument("--filter", type=str, help="json file with include and exclude rules")
+    ap.add_argument("--include-paradigm", action="append", help="only keep calls of this paradigm (POSIX, ISOC, MPI, HDF5)")
+    ap.add_argument("--exclude-paradigm", action="append", help="drop calls of this paradigm")
+    ap.add_argument("--include-function", action="append", help="only keep functions matching this glob")
+    ap.add_argument("--exclude-function", action="append", help="drop functions matching this glob")
+    ap.add_argument("--include-path", action="append", help="only keep I/O calls on files below this path prefix")
+    ap.add_argument("--exclude-path", action="append", help="drop I/O calls on files below this path prefix")
+    ap.add_argument("--ranks", "--include-ranks", dest="include_ranks", type=str, help="only convert these ranks, e.g. 0-3,8")
+    ap.add_argument("--exclude-ranks", type=str, help="skip these ranks")
+    ap.add_argument("--time-range", type=str, help="only convert calls starting in START:END seconds, either end may be left out")
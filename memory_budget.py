@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import threading
+
+from metrics import METRICS, peak_rss_mb
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# a rank holds about this many copies of its table at once: decoded, overlap split or sorted and defined
+TABLE_COPIES = 3
+
+# bytes per event of a table before the first rank is measured
+DEFAULT_EVENT_BYTES = 128
+
+# ranks decoded ahead per decode process when the budget allows it
+MAX_AHEAD_PER_JOB = 4
+
+
+def process_rss(pid="self"):
+    # the memory of a process in bytes, None where /proc is missing. the proportional set size splits the pages a
+    # forked worker still shares with this process between them, so they are not counted twice
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class MemoryBudget:
+    # keeps the resident memory of the conversion, this process and its decode and write workers, under max_bytes.
+    # every rank reserves an estimate of its memory from the moment its decoding is started until it is written.
+    # a rank is only started if the measured memory, or the reservations if they are higher, leave room for it,
+    # a rank is always started if nothing else is in flight, so the conversion cannot stall. the estimate per
+    # event is corrected with every decoded rank.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+        self.reserved = {}
+        self.event_bytes = DEFAULT_EVENT_BYTES * TABLE_COPIES
+        self.largest_rank = 0
+        self.base = self.rss()
+
+    def rss(self):
+        total = process_rss()
+        if total is None:
+            return int(peak_rss_mb() * (1 << 20))
+        for child in multiprocessing.active_children():
+            total += process_rss(child.pid) or 0
+        return total
+
+    def rank_bytes(self, events):
+        return int(events * self.event_bytes)
+
+    def observe(self, table):
+        # the measured bytes per event of a decoded rank, the estimate follows the largest seen so far
+        if len(table):
+            with self.lock:
+                self.event_bytes = max(self.event_bytes, table.nbytes / len(table) * TABLE_COPIES)
+                self.largest_rank = max(self.largest_rank, len(table))
+
+    def admit(self, rank_id, events):
+        # reserves the memory of a rank if it fits, returns False otherwise
+        with self.lock:
+            return self.try_admit(rank_id, events)
+
+    def try_admit(self, rank_id, events):
+        needed = self.rank_bytes(events)
+        if self.reserved:
+            in_use = max(self.rss(), self.base + sum(self.reserved.values()))
+            if in_use + needed > self.max_bytes:
+                return False
+        self.reserved[rank_id] = needed
+        return True
+
+    def wait_admit(self, rank_id, events):
+        # blocks until the rank fits, the memory is measured again at least every 100 ms
+        with self.released:
+            if self.try_admit(rank_id, events):
+                return
+            with METRICS.stage("wait_memory"):
+                while not self.try_admit(rank_id, events):
+                    self.released.wait(0.1)
+
+    def release(self, rank_id):
+        with self.released:
+            self.reserved.pop(rank_id, None)
+            self.released.notify_all()
+
+    def headroom(self):
+        return max(self.max_bytes - self.rss(), 0)
+
+    def sort_memory(self, sort_memory):
+        # ranks larger than a quarter of the memory left go through the out of core sort, in runs of that size
+        limit = max(self.headroom() // 4, 1 << 20)
+        return limit if sort_memory is None else min(sort_memory, limit)
+
+    def read_batch(self):
+        # calls read at a time by the native reader, about 1/16384 of the budget at up to ~150 bytes per call
+        return min(max(self.max_bytes >> 14, 1 << 12), 1 << 20)
@@ -0,0 +1,133 @@
+import collections
+import contextlib
+import json
+import resource
+import sys
+import threading
+import time
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # linux reports kilobytes. RUSAGE_CHILDREN is the largest peak of the worker processes that were joined
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class Metrics:
+    # wall time, calls and peak rss growth per pipeline stage and event counters. stages are timed once per rank or
+    # location and counters are updated with whole table sizes or batches, never per record, so they can always
+    # stay on. the peak rss growth of a stage is how much it raised the peak rss of its process, added up over its
+    # calls, a stage that stays below an earlier peak has none. the pipelined conversion updates them from the
+    # decode and the writer thread at the same time, their stages may take each other's growth
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.clear()
+
+    def clear(self):
+        # a forked worker clears its copy first, which also replaces a lock that was copied while held
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = collections.Counter()
+        # a Progress of this process checks the time whenever a counter changes, workers have none
+        self.progress = None
+
+    def restart(self):
+        self.clear()
+        self.start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        peak_before = peak_rss_mb()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            growth = peak_rss_mb() - peak_before
+            with self.lock:
+                old_seconds, old_calls, old_growth = self.stages.get(name, (0.0, 0, 0.0))
+                self.stages[name] = (old_seconds + seconds, old_calls + 1, old_growth + growth)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+        if self.progress is not None:
+            self.progress.tick()
+
+    def state(self):
+        return self.stages, dict(self.counters)
+
+    def merge(self, state):
+        # adds the metrics a worker process collected for one rank
+        stages, counters = state
+        with self.lock:
+            for name, (seconds, calls, growth) in stages.items():
+                old_seconds, old_calls, old_growth = self.stages.get(name, (0.0, 0, 0.0))
+                self.stages[name] = (old_seconds + seconds, old_calls + calls, old_growth + growth)
+            self.counters.update(counters)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def as_dict(self):
+        return {"seconds": self.elapsed, "peak_rss_mb": peak_rss_mb(), "peak_rss_workers_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+                "stages": {name: {"seconds": seconds, "calls": calls, "peak_rss_growth_mb": growth}
+                           for name, (seconds, calls, growth) in self.stages.items()},
+                "counters": dict(self.counters)}
+
+    def write_json(self, fp):
+        with open(fp, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def report(self):
+        # stages that ran in worker processes add up the time and peak rss growth of all workers
+        lines = [f"{'stage':<10} {'seconds':>10} {'calls':>8} {'peak rss +MB':>13}"]
+        for name, (seconds, calls, growth) in self.stages.items():
+            lines.append(f"{name:<10} {seconds:>10.2f} {calls:>8} {growth:>13.1f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<24} {value:>12}")
+        records = self.counters["records_read"]
+        lines.append(f"total {self.elapsed:.2f}s, {records / max(self.elapsed, 1e-9):.0f} records/s, peak rss {peak_rss_mb():.1f} MB, "
+                     f"workers {peak_rss_mb(resource.RUSAGE_CHILDREN):.1f} MB")
+        return "\n".join(lines)
+
+
+class Progress:
+    # prints the finished ranks, the records read, throughput and the estimated remaining time every interval
+    # seconds. the time is checked whenever a counter of metrics changes, the decode and write loops count every
+    # batch, so a large rank reports while it is converted. close detaches it from metrics
+
+    def __init__(self, metrics, total_ranks, interval, stream=sys.stderr):
+        self.metrics = metrics
+        self.total_ranks = total_ranks
+        self.interval = interval
+        self.stream = stream
+        self.done = 0
+        self.last_print = time.perf_counter()
+        if interval > 0:
+            metrics.progress = self
+
+    def rank_done(self):
+        self.done += 1
+        self.tick()
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.interval <= 0 or now - self.last_print < self.interval:
+            return
+        self.last_print = now
+        elapsed = self.metrics.elapsed
+        records = self.metrics.counters["records_read"]
+        # the remaining time is only known once a rank is done
+        eta = "" if self.done == 0 else f", eta {elapsed / self.done * (self.total_ranks - self.done):.0f}s"
+        print(f"{self.done}/{self.total_ranks} ranks, {records} records, {records / elapsed:.0f} records/s{eta}",
+              file=self.stream, flush=True)
+
+    def close(self):
+        if self.metrics.progress is self:
+            self.metrics.progress = None
+
+
+# the metrics of this process. forked workers start from a copy and send theirs back with every decoded rank
+METRICS = Metrics()
@@ -0,0 +1,316 @@
+import functools
+import os
+
+import numpy as np
+import otf2
+
+import Events
+import util
+from aggregate import ALL_FILES, METRIC_MEMBERS
+from checkpoint import remove_entries
+from definition_tables import DefinitionTables
+from event_table import NO_HANDLE, NO_OFFSET, NO_VALUE
+from external_sort import WRITE_CHUNK
+from metrics import METRICS
+from parallel_write import PARTS_DIR, PartWriters
+
+
+class Otf2Backend:
+    # writes the converted ranks as an otf2 archive. every recorder thread becomes a location, with aggregation
+    # every rank gets metric locations instead. the global definitions are written by close. with write_jobs > 1
+    # or a checkpoint the events of whole ranks are written to parts, see parallel_write, by worker processes or in
+    # this process. the parts of finished ranks are kept in the checkpoint, a resumed conversion defines everything
+    # again from its log and takes them over
+
+    # the outputs a resumed conversion keeps, see checkpoint.clear_output, the parts are in the checkpoint
+    RESUMED_OUTPUTS = []
+    # regions of a location have to nest, overlapping calls are cut into segments, see overlap.resolve_overlaps
+    SPLIT_OVERLAPS = True
+
+    def __init__(self, fp_out, timer_res, dispatch, coalesce_gap=None, aggregate_bin=None, write_jobs=1, checkpoint=None):
+        self.fp_out = fp_out
+        self.timer_res = timer_res
+        self.aggregate_bin = aggregate_bin
+        self.trace = trace = otf2.writer.Writer(fp_out, timer_resolution=timer_res)
+
+        root_node = trace.definitions.system_tree_node("root_node")
+        self.system_tree_node = trace.definitions.system_tree_node("dummy", parent=root_node)
+        posix_paradigm = trace.definitions.io_paradigm(identification="POSIX",
+                                                               name="POSIX",
+                                                               io_paradigm_class=otf2.IoParadigmClass.SERIAL,
+                                                               io_paradigm_flags=otf2.IoParadigmFlag.NONE)
+
+        isoc_paradigm = trace.definitions.io_paradigm(identification="ISOC",
+                                                               name="ISOC",
+                                                               io_paradigm_class=otf2.IoParadigmClass.SERIAL,
+                                                               io_paradigm_flags=otf2.IoParadigmFlag.NONE)
+
+        mpi_paradigm = trace.definitions.io_paradigm(identification="MPI",
+                                                       name="MPI",
+                                                       io_paradigm_class=otf2.IoParadigmClass.PARALLEL,
+                                                       io_paradigm_flags=otf2.IoParadigmFlag.NONE)
+
+        paradigms = {"POSIX": posix_paradigm, "ISOC": isoc_paradigm, "MPI": mpi_paradigm}
+
+        self.offset_attribute = trace.definitions.attribute("Offset", description='Absolute read/write offset within a file.', type=otf2.Type.UINT64)
+        if coalesce_gap is not None:
+            self.calls_attribute = trace.definitions.attribute("Calls", description='Number of I/O calls merged into this operation.', type=otf2.Type.UINT32)
+            self.bytes_attribute = trace.definitions.attribute("Bytes", description='Total bytes of the merged I/O calls.', type=otf2.Type.UINT64)
+        # files, handles, regions, location groups and locations are defined once a rank uses them, so a filtered
+        # conversion only contains the definitions it needs
+        self.definitions = DefinitionTables(trace, dispatch, paradigms, self.system_tree_node)
+
+        self.location_groups = {}
+        self.locations = {}
+        self.t_start = 0
+        self.closed = False
+        self.checkpoint = checkpoint
+        self.part_writers = None
+        if write_jobs > 1 or checkpoint is not None:
+            parts_path = os.path.join(fp_out, PARTS_DIR) if checkpoint is None else os.path.join(checkpoint.path, "parts")
+            self.part_writers = PartWriters(trace, self.locations, os.path.join(fp_out, "traces"), parts_path, timer_res,
+                                            write_jobs, done=None if checkpoint is None else self.parts_done,
+                                            keep_parts=checkpoint is not None)
+
+        if aggregate_bin is not None:
+            metric_members = [trace.definitions.metric_member(name, unit=unit, metric_mode=mode, value_type=value_type)
+                              for name, unit, mode, value_type in METRIC_MEMBERS]
+            self.metric_class = trace.definitions.metric_class(members=tuple(metric_members), occurrence=otf2.MetricOccurrence.ASYNCHRONOUS,
+                                                               recorder_kind=otf2.RecorderKind.ABSTRACT)
+        if checkpoint is not None:
+            self.resume()
+
+    def resume(self):
+        # the definitions in the order the interrupted conversion made them, then the parts of its finished ranks
+        for entry in self.checkpoint.definitions:
+            if not self.definitions.replay(entry):
+                _, rank_id, key, name, metric = entry
+                self.define_location(rank_id, key, name, metric)
+        for rank_id, state in self.checkpoint.done.items():
+            self.part_writers.adopt(state["part"], [(rank_id, key, count, first, last) for key, count, first, last in state["locations"]])
+
+    def parts_done(self, part_name, rank_ids, entries):
+        states = {rank_id: {"part": part_name, "locations": []} for rank_id in rank_ids}
+        for rank_id, key, count, first, last in entries:
+            states[rank_id]["locations"].append([key, count, first, last])
+        self.checkpoint.finish_ranks(self.definitions.log, states)
+
+    def location_group(self, rank_id):
+        group = self.location_groups.get(f"rank {rank_id}")
+        if group is None:
+            group = self.location_groups[f"rank {rank_id}"] = self.trace.definitions.location_group(f"rank {rank_id}", system_tree_parent=self.system_tree_node)
+        return group
+
+    def define_location(self, rank_id, key, name, metric=False):
+        # key is the tid of a thread or the name of a metric location. a resumed conversion finds the locations the
+        # interrupted one defined
+        location = self.locations.get((rank_id, key))
+        if location is None:
+            location = self.locations[(rank_id, key)] = self.trace.definitions.location(
+                name, type=otf2.LocationType.METRIC if metric else otf2.LocationType.CPU_THREAD, group=self.location_group(rank_id))
+            if metric:
+                self.trace.definitions.metric_class_recorder(self.metric_class, location)
+            self.definitions.log.append(["location", rank_id, key, name, metric])
+        return location
+
+    def write_metrics(self, rank_id, paths, binned):
+        # one metric location for all files of the rank and one per file
+        for path_index, first, last in binned.group_slices():
+            name = "all files" if path_index == ALL_FILES else paths[path_index]
+            location = self.define_location(rank_id, name, name, metric=True)
+            write = functools.partial(self.write_samples, binned=binned, first=first, last=last)
+            if self.part_writers is not None:
+                self.part_writers.submit(rank_id, name, write, last - first)
+            else:
+                write(self.trace.event_writer_from_location(location))
+        if self.part_writers is not None:
+            self.part_writers.end_rank(rank_id)
+
+    def write_samples(self, writer, binned, first, last):
+        # a sample per bin with calls and one more at the start of a bin after idle bins, so the rates drop to zero
+        # in between. returns the number of samples and their first and last timestamp like write_events
+        metric_class, aggregate_bin, timer_res = self.metric_class, self.aggregate_bin, self.timer_res
+        bins = binned.bins[first:last]
+        bin_starts = (np.ceil(bins * aggregate_bin * timer_res).astype(np.int64) - self.t_start).tolist()
+        bin_ends = (np.ceil((bins + 1) * aggregate_bin * timer_res).astype(np.int64) - self.t_start).tolist()
+        values = binned.values[first:last]
+        before = np.maximum(values - binned.deltas[first:last], 0).tolist()
+        idle_before = binned.idle_before[first:last].tolist()
+        for k, values_k in enumerate(values.tolist()):
+            if idle_before[k]:
+                writer.metric(bin_starts[k], metric_class, before[k])
+            writer.metric(bin_ends[k], metric_class, values_k)
+        count = len(values) + sum(idle_before)
+        METRICS.count("metric_samples", count)
+        if count == 0:
+            return 0, None, None
+        return count, bin_starts[0] if idle_before[0] else bin_ends[0], bin_ends[-1]
+
+    def define_threads(self, rank_id, first_starts):
+        # defines a location per thread of the rank, first_starts maps the tids to their first start and the thread
+        # that issued the first call is the master thread
+        master_tid = min(first_starts, key=first_starts.get, default=None)
+        for tid in first_starts:
+            self.define_location(rank_id, tid, "Master Thread" if tid == master_tid else f"Thread {tid}")
+
+    def start_locations(self, rank_id, first_starts):
+        # for a rank whose events are appended in consecutive parts sorted by start
+        self.define_threads(rank_id, first_starts)
+        if self.part_writers is not None:
+            self.part_writers.open_part(rank_id)
+
+    def append_events(self, rank_id, tid, table):
+        if self.part_writers is not None:
+            self.part_writers.append(tid, functools.partial(self.write_events, table=table))
+        else:
+            self.write_events(self.trace.event_writer_from_location(self.locations[(rank_id, tid)]), table)
+
+    def end_locations(self, rank_id):
+        if self.part_writers is not None:
+            self.part_writers.close_part()
+
+    def write_locations(self, rank_id, threads):
+        # threads maps the tids of a rank to their tables sorted by start
+        self.define_threads(rank_id, {tid: table.start[0] for tid, table in threads.items()})
+        for tid, table in threads.items():
+            if self.part_writers is not None:
+                self.part_writers.submit(rank_id, tid, functools.partial(self.write_events, table=table), len(table))
+            else:
+                self.write_events(self.trace.event_writer_from_location(self.locations[(rank_id, tid)]), table)
+        if self.part_writers is not None:
+            self.part_writers.end_rank(rank_id)
+
+    def write_events(self, writer, table):
+        # the columns are turned into python lists, a chunk at a time. returns the number of otf2 events written and
+        # their first and last timestamp, None for an empty table
+        if len(table) > WRITE_CHUNK:
+            written = [self.write_events(writer, table.take(slice(first, first + WRITE_CHUNK)))
+                       for first in range(0, len(table), WRITE_CHUNK)]
+            return sum(count for count, _, _ in written), written[0][1], max(last for _, _, last in written)
+        if len(table) == 0:
+            return 0, None, None
+        regions = self.definitions.regions
+        io_handles = self.definitions.handles
+        offset_attribute = self.offset_attribute
+        start_ticks = table.start_ticks(self.timer_res) - self.t_start
+        end_ticks = table.end_ticks(self.timer_res) - self.t_start
+        start_times, end_times = start_ticks.tolist(), end_ticks.tolist()
+        func_ids, kinds, levels, handle_ids, sizes, offsets, chunks, modes, whences, creations, statuses = (
+            table.columns[name].tolist() for name in ("func_id", "kind", "level", "io_handle", "size", "offset",
+                                                      "num_chunks", "mode", "whence", "creation", "status"))
+        calls = table.columns["calls"].tolist() if "calls" in table.columns else None
+
+        for i in range(len(table)):
+            region = regions[func_ids[i]]
+            kind = kinds[i]
+            start_time = start_times[i]
+            end_time = end_times[i]
+
+            writer.enter(start_time, region)
+
+            if handle_ids[i] == NO_HANDLE:
+                pass
+
+            elif kind == Events.KIND_IO:
+                atr = None if offsets[i] == NO_OFFSET else {offset_attribute: offsets[i]}
+                if calls is not None and calls[i] > 1:
+                    atr = {} if atr is None else atr
+                    atr[self.calls_attribute] = calls[i]
+                    atr[self.bytes_attribute] = sizes[i]
+                handle = io_handles[handle_ids[i]]
+
+                num_chunks = chunks[i]
+                if num_chunks == 1:
+                    writer.io_operation_begin(time=start_time,
+                                              handle=handle,
+                                              mode=otf2.IoOperationMode(modes[i]),
+                                              operation_flags=otf2.IoOperationFlag.NONE,
+                                              bytes_request=sizes[i],
+                                              matching_id=levels[i],
+                                              attributes=atr
+                                              )
+                    writer.io_operation_complete(time=end_time, handle=handle, bytes_result=sizes[i], matching_id=levels[i])
+                else:
+                    chunk_sizes = util.split_evenly(sizes[i], num_chunks)
+                    for j, size in enumerate(chunk_sizes):
+                        writer.io_operation_begin(time=start_time,
+                                                  handle=handle,
+                                                  mode=otf2.IoOperationMode(modes[i]),
+                                                  operation_flags=otf2.IoOperationFlag.NONE,
+                                                  bytes_request=size,
+                                                  matching_id=levels[i] + j,
+                                                  attributes=atr
+                                                  )
+
+                    for j, size in enumerate(reversed(chunk_sizes)):
+                        writer.io_operation_complete(time=end_time,
+                                                     handle=handle,
+                                                     bytes_result=size,
+                                                     matching_id=levels[i] + (num_chunks - (j + 1))
+                                                     )
+
+            elif kind == Events.KIND_SEEK:
+                writer.io_seek(time=start_time,
+                               handle=io_handles[handle_ids[i]],
+                               offset_request=offsets[i],
+                               # IoSeekOption ?
+                               whence=otf2.IoSeekOption(whences[i]),
+                               offset_result=offsets[i])
+
+            elif kind == Events.KIND_CREATE_HANDLE and modes[i] != NO_VALUE:
+                writer.io_create_handle(time=start_time,
+                                        handle=io_handles[handle_ids[i]],
+                                        mode=otf2.IoAccessMode(modes[i]),
+                                        # we take only the first flag for both because the python bindings limitations
+                                        creation_flags=otf2.IoCreationFlag(creations[i]),
+                                        status_flags=otf2.IoStatusFlag(statuses[i]))
+
+            elif kind == Events.KIND_DESTROY_HANDLE:
+                writer.io_destroy_handle(time=start_time, handle=io_handles[handle_ids[i]])
+
+            writer.leave(end_time, region)
+
+        # counted per table, the loop above stays free of bookkeeping. an enter and a leave per call, a begin and
+        # a complete per chunk of an I/O operation and one event per seek, handle creation and destruction
+        has_path = table.io_handle != NO_HANDLE
+        io_operations = int(table.num_chunks[has_path & (table.kind == Events.KIND_IO)].sum())
+        io_seeks = int(np.count_nonzero(has_path & (table.kind == Events.KIND_SEEK)))
+        io_handle_creates = int(np.count_nonzero(has_path & (table.kind == Events.KIND_CREATE_HANDLE) & (table.mode != NO_VALUE)))
+        io_handle_destroys = int(np.count_nonzero(has_path & (table.kind == Events.KIND_DESTROY_HANDLE)))
+        METRICS.count("events_written", len(table))
+        METRICS.count("io_operations", io_operations)
+        METRICS.count("io_seeks", io_seeks)
+        METRICS.count("io_handle_creates", io_handle_creates)
+        METRICS.count("io_handle_destroys", io_handle_destroys)
+        count = 2 * (len(table) + io_operations) + io_seeks + io_handle_creates + io_handle_destroys
+        return count, int(start_ticks[0]), int(end_ticks.max())
+
+    def abort(self):
+        # a failed conversion leaves no archive, only the parts a checkpoint keeps
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.part_writers is not None:
+                self.part_writers.abort()
+        finally:
+            self.trace.close()
+            remove_entries(self.fp_out, ["traces", "traces.otf2", "traces.def"])
+
+    def close(self):
+        # the global definitions are written when the archive is closed, closing twice does nothing
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            # the event counts of the locations written by workers are only known once they are done
+            if self.part_writers is not None:
+                self.part_writers.wait()
+        finally:
+            METRICS.count("files_defined", len(self.definitions.files))
+            METRICS.count("handles_defined", len(self.definitions.handles))
+            METRICS.count("regions_defined", sum(region is not None for region in self.definitions.regions))
+            METRICS.count("locations_defined", len(self.locations))
+            self.trace.close()
+        if self.part_writers is not None:
+            self.part_writers.move_to_archive()
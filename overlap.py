@@ -0,0 +1,82 @@
+import numpy as np
+
+import Events
+
+
+def resolve_overlaps(table, use_levels=True):
+    # flattens nested calls of one event stream into consecutive segments, a parent is cut where a child starts and
+    # resumes where the child ends, e.g. MPI_File_write_all | pwrite | lseek | pwrite | MPI_File_write_all.
+    # the table has to hold a single stream sorted by start time. with use_levels the recorder call depth decides
+    # whether an event is nested into the open one, otherwise every overlap is treated as nesting.
+    # empty segments, e.g. of a parent that starts together with its child, are dropped, and only the first segment
+    # with a length keeps the event's I/O record, the others are plain regions. an event without any such segment
+    # keeps one empty segment, so no call is lost.
+    starts = table.start.tolist()
+    ends = table.end.tolist()
+    levels = table.level.tolist()
+
+    index = []
+    new_starts = []
+    new_ends = []
+    first = []
+    changed = False
+
+    # open events as [row, end, level, segment start, first segment still pending]
+    stack = []
+
+    def emit(entry, end, last=False):
+        if end < entry[3] or (end == entry[3] and not (last and entry[4])):
+            return
+        index.append(entry[0])
+        new_starts.append(entry[3])
+        new_ends.append(end)
+        first.append(entry[4])
+        entry[4] = False
+
+    for i in range(len(starts) + 1):
+        if i < len(starts):
+            start, end, level = starts[i], ends[i], levels[i]
+        else:
+            start, end, level = float("inf"), float("inf"), -1
+
+        while stack:
+            top = stack[-1]
+            if top[1] > start and not (use_levels and top[2] >= level):
+                break
+            stack.pop()
+            if top[1] > start or not top[4]:
+                changed = True
+            emit(top, min(top[1], start), last=True)
+            if stack:
+                stack[-1][3] = min(top[1], start)
+
+        if i == len(starts):
+            break
+
+        if stack:
+            # the open event is the parent of this one
+            changed = True
+            emit(stack[-1], start)
+
+        stack.append([i, end, level, start, True])
+
+    if not changed:
+        return table
+
+    resolved = table.take(np.array(index, dtype=np.int64))
+    resolved.columns["start"] = np.array(new_starts, dtype=np.float64)
+    resolved.columns["end"] = np.array(new_ends, dtype=np.float64)
+    resolved.columns["kind"][~np.array(first, dtype=bool)] = Events.KIND_EVENT
+    return resolved
+
+
+def resolve_rank_overlaps(table, by_thread=True):
+    # with by_thread every thread of the rank is resolved on its own stack, otherwise all threads share one
+    # stream, which is needed as long as they end up on the same location
+    if not by_thread:
+        return resolve_overlaps(table.sort(), use_levels=False)
+
+    parts = table.split_by("tid")
+    if len(parts) == 1:
+        return resolve_overlaps(table.sort())
+    return table.concat(resolve_overlaps(part.sort()) for part in parts.values())
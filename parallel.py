@@ -0,0 +1,65 @@
+import collections
+import multiprocessing
+
+from memory_budget import MAX_AHEAD_PER_JOB
+from metrics import METRICS
+
+# the decode function is inherited by the forked workers, it references the reader whose records live in memory
+# allocated by the recorder library and cannot be pickled
+_decode = None
+
+
+def _decode_rank(rank_id):
+    # the metrics of the rank travel back with it
+    METRICS.clear()
+    result = _decode(rank_id)
+    return rank_id, result, METRICS.state()
+
+
+def decode_ranks(decode, rank_ids, jobs=1, in_workers=False, budget=None, rank_events=None):
+    # yields (rank_id, decode(rank_id)) in the order of rank_ids, with jobs > 1 or in_workers the ranks are decoded
+    # by a process pool and sent back as pickled event tables. with a memory_budget.MemoryBudget a rank is only
+    # started once the budget admits rank_events(rank_id) events, the consumer releases it when the rank is written
+    global _decode
+
+    if jobs <= 1 and not in_workers:
+        for rank_id in rank_ids:
+            if budget is not None:
+                budget.wait_admit(rank_id, rank_events(rank_id))
+            yield rank_id, decode(rank_id)
+        return
+
+    _decode = decode
+    jobs = max(jobs, 1)
+    # only a few ranks per worker are in flight so that finished batches cannot pile up in the writer, with a
+    # budget as many as it allows
+    ahead = 2 * jobs if budget is None else MAX_AHEAD_PER_JOB * jobs
+    try:
+        with multiprocessing.get_context("fork").Pool(jobs) as pool:
+            rank_ids = collections.deque(rank_ids)
+            pending = collections.deque()
+
+            def start_ranks(wait):
+                while rank_ids and len(pending) < ahead:
+                    if budget is not None:
+                        # with nothing pending all ranks in flight were handed to the consumer, which releases them
+                        # once they are written. it only may be waited for while it is not blocked on this generator
+                        if wait and not pending:
+                            budget.wait_admit(rank_ids[0], rank_events(rank_ids[0]))
+                        elif not budget.admit(rank_ids[0], rank_events(rank_ids[0])):
+                            return
+                    pending.append(pool.apply_async(_decode_rank, (rank_ids.popleft(),)))
+
+            def finish_rank():
+                rank_id, result, state = pending.popleft().get()
+                METRICS.merge(state)
+                start_ranks(wait=False)
+                return rank_id, result
+
+            start_ranks(wait=True)
+            while pending:
+                # the result is not kept here, the consumer may release it while the next ranks are decoded
+                yield finish_rank()
+                start_ranks(wait=True)
+    finally:
+        _decode = None
@@ -0,0 +1,235 @@
+import multiprocessing
+import os
+import shutil
+import traceback
+
+import otf2
+
+from metrics import METRICS
+
+# otf2 keeps one event file and one local definition file per location in the archive directory, named by the
+# location id. the events of a few ranks are written into a part, an archive of its own below PARTS_DIR (or the
+# checkpoint), with the ids the main archive defined, and the files are moved into the main archive after it is
+# closed, closing it writes empty files for all locations it has no event writer for. only the global definitions
+# are written by the main archive.
+PARTS_DIR = "traces.parts"
+
+# ranks are written once they have this many events together, so small ranks share a part
+PART_EVENTS = 1 << 18
+
+# the python bindings have no public way to name the files of a location or to set the event count of a location
+# and the time span of the trace when another archive wrote the events. the few internals used for that are
+# those of the bindings 3.x, checked once here
+BINDINGS_SUPPORTED = getattr(otf2, "__version__", "").split(".")[0] == "3" \
+    and "_number_of_events_written" in getattr(otf2.definitions.Location, "__slots__", ()) \
+    and hasattr(otf2.definitions.Location, "_ref") and hasattr(otf2.writer.Writer, "_update_timestamps")
+
+
+def location_files(location):
+    # the event file and the local definition file of a location in its archive directory
+    return [f"{location._ref}.{extension}" for extension in ("evt", "def")]
+
+
+def adopt_events(trace, location, count, first, last):
+    # count, first and last are what write_events returned for the location, the main archive writes them with
+    # the global definitions
+    location._number_of_events_written = count
+    if count:
+        trace._update_timestamps(first)
+        trace._update_timestamps(last)
+
+
+def write_part(part_path, timer_res, locations):
+    # locations is a list of (location, write), write(event_writer) writes the events of the location and returns
+    # what Otf2Backend.write_events returns. the part has definitions of its own, the events only use the ids of
+    # the main archive's definitions
+    with METRICS.stage("write_part"):
+        shutil.rmtree(part_path, ignore_errors=True)
+        part = otf2.writer.Writer(part_path, timer_resolution=timer_res)
+        written = [write(part.event_writer_from_location(location)) for location, write in locations]
+        part.close()
+    return written
+
+
+def fork_worker(target, *args):
+    # runs target(*args) in a forked process, the tables and definitions are the ones of this process at the fork,
+    # nothing is pickled on the way in. returns the (process, receiver) that receive_worker takes
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_worker, args=(target, args, sender))
+    process.start()
+    sender.close()
+    return process, receiver
+
+
+def _run_worker(target, args, sender):
+    # the result travels back with the metrics of the worker or the traceback of its failure
+    METRICS.clear()
+    try:
+        result = target(*args)
+        sender.send((result, METRICS.state(), None))
+    except BaseException:
+        sender.send((None, None, traceback.format_exc()))
+
+
+def receive_worker(process, receiver, what):
+    # waits for a worker of fork_worker and returns what target returned, what names its work in errors
+    try:
+        result, state, error = receiver.recv()
+    except EOFError:
+        process.join()
+        raise RuntimeError(f"a worker writing {what} died with exit code {process.exitcode}")
+    process.join()
+    if error is not None:
+        raise RuntimeError(f"a worker writing {what} failed:\n{error}")
+    METRICS.merge(state)
+    return result
+
+
+def combine(written, more):
+    # the events of a location written in several pieces
+    if written is None or not written[0]:
+        return more
+    if not more[0]:
+        return written
+    return written[0] + more[0], min(written[1], more[1]), max(written[2], more[2])
+
+
+class PartWriters:
+    # writes the event files of whole ranks into archives of their own below parts_path, at most jobs at a time in
+    # forked worker processes or one after the other in this process. a worker is forked when its ranks are handed
+    # over, so it sees the definitions made up to then without pickling anything. ranks that come in chunks are
+    # written to a part of their own in this process. done(part name, rank ids, entries) is called once the files
+    # of a part are complete, entries are (rank id, location key, event count, first, last timestamp).
+
+    def __init__(self, trace, locations, archive_path, parts_path, timer_res, jobs, done=None, keep_parts=False):
+        # locations maps (rank id, key) to the locations of the main archive. with keep_parts the parts outlive a
+        # failed conversion, for a checkpoint
+        if not BINDINGS_SUPPORTED:
+            raise RuntimeError(f"--write-jobs and --resume need the otf2 python bindings 3.x, found {getattr(otf2, '__version__', 'unknown')}")
+        self.trace = trace
+        self.locations = locations
+        self.archive_path = archive_path
+        self.parts_path = parts_path
+        self.timer_res = timer_res
+        self.jobs = jobs
+        self.done = done
+        self.keep_parts = keep_parts
+        self.pending = []
+        self.pending_ranks = []
+        self.pending_events = 0
+        self.running = []
+        self.stream = None
+        self.finished = []
+        os.makedirs(self.parts_path, exist_ok=True)
+
+    def submit(self, rank_id, key, write, events):
+        # the rank's part is started by end_rank
+        self.pending.append((rank_id, key, write))
+        self.pending_events += events
+
+    def end_rank(self, rank_id):
+        # parts hold whole ranks, small ranks share one. with keep_parts every rank is a part of its own, so it is
+        # done for a checkpoint once it is written, not only once enough ranks came together
+        self.pending_ranks.append(rank_id)
+        if self.pending_events >= PART_EVENTS or self.keep_parts:
+            self.start_part()
+
+    def start_part(self):
+        if not self.pending_ranks:
+            return
+        pending, rank_ids = self.pending, self.pending_ranks
+        self.pending, self.pending_ranks, self.pending_events = [], [], 0
+        part_path = os.path.join(self.parts_path, f"rank-{rank_ids[0]}")
+        locations = [(self.locations[(rank_id, key)], write) for rank_id, key, write in pending]
+        keys = [(rank_id, key) for rank_id, key, _ in pending]
+        if self.jobs <= 1:
+            self.finish(part_path, rank_ids, keys, write_part(part_path, self.timer_res, locations))
+            return
+
+        while len(self.running) >= self.jobs:
+            self.finish_part(self.running.pop(0))
+        process, receiver = fork_worker(write_part, part_path, self.timer_res, locations)
+        # the worker has its own copy of the tables now
+        self.running.append((process, receiver, part_path, rank_ids, keys))
+
+    def finish_part(self, part):
+        process, receiver, part_path, rank_ids, keys = part
+        self.finish(part_path, rank_ids, keys, receive_worker(process, receiver, "otf2 events"))
+
+    def open_part(self, rank_id):
+        # the part of a rank whose events come in chunks, see append
+        part_path = os.path.join(self.parts_path, f"rank-{rank_id}")
+        shutil.rmtree(part_path, ignore_errors=True)
+        self.stream = (rank_id, part_path, otf2.writer.Writer(part_path, timer_resolution=self.timer_res), {})
+
+    def append(self, key, write):
+        rank_id, _, part, written = self.stream
+        location = self.locations[(rank_id, key)]
+        with METRICS.stage("write_part"):
+            written[key] = combine(written.get(key), write(part.event_writer_from_location(location)))
+
+    def close_part(self):
+        rank_id, part_path, part, written = self.stream
+        self.stream = None
+        with METRICS.stage("write_part"):
+            part.close()
+        self.finish(part_path, [rank_id], [(rank_id, key) for key in written], list(written.values()))
+
+    def finish(self, part_path, rank_ids, keys, written):
+        # the event counts and the time span of the trace are part of the global definitions, the otf2 writer
+        # keeps them for the event writers it opened itself
+        entries = [(rank_id, key, count, first, last) for (rank_id, key), (count, first, last) in zip(keys, written)]
+        self.adopt(os.path.basename(part_path), entries)
+        if self.done is not None:
+            self.done(os.path.basename(part_path), rank_ids, entries)
+
+    def adopt(self, part_name, entries):
+        # also takes the parts of ranks that an interrupted conversion finished, their files are moved with the rest
+        locations = []
+        for rank_id, key, count, first, last in entries:
+            location = self.locations[(rank_id, key)]
+            adopt_events(self.trace, location, count, first, last)
+            locations.append(location)
+        self.finished.append((os.path.join(self.parts_path, part_name), locations))
+
+    def wait(self):
+        # writes the remaining ranks and waits for all workers, before the main archive is closed
+        try:
+            self.start_part()
+            while self.running:
+                self.finish_part(self.running.pop(0))
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        # after a failure, the parts the running workers finish still count for a checkpoint. the writers are closed
+        # here, the python bindings would close them whenever they are collected, maybe over a later conversion
+        if self.stream is not None:
+            self.stream[2].close()
+            self.stream = None
+        try:
+            while self.running:
+                self.finish_part(self.running.pop(0))
+        finally:
+            for process, *_ in self.running:
+                process.join()
+            self.running = []
+            if not self.keep_parts:
+                shutil.rmtree(self.parts_path, ignore_errors=True)
+
+    def move_to_archive(self):
+        # after the main archive is closed. the parts are only removed once all their files are in the archive
+        moves = [(os.path.join(part_path, "traces", name), os.path.join(self.archive_path, name))
+                 for part_path, locations in self.finished for location in locations for name in location_files(location)]
+        missing = [source for source, _ in moves if not os.path.isfile(source)]
+        if missing:
+            raise RuntimeError(f"{len(missing)} event files are missing from {self.parts_path}, e.g. {missing[0]}")
+        for source, target in moves:
+            os.replace(source, target)
+        missing = [target for _, target in moves if not os.path.isfile(target)]
+        if missing:
+            raise RuntimeError(f"{len(missing)} event files did not arrive in {self.archive_path}, e.g. {missing[0]}")
+        self.finished = []
+        shutil.rmtree(self.parts_path)
@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import Events
+from aggregate import ALL_FILES, METRIC_MEMBERS
+from definition_tables import DefinitionTables
+from event_table import NO_HANDLE, NO_OFFSET, NO_VALUE
+from metrics import METRICS
+
+KIND_NAMES = ["event", "create_handle", "destroy_handle", "io", "seek"]
+
+
+def dictionary(indices, values, mask=None):
+    # function names, paths, paradigms and kinds are stored once per column chunk and referenced by index
+    return pa.DictionaryArray.from_arrays(pa.array(indices, mask=mask), pa.array(values, type=pa.string()))
+
+
+def nullable(column, missing):
+    return pa.array(column, mask=column == missing)
+
+
+class ParquetBackend:
+    # writes the converted ranks as parquet files for pandas, polars, duckdb or spark instead of an otf2 archive:
+    #   events/rank=<rank>/part-0.parquet   one row per call, nested calls included, one row group per thread,
+    #                                       sorted by start
+    #   metrics/rank=<rank>/part-0.parquet  with aggregation, one row per rank or file and bin
+    #   files.parquet, handles.parquet      the files and handles the handle column of the events refers to
+    # the rank directories are hive partitions, so readers filtering on rank only open the files they need. times
+    # are seconds, mode, whence, creation and status keep the otf2 enum values. with a checkpoint the files of the
+    # finished ranks are kept, a resumed conversion only writes the missing ranks and the files and handles again.
+
+    # the outputs a resumed conversion keeps, see checkpoint.clear_output
+    RESUMED_OUTPUTS = ["events", "metrics"]
+    # a row is a whole call, a call nested into another one is not cut out of it. the bins of aggregate are
+    # counted from the segments like for otf2
+    SPLIT_OVERLAPS = False
+
+    def __init__(self, fp_out, timer_res, dispatch, coalesce_gap=None, aggregate_bin=None, write_jobs=1, checkpoint=None):
+        # a rank is one parquet file written by this process, write_jobs only applies to otf2
+        self.fp_out = fp_out
+        self.aggregate_bin = aggregate_bin
+        self.coalesce = coalesce_gap is not None
+        self.events_writer = None
+        self.definitions = DefinitionTables(None, dispatch, None, None)
+        self.checkpoint = checkpoint
+        self.closed = False
+        os.makedirs(fp_out, exist_ok=True)
+        if checkpoint is not None:
+            for entry in checkpoint.definitions:
+                self.definitions.replay(entry)
+
+    def rank_done(self, rank_id):
+        if self.checkpoint is not None:
+            self.checkpoint.finish_ranks(self.definitions.log, {rank_id: {}})
+
+    def rank_path(self, name, rank_id):
+        path = os.path.join(self.fp_out, name, f"rank={rank_id}")
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, "part-0.parquet")
+
+    def write_metrics(self, rank_id, paths, binned):
+        # the counters of every bin on their own instead of accumulated, open files at the end of the bin
+        if len(binned.groups) == 0:
+            self.rank_done(rank_id)
+            return
+        has_path = binned.groups != ALL_FILES
+        columns = {
+            "path": dictionary(np.where(has_path, binned.groups, 0).astype(np.int32), paths, mask=~has_path),
+            "bin": pa.array(binned.bins),
+            "start": pa.array(binned.bins * self.aggregate_bin),
+            "end": pa.array((binned.bins + 1) * self.aggregate_bin),
+        }
+        for k, (name, *_) in enumerate(METRIC_MEMBERS):
+            values = binned.values[:, k] if k == len(METRIC_MEMBERS) - 1 else binned.deltas[:, k]
+            columns[name.replace(" ", "_")] = pa.array(values)
+        pq.write_table(pa.table(columns), self.rank_path("metrics", rank_id))
+        METRICS.count("metric_samples", len(binned.groups))
+        self.rank_done(rank_id)
+
+    def start_locations(self, rank_id, first_starts):
+        self.events_writer = None
+
+    def append_events(self, rank_id, tid, table):
+        # a row group per call, the file of the rank is opened with the first one
+        batch = self.record_batch(table)
+        if self.events_writer is None:
+            self.events_writer = pq.ParquetWriter(self.rank_path("events", rank_id), batch.schema)
+        self.events_writer.write_batch(batch, row_group_size=len(table))
+        METRICS.count("events_written", len(table))
+
+    def end_locations(self, rank_id):
+        self.close_events()
+        self.rank_done(rank_id)
+
+    def close_events(self):
+        if self.events_writer is not None:
+            self.events_writer.close()
+            self.events_writer = None
+
+    def write_locations(self, rank_id, threads):
+        self.start_locations(rank_id, {tid: table.start[0] for tid, table in threads.items()})
+        try:
+            for tid, table in threads.items():
+                self.append_events(rank_id, tid, table)
+        finally:
+            self.close_events()
+        self.end_locations(rank_id)
+
+    def record_batch(self, table):
+        has_path = table.handle != NO_HANDLE
+        columns = {
+            "tid": pa.array(table.tid),
+            "function": dictionary(table.func_id, table.func_names),
+            "paradigm": dictionary(table.paradigm, [paradigm or "" for paradigm in Events.PARADIGMS], mask=table.paradigm == 0),
+            "kind": dictionary(table.kind, KIND_NAMES),
+            "level": pa.array(table.level),
+            "start": pa.array(table.start),
+            "end": pa.array(table.end),
+            "handle": nullable(table.io_handle, NO_HANDLE),
+            "path": dictionary(np.where(has_path, table.handle, 0), table.paths, mask=~has_path),
+            "size": pa.array(table.size),
+            "offset": nullable(table.offset, NO_OFFSET),
+            "num_chunks": pa.array(table.num_chunks),
+            "mode": nullable(table.mode, NO_VALUE),
+            "whence": nullable(table.whence, NO_VALUE),
+            "creation": pa.array(table.creation),
+            "status": pa.array(table.status),
+        }
+        # every row group of a file needs the same columns, tables without merged calls get a count of one
+        if self.coalesce:
+            columns["calls"] = pa.array(table.calls if "calls" in table.columns else np.ones(len(table), dtype=np.int32))
+        return pa.record_batch(columns)
+
+    def abort(self):
+        # a failed conversion keeps the files of the finished ranks for a checkpoint
+        self.closed = True
+        self.close_events()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        definitions = self.definitions
+        pq.write_table(pa.table({"file_id": pa.array(np.arange(len(definitions.files), dtype=np.int32)),
+                                 "path": pa.array(definitions.files, type=pa.string())}),
+                       os.path.join(self.fp_out, "files.parquet"))
+        # the handles are (rank, file id, paradigm id, slot)
+        rank_ids, file_ids, paradigm_ids, slots = np.array(definitions.handles, dtype=np.int32).reshape(-1, 4).T.copy()
+        pq.write_table(pa.table({"handle_id": pa.array(np.arange(len(definitions.handles), dtype=np.int32)),
+                                 "rank": pa.array(rank_ids), "file_id": pa.array(file_ids),
+                                 "paradigm": dictionary(paradigm_ids, [paradigm or "" for paradigm in Events.PARADIGMS], mask=paradigm_ids == 0),
+                                 "slot": pa.array(slots)}),
+                       os.path.join(self.fp_out, "handles.parquet"))
+        METRICS.count("files_defined", len(definitions.files))
+        METRICS.count("handles_defined", len(definitions.handles))
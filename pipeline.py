@@ -0,0 +1,50 @@
+import queue
+import threading
+
+from metrics import METRICS
+
+# put into the queue after the last item
+_DONE = object()
+
+
+def run_pipelined(items, consume, depth):
+    # calls consume(*item) for every item in a writer thread while the calling thread keeps producing items. at most
+    # depth items wait in the queue, a slow writer blocks the producer instead of letting items pile up in memory.
+    # consume is only ever called from the writer thread, in the order of items
+    pending = queue.Queue(maxsize=max(depth, 1))
+    failure = []
+
+    def drain():
+        while True:
+            with METRICS.stage("wait_decode"):
+                item = pending.get()
+            if item is _DONE:
+                return
+            # after a failure the queue is still emptied so the producer cannot block on it
+            if failure:
+                continue
+            try:
+                consume(*item)
+            except BaseException as e:
+                failure.append(e)
+            # the written item is released while the next one is waited for
+            del item
+
+    writer = None
+    try:
+        for item in items:
+            # the thread starts with the first item, after the decode pool has forked its workers
+            if writer is None:
+                writer = threading.Thread(target=drain, name="writer", daemon=True)
+                writer.start()
+            if failure:
+                break
+            with METRICS.stage("wait_write"):
+                pending.put(item)
+            del item
+    finally:
+        if writer is not None:
+            pending.put(_DONE)
+            writer.join()
+    if failure:
+        raise failure[0]
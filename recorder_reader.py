@@ -0,0 +1,313 @@
+import os
+import struct
+
+import numpy as np
+
+# reads recorder traces written as one call signature table, grammar and timestamp file per rank (the format of
+# recorder 2.2, read by recorder_viz up to 0.4), without recorder_viz and its C library:
+#   recorder.mt  metadata (total_ranks, start_ts, time_resolution, ...) followed by the function names, one per line
+#   <rank>.cst   the distinct calls of the rank: thread, function, level and arguments
+#   <rank>.cfg   a grammar whose start rule expands to the sequence of the rank's calls as cst indices
+#   <rank>.ts    two uint32 per call, start and end in time_resolution units after the previous call's start
+# only recorder.mt is read when the trace is opened. a rank's cst and cfg are small, they grow with the number of
+# distinct calls, while its timestamps are memory mapped and its calls are expanded from the grammar in batches.
+# the layout follows the recorder 2.2 sources, not a trace captured from a recorder build, the tests read traces
+# written by synthetic.write_recorder_trace:
+#   include/recorder-logger.h   RecorderMetadata (METADATA) and the key of a call signature (KEY_HEADER)
+#   lib/recorder-logger.c       recorder.mt, the metadata struct followed by the function names
+#   lib/recorder-cst-cfg.c      the cst, the entry count, then per entry its terminal id, key length and key; the
+#                               cfg, the rule count, then per rule its id, symbol count and (value, exponent) pairs
+#   lib/recorder-timestamps.c   the two uint32 deltas of every call
+
+# int total_ranks, double start_ts, double time_resolution, int ts_buffer_elements, int ts_compression_algo and,
+# in later versions, int interprocess_compression
+METADATA = struct.Struct("i4xddii")
+METADATA_SIZE = 32
+METADATA_SIZE_INTERPROCESS = 40
+
+BATCH_SIZE = 1 << 16
+
+# terminals of the expanded short rules a grammar keeps, 16 MB
+EXPANDED_TERMINALS = 1 << 22
+
+# the parsed cst and cfg of this many ranks are kept, a rank needs them for its record count and its decoding
+PARSED_RANKS = 4
+
+START_RULE = -1
+
+# key of a call signature: pthread_t tid, unsigned char func_id, level and arg_count, int length of the arguments,
+# then the arguments, each followed by a space
+KEY_HEADER = struct.Struct("<qBBBi")
+
+
+def is_native_trace(fp):
+    # traces of later recorder versions share one cst and cfg between ranks or compress the timestamps, they are
+    # left to recorder_viz
+    try:
+        metadata = read_metadata(fp)
+    except (OSError, struct.error):
+        return False
+    _, _, ts_compression, interprocess, _ = metadata
+    return ts_compression == 0 and interprocess == 0 and all(
+        os.path.isfile(os.path.join(fp, f"0.{extension}")) for extension in ("cst", "cfg", "ts"))
+
+
+def read_metadata(fp):
+    # returns (total_ranks, time_resolution, ts_compression_algo, interprocess_compression, size of the header)
+    with open(os.path.join(fp, "recorder.mt"), "rb") as f:
+        header = f.read(METADATA_SIZE_INTERPROCESS + 1)
+    total_ranks, _, time_resolution, _, ts_compression = METADATA.unpack_from(header)
+    # the function names start right after the header, the longer header ends with the interprocess flag
+    if header[METADATA_SIZE:METADATA_SIZE + 1].isalpha():
+        return total_ranks, time_resolution, ts_compression, 0, METADATA_SIZE
+    interprocess, = struct.unpack_from("i", header, METADATA_SIZE)
+    return total_ranks, time_resolution, ts_compression, interprocess, METADATA_SIZE_INTERPROCESS
+
+
+class TraceMetadata:
+
+    def __init__(self, total_ranks, time_resolution):
+        self.total_ranks = total_ranks
+        self.time_resolution = time_resolution
+
+
+class Signatures:
+    # the distinct calls of a rank as arrays indexed by cst position and the undecoded arguments as bytes
+
+    def __init__(self, tids, func_ids, levels, args):
+        self.tids = tids
+        self.func_ids = func_ids
+        self.levels = levels
+        self.args = args
+
+    def __len__(self):
+        return len(self.args)
+
+
+class Grammar:
+    # the cfg of a rank. rules expand to terminals (cst indices, >= 0) and other rules (< 0), every symbol with an
+    # exponent. the expansion is produced in pieces, rules short enough to fit a batch are expanded once and tiled.
+    # rules are walked with explicit stacks, a grammar may nest rules deeper than the interpreter's recursion limit
+
+    def __init__(self, rules, batch_size=BATCH_SIZE):
+        self.rules = rules
+        self.batch_size = batch_size
+        self.lengths = {}
+        # the oldest expansions are dropped once they hold more than EXPANDED_TERMINALS
+        self.expansions = {}
+        self.expanded = 0
+
+    def length(self, rule_id):
+        stack = [rule_id]
+        while stack:
+            current = stack[-1]
+            if current in self.lengths:
+                stack.pop()
+                continue
+            values, exponents = self.rules[current]
+            terminals = values >= 0
+            missing = [value for value in set(values[~terminals].tolist()) if value not in self.lengths]
+            if missing:
+                stack.extend(missing)
+                continue
+            self.lengths[current] = int(exponents[terminals].sum()) + sum(
+                exponent * self.lengths[value] for value, exponent in zip(values[~terminals].tolist(), exponents[~terminals].tolist()))
+            stack.pop()
+        return self.lengths[rule_id]
+
+    def expansion(self, rule_id):
+        # only rules of at most batch_size terminals are expanded, the rules they refer to are expanded first
+        stack = [(rule_id, False)]
+        while stack:
+            current, ready = stack.pop()
+            if current in self.expansions:
+                continue
+            values, _ = self.rules[current]
+            if not ready:
+                stack.append((current, True))
+                stack.extend((value, False) for value in set(values[values < 0].tolist())
+                             if value not in self.expansions and self.length(value))
+                continue
+            pieces = list(self.pieces(current))
+            self.keep_expansion(current, np.concatenate(pieces) if pieces else np.empty(0, dtype=np.int32))
+        return self.expansions[rule_id]
+
+    def keep_expansion(self, rule_id, expansion):
+        while self.expansions and self.expanded + len(expansion) > EXPANDED_TERMINALS:
+            self.expanded -= len(self.expansions.pop(next(iter(self.expansions))))
+        self.expansions[rule_id] = expansion
+        self.expanded += len(expansion)
+
+    def pieces(self, rule_id):
+        # every entry of the stack is a rule being expanded: its symbols, the position of the next one and how often
+        # the rule is still to be repeated
+        values, exponents = self.rules[rule_id]
+        stack = [[values.tolist(), exponents.tolist(), 0, 1]]
+        while stack:
+            entry = stack[-1]
+            values, exponents, position, repeats = entry
+            if position == len(values):
+                if repeats > 1:
+                    entry[2], entry[3] = 0, repeats - 1
+                else:
+                    stack.pop()
+                continue
+            entry[2] += 1
+            value, exponent = values[position], exponents[position]
+            if value >= 0:
+                for first in range(0, exponent, self.batch_size):
+                    yield np.full(min(self.batch_size, exponent - first), value, dtype=np.int32)
+            elif exponent == 0 or self.length(value) == 0:
+                continue
+            elif self.length(value) <= self.batch_size:
+                # a loop over a short rule is tiled a batch at a time
+                expansion = self.expansion(value)
+                repeats = self.batch_size // len(expansion)
+                for first in range(0, exponent, repeats):
+                    yield np.tile(expansion, min(repeats, exponent - first))
+            else:
+                nested_values, nested_exponents = self.rules[value]
+                stack.append([nested_values.tolist(), nested_exponents.tolist(), 0, exponent])
+
+    def batches(self):
+        # the expansion of the start rule in arrays of about batch_size terminals
+        pending, pending_size = [], 0
+        for piece in self.pieces(START_RULE):
+            pending.append(piece)
+            pending_size += len(piece)
+            if pending_size >= self.batch_size:
+                yield np.concatenate(pending)
+                pending, pending_size = [], 0
+        if pending_size:
+            yield np.concatenate(pending)
+
+
+class LocalMetadata:
+    # what recorder_viz computes per rank: the number of calls and the files opened, closed, seeked or synced. the
+    # files are only collected when asked for, the converter defines them while decoding
+
+    def __init__(self, trace, rank_id):
+        self.trace = trace
+        self.rank_id = rank_id
+        self.total_records = trace.grammar(rank_id).length(START_RULE)
+
+    @property
+    def filemap(self):
+        signatures = self.trace.signatures(self.rank_id)
+        filemap = set()
+        for func_id, args in zip(signatures.func_ids.tolist(), signatures.args):
+            if func_id >= len(self.trace.funcs) or not args:
+                continue
+            name = self.trace.funcs[func_id]
+            if name.startswith(("MPI", "H5", "ncmpi", "nc_")) or "dir" in name:
+                continue
+            if any(part in name for part in ("open", "close", "creat", "seek", "sync")):
+                filemap.add(args[0].decode("utf-8"))
+        return filemap
+
+
+class LazyLocalMetadata:
+    # LMs[rank_id] reads the rank's cfg on first use
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.loaded = {}
+
+    def __len__(self):
+        return self.trace.GM.total_ranks
+
+    def __getitem__(self, rank_id):
+        lm = self.loaded.get(rank_id)
+        if lm is None:
+            lm = self.loaded[rank_id] = LocalMetadata(self.trace, rank_id)
+        return lm
+
+    def __iter__(self):
+        return (self[rank_id] for rank_id in range(len(self)))
+
+
+class RecorderTrace:
+    # stands in for recorder_viz.RecorderReader with funcs, GM.total_ranks and LMs. instead of records it yields a
+    # rank's calls in batches of arrays, see util.get_rank_table
+
+    def __init__(self, fp, batch_size=BATCH_SIZE):
+        self.fp = fp
+        self.batch_size = batch_size
+        total_ranks, time_resolution, _, _, header_size = read_metadata(fp)
+        self.GM = TraceMetadata(total_ranks, time_resolution)
+        with open(os.path.join(fp, "recorder.mt"), "rb") as f:
+            f.seek(header_size)
+            self.funcs = [name.decode("utf-8") for name in f.read().splitlines()]
+        self.LMs = LazyLocalMetadata(self)
+        # (rank id, extension) -> the parsed cst or cfg of the last PARSED_RANKS ranks
+        self.parsed = {}
+
+    def parse(self, rank_id, extension, read):
+        key = (rank_id, extension)
+        parsed = self.parsed.get(key)
+        if parsed is None:
+            while len(self.parsed) >= 2 * PARSED_RANKS:
+                del self.parsed[next(iter(self.parsed))]
+            parsed = self.parsed[key] = read(rank_id)
+        return parsed
+
+    def rank_file(self, rank_id, extension):
+        return os.path.join(self.fp, f"{rank_id}.{extension}")
+
+    def signatures(self, rank_id):
+        return self.parse(rank_id, "cst", self.read_signatures)
+
+    def grammar(self, rank_id):
+        return self.parse(rank_id, "cfg", self.read_grammar)
+
+    def read_signatures(self, rank_id):
+        with open(self.rank_file(rank_id, "cst"), "rb") as f:
+            data = f.read()
+        entries, = struct.unpack_from("i", data)
+        tids = np.empty(entries, dtype=np.int64)
+        func_ids = np.empty(entries, dtype=np.int32)
+        levels = np.empty(entries, dtype=np.int16)
+        args = []
+        position = 4
+        for i in range(entries):
+            _, key_len = struct.unpack_from("ii", data, position)
+            position += 8
+            tids[i], func_ids[i], levels[i], arg_count, arg_strlen = KEY_HEADER.unpack_from(data, position)
+            arg_str = data[position + KEY_HEADER.size:position + KEY_HEADER.size + arg_strlen]
+            args.append(arg_str.split(b" ")[:arg_count] if arg_count else [])
+            position += key_len
+        # recorder_viz hands out the low 32 bits of the pthread_t as a c_int
+        return Signatures(tids.astype(np.int32), func_ids, levels, args)
+
+    def read_grammar(self, rank_id):
+        data = np.fromfile(self.rank_file(rank_id, "cfg"), dtype=np.int32)
+        rules = {}
+        position = 1
+        for _ in range(int(data[0])):
+            rule_id, symbols = int(data[position]), int(data[position + 1])
+            body = data[position + 2:position + 2 + 2 * symbols]
+            rules[rule_id] = (body[0::2].copy(), body[1::2].astype(np.int64))
+            position += 2 + 2 * symbols
+        return Grammar(rules, self.batch_size)
+
+    def batches(self, rank_id):
+        # yields (cst indices, start times, end times) of consecutive calls. a start is its delta plus the previous
+        # start, the running sum is carried from batch to batch
+        path = self.rank_file(rank_id, "ts")
+        if os.path.getsize(path) == 0:
+            return
+        timestamps = np.memmap(path, dtype=np.uint32, mode="r").reshape(-1, 2)
+        time_resolution = self.GM.time_resolution
+        previous_start = 0.0
+        first = 0
+        for terminals in self.grammar(rank_id).batches():
+            deltas = timestamps[first:first + len(terminals)]
+            first += len(terminals)
+            steps = deltas[:, 0] * time_resolution
+            steps[0] += previous_start
+            starts = np.cumsum(steps)
+            ends = deltas[:, 1] * time_resolution
+            ends[0] += previous_start
+            ends[1:] += starts[:-1]
+            previous_start = starts[-1]
+            yield terminals, starts, ends
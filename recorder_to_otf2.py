@@ -1,182 +1,284 @@
 import constants
 import util
-import otf2
 import argparse
-import subprocess
-import os
-import Events
-
-
-def write_otf2_trace(fp_in, fp_out, timer_res):
-
-    with otf2.writer.open(fp_out, timer_resolution=timer_res) as trace:
-        print("starting with")
-        files, functions, events, rank_count = util.get_stats_from_recorder(fp_in)
-        print(files)
-        root_node = trace.definitions.system_tree_node("root_node")
-        generic_system_tree_node = trace.definitions.system_tree_node("dummy", parent=root_node)
-        posix_paradigm = trace.definitions.io_paradigm(identification="POSIX",
-                                                               name="POSIX",
-                                                               io_paradigm_class=otf2.IoParadigmClass.SERIAL,
-                                                               io_paradigm_flags=otf2.IoParadigmFlag.NONE)
-
-        isoc_paradigm = trace.definitions.io_paradigm(identification="ISOC",
-                                                               name="ISOC",
-                                                               io_paradigm_class=otf2.IoParadigmClass.SERIAL,
-                                                               io_paradigm_flags=otf2.IoParadigmFlag.NONE)
-
-        mpi_paradigm = trace.definitions.io_paradigm(identification="MPI",
-                                                       name="MPI",
-                                                       io_paradigm_class=otf2.IoParadigmClass.PARALLEL,
-                                                       io_paradigm_flags=otf2.IoParadigmFlag.NONE)
-
-        paradigms = {"POSIX": posix_paradigm, "ISOC": isoc_paradigm, "MPI": mpi_paradigm}
-        regions = {}
-
-        offset_attribute = trace.definitions.attribute("Offset", description='Absolute read/write offset within a file.', type=otf2.Type.UINT64)
-        io_files = {file_name: trace.definitions.io_regular_file(file_name, scope=generic_system_tree_node) for file_name in files}
-        io_handles = {}
-        location_groups = {f"rank {rank_id}": trace.definitions.location_group(f"rank {rank_id}", system_tree_parent=generic_system_tree_node) for rank_id in range(rank_count)}
-        locations = {f"rank {rank_id}": trace.definitions.location("Master Thread", group=location_groups.get(f"rank {rank_id}")) for rank_id in range(rank_count)}
-        t_start = 0
-        
-        modifiedEvents = []
-        trackerEndTime = {}
-        
-        for event in events:
-            if event.rank_id in trackerEndTime:
-                tracked_end_time = trackerEndTime[event.rank_id][0]
-                tracked_key = trackerEndTime[event.rank_id][1]
-                
-                if tracked_end_time > event.start_time:
-                    modifiedEvents.append(Events.Event(event.rank_id,
-                        event.function,
-                        event.start_time,
-                        event.end_time,
-                        event.level, 
-                        event.tid))
-                    
-                    modifiedEvents.append(Events.Event(modifiedEvents[tracked_key].rank_id,
-                        modifiedEvents[tracked_key].function,
-                        event.end_time,
-                        modifiedEvents[tracked_key].end_time,
-                        modifiedEvents[tracked_key].level,
-                        modifiedEvents[tracked_key].tid))
-                        
-                    trackerEndTime[event.rank_id] = [modifiedEvents[tracked_key].end_time, len(modifiedEvents) - 1]
-                    modifiedEvents[tracked_key].end_time = event.start_time
-                else: 
-                    modifiedEvents.append(Events.Event(event.rank_id,
-                        event.function,
-                        event.start_time,
-                        event.end_time,
-                        event.level, 
-                        event.tid))
-                    trackerEndTime[event.rank_id] = [event.end_time, len(modifiedEvents) - 1]
-            else:
-                modifiedEvents.append(Events.Event(event.rank_id,
-                    event.function,
-                    event.start_time,
-                    event.end_time,
-                    event.level, 
-                    event.tid))
-                trackerEndTime[event.rank_id] = [event.end_time, len(modifiedEvents) - 1]
-
-        #testing the modifiedEvents
-        for event in modifiedEvents:
-            start_time = (event.get_start_time_ticks(timer_res) - t_start)
-            end_time = (event.get_end_time_ticks(timer_res) - t_start)
-            print(event.paradigm, " - ", event.rank_id," - ", start_time, " - ", end_time)
-        
-        for rank_id in range(rank_count):
-            writer = trace.event_writer_from_location(locations.get(f"rank {rank_id}"))
-            
-            for event in sorted([e for e in modifiedEvents if e.rank_id == rank_id and not (e.function.startswith("__") or e.function == "MPI_Bcast")], key=lambda x: x.start_time):
-                if regions.get(event.function) is None:
-                    s = "MPI" if event.function.startswith("MPI") else "POSIX"
-                    regions[event.function] = trace.definitions.region(event.function, 
-                        source_file=s, 
-                        region_role=otf2.RegionRole.FILE_IO)
-                
-                
-                start_time = (event.get_start_time_ticks(timer_res) - t_start)
-                end_time = (event.get_end_time_ticks(timer_res) - t_start)
-                
-                display = True
-                if display: 
-                    writer.enter(start_time, regions.get(event.function))
-                    
-                    if isinstance(event, Events.IoEvent):
-                        atr = None if event.offset is None else {offset_attribute: event.offset}
-                        
-                        if io_handles.get(event.path_name) is None:
-                            io_handles[event.path_name] = trace.definitions.io_handle(file=io_files.get(event.path_name), 
-                                name=event.path_name, 
-                                io_paradigm=paradigms.get(event.paradigm), 
-                                io_handle_flags=otf2.IoHandleFlag.NONE)
-
-                        for i, size in zip(range(event.num_chunks), util.split_evenly(event.size, event.num_chunks)):
-                            writer.io_operation_begin(time=start_time,
-                                                      handle=io_handles.get(event.path_name),
-                                                      mode=otf2.IoOperationMode(event.type),
-                                                      operation_flags=otf2.IoOperationFlag.NONE,
-                                                      bytes_request=size,
-                                                      matching_id=event.level+i,
-                                                      attributes=atr
-                                                      )
-                                                      
-                        for i, size in zip(range(event.num_chunks), reversed(util.split_evenly(event.size, event.num_chunks))):
-                            writer.io_operation_complete(time=end_time,
-                                                         handle=io_handles.get(event.path_name),
-                                                         bytes_result=size,
-                                                         matching_id=event.level + (event.num_chunks - (i + 1))
-                                                         )
-
-                    if isinstance(event, Events.IoSeekEvent):
-                        writer.io_seek(time=start_time,
-                                       handle=io_handles.get(event.path_name),
-                                       offset_request=event.offset,
-                                       # IoSeekOption ?
-                                       whence=otf2.IoSeekOption(event.whence),
-                                       offset_result=event.offset)
-
-                    elif isinstance(event, Events.IoCreateHandleEvent):
-                        if io_handles.get(event.path_name) is None:
-                            io_handles[event.path_name] = trace.definitions.io_handle(file=io_files.get(event.path_name),
-                                                                                      name=event.path_name,
-                                                                                      io_paradigm=paradigms.get(event.paradigm),
-                                                                                      io_handle_flags=otf2.IoHandleFlag.NONE)
-
-                        writer.io_create_handle(time=start_time,
-                                                handle=io_handles.get(event.path_name),
-                                                mode=otf2.IoAccessMode(event.mode),
-                                                # we take only the first flag for both because the python bindings limitations
-                                                creation_flags=tuple(otf2.IoCreationFlag(x) for x in event.creation)[0],
-                                                status_flags=tuple(otf2.IoStatusFlag(x) for x in event.status)[0])
-
-                    elif isinstance(event, Events.IoDestroyHandleEvent):
-                        writer.io_destroy_handle(time=start_time, handle=io_handles.get(event.path_name))
-
-                    writer.leave(end_time, regions.get(event.function))
+import functools
+import itertools
+import parallel
+import pipeline
+import summary
+import sys
+from aggregate import bin_rank
+from coalesce import ChunkCoalescer, coalesce_io
+from dispatch import build_dispatch_table
+from external_sort import SortedRank
+from memory_budget import MemoryBudget
+from recorder_reader import RecorderTrace
+from cache import TraceCache, parse_size, trace_fingerprint
+from checkpoint import CHECKPOINT_DIR, Checkpoint, clear_output
+from otf2_backend import Otf2Backend
+from slices import SlicedBackend
+from filters import EventFilter, add_filter_arguments
+from metrics import METRICS, Progress
+
+
+def write_otf2_trace(fp_in, fp_out, timer_res, jobs=1, event_filter=None, cache=None, resume=False, progress_interval=0,
+                     coalesce_gap=None, aggregate_bin=None, pipeline_depth=0, output_format="otf2", write_jobs=1,
+                     sort_memory=None, spill_dir=None, max_memory=None, slices=None, slice_duration=None):
+
+    METRICS.restart()
+    # with max_memory the ranks in flight, the out of core sort and the read batches are sized to stay under it
+    budget = None if max_memory is None else MemoryBudget(max_memory)
+    event_filter = EventFilter() if event_filter is None else event_filter
+    # the parquet backend needs pyarrow, which is only imported when it is used
+    if output_format == "parquet":
+        from parquet_backend import ParquetBackend as Backend
+    elif slices is not None or slice_duration is not None:
+        Backend = SlicedBackend
+    else:
+        Backend = Otf2Backend
+    # a resumed conversion keeps what the backend wrote of the finished ranks and only converts the others, with a
+    # cache the recorder trace is only parsed for ranks that have not been decoded before
+    checkpoint = None
+    keep = []
+    if resume:
+        checkpoint = Checkpoint(fp_out, trace_fingerprint(fp_in), {
+            "filter": event_filter.rules(), "format": output_format, "timer_res": timer_res, "coalesce_gap": coalesce_gap,
+            "aggregate_bin": aggregate_bin, "slices": slices, "slice_duration": slice_duration})
+        keep = [CHECKPOINT_DIR] + (Backend.RESUMED_OUTPUTS if checkpoint.done else [])
+    clear_output(fp_out, keep=keep)
+
+    reader = None
+    cached_trace = None
+    if cache is not None:
+        cache_key = trace_fingerprint(fp_in)
+        cached_trace = cache.load(cache_key)
+    # a checkpoint of an earlier conversion was loaded, start makes a new one look the same
+    resumed = checkpoint is not None and checkpoint.is_resumed
+    known_trace = checkpoint if resumed else cached_trace
+    if known_trace is None:
+        functions, reader, rank_count = util.get_stats_from_recorder(fp_in)
+    else:
+        functions, rank_count = known_trace.funcs, known_trace.rank_count
+    if cache is not None and cached_trace is None:
+        cached_trace = cache.create(cache_key, functions, rank_count)
+    if checkpoint is not None:
+        checkpoint.start(functions, rank_count)
+
+    dispatch = build_dispatch_table(functions)
+    event_filter.apply(dispatch)
+    rank_ids = event_filter.ranks(rank_count)
+    print(f"converting {len(rank_ids)} of {rank_count} ranks")
+
+    if checkpoint is not None:
+        missing_rank_ids = [rank_id for rank_id in rank_ids if not checkpoint.has_rank(rank_id)]
+        if resumed:
+            print(f"resuming, {len(rank_ids) - len(missing_rank_ids)} of {len(rank_ids)} ranks are already written")
+        rank_ids = missing_rank_ids
+    if reader is None and any(cached_trace is None or not cached_trace.has_rank(rank_id) for rank_id in rank_ids):
+        reader = util.get_stats_from_recorder(fp_in)[1]
+    if budget is not None and isinstance(reader, RecorderTrace):
+        reader.batch_size = budget.read_batch()
+
+    def rank_events(rank_id):
+        # ranks taken from the cache are estimated as large as the largest rank decoded so far
+        if reader is not None:
+            return reader.LMs[rank_id].total_records
+        return budget.largest_rank
+
+    split_overlaps = Backend.SPLIT_OVERLAPS or aggregate_bin is not None
+    if cached_trace is None:
+        decode = functools.partial(util.decode_rank, reader, dispatch=dispatch, event_filter=event_filter,
+                                   split_overlaps=split_overlaps)
+    else:
+        decode = functools.partial(util.decode_cached_rank, cached_trace, reader, raw_dispatch=build_dispatch_table(functions),
+                                   dispatch=dispatch, event_filter=event_filter, split_overlaps=split_overlaps)
+
+    def sort_large_rank(rank_table):
+        # a rank larger than sort_memory is sorted out of core instead of being split into one sorted table per
+        # thread. the caller drops the table, so once its runs are spilled only they are left
+        rank_sort_memory = sort_memory if budget is None else budget.sort_memory(sort_memory)
+        if aggregate_bin is not None or isinstance(rank_table, SortedRank) or rank_sort_memory is None \
+                or rank_table.nbytes <= rank_sort_memory:
+            return rank_table
+        with METRICS.stage("sort"):
+            return SortedRank(rank_table, rank_sort_memory // (rank_table.nbytes // len(rank_table)), spill_dir)
+
+    def decode_sorted(rank_id):
+        # large ranks are sorted where they are decoded, in the worker with -j, and travel as their spilled runs.
+        # the budget of a worker only measures the worker, the rank is checked again once it is back
+        return sort_large_rank(decode(rank_id))
+
+    def prepare_rank(rank_id, rank_table):
+        # everything that does not touch the output, the pipelined conversion runs it in the decode thread
+        if aggregate_bin is not None:
+            with METRICS.stage("aggregate"):
+                return rank_id, (rank_table.paths, bin_rank(rank_table, aggregate_bin))
+
+        # every recorder thread gets its own location
+        if budget is not None:
+            budget.observe(rank_table)
+        rank_table = sort_large_rank(rank_table)
+        if isinstance(rank_table, SortedRank):
+            return rank_id, rank_table
+        # a thread only has to be sorted if its calls arrived out of start time order, which recorder only does after
+        # overlap splitting
+        with METRICS.stage("sort"):
+            return rank_id, {tid: table.sort() for tid, table in rank_table.split_by("tid").items()}
+
+    def write_rank(rank_id, prepared):
+        if aggregate_bin is not None:
+            with METRICS.stage("write"):
+                backend.write_metrics(rank_id, *prepared)
+            progress.rank_done()
+            return
+        if isinstance(prepared, SortedRank):
+            write_sorted_rank(rank_id, prepared)
+            progress.rank_done()
+            return
+
+        with METRICS.stage("define"):
+            threads = dict(zip(prepared, backend.definitions.define_locations(rank_id, list(prepared.values()))))
+        del prepared
+
+        if coalesce_gap is not None:
+            for tid, table in threads.items():
+                with METRICS.stage("coalesce"):
+                    threads[tid] = coalesce_io(table, coalesce_gap)
+                METRICS.count("io_calls_coalesced", len(table) - len(threads[tid]))
+
+        with METRICS.stage("write"):
+            backend.write_locations(rank_id, threads)
+        progress.rank_done()
+
+    def write_sorted_rank(rank_id, rank):
+        # the chunks of the rank are sorted by start over all threads, so handles are assigned in the same order as
+        # for a rank in memory. every chunk is split by thread and appended to the thread's location
+        try:
+            with METRICS.stage("define"):
+                backend.definitions.define_regions(rank.func_ids)
+                backend.start_locations(rank_id, rank.first_starts)
+            open_count = {}
+            coalescers = {}
+            for table in rank.tables():
+                with METRICS.stage("define"):
+                    table = backend.definitions.define_rank(rank_id, table, open_count)
+                for tid, part in table.split_by("tid").items():
+                    if coalesce_gap is not None:
+                        with METRICS.stage("coalesce"):
+                            coalesced = coalescers.setdefault(tid, ChunkCoalescer(coalesce_gap)).add(part)
+                        METRICS.count("io_calls_coalesced", len(part) - len(coalesced))
+                        part = coalesced
+                    if len(part):
+                        with METRICS.stage("write"):
+                            backend.append_events(rank_id, tid, part)
+            for tid, coalescer in coalescers.items():
+                part = coalescer.flush()
+                if part is not None:
+                    # the held back rows were counted as coalesced with their chunk
+                    METRICS.count("io_calls_coalesced", -len(part))
+                    with METRICS.stage("write"):
+                        backend.append_events(rank_id, tid, part)
+            backend.end_locations(rank_id)
+        finally:
+            rank.remove()
+
+    def write_budgeted_rank(rank_id, prepared):
+        # the memory of a rank is free for the next ones once it is written
+        try:
+            write_rank(rank_id, prepared)
+        finally:
+            budget.release(rank_id)
+
+    if Backend is SlicedBackend:
+        Backend = functools.partial(SlicedBackend, slices=slices, slice_duration=slice_duration)
+    backend = Backend(fp_out, timer_res, dispatch, coalesce_gap=coalesce_gap, aggregate_bin=aggregate_bin, write_jobs=write_jobs,
+                      checkpoint=checkpoint)
+    progress = Progress(METRICS, len(rank_ids), progress_interval)
+    try:
+        # pipelined, the ranks are decoded in worker processes and prepared in this thread while a writer thread
+        # writes the previous ones, at most pipeline_depth prepared ranks wait for the writer
+        decoded = parallel.decode_ranks(decode_sorted, rank_ids, jobs, in_workers=pipeline_depth > 0, budget=budget,
+                                        rank_events=rank_events)
+        # nothing holds on to a decoded table or a written rank while the next one is decoded
+        prepared_ranks = itertools.starmap(prepare_rank, decoded)
+        consume = write_rank if budget is None else write_budgeted_rank
+        if pipeline_depth > 0:
+            pipeline.run_pipelined(prepared_ranks, consume, pipeline_depth)
+        else:
+            for rank_id, prepared in prepared_ranks:
+                consume(rank_id, prepared)
+                del prepared
+
+        if cache is not None:
+            cache.evict(keep=cache_key)
+    except BaseException:
+        # the output of a failed conversion is incomplete, only what a checkpoint needs of it is kept
+        progress.close()
+        backend.abort()
+        raise
+
+    with METRICS.stage("close"):
+        backend.close()
+    progress.close()
+
+    # the output is complete
+    if checkpoint is not None:
+        checkpoint.remove()
 
 
 def main():
 
+    # "recorder_to_otf2.py summary <trace>" prints a summary instead of converting
+    if len(sys.argv) > 1 and sys.argv[1] == "summary":
+        summary.main(sys.argv[2:])
+        return
+
     ap = argparse.ArgumentParser()
     ap.add_argument("file", type=str, help="file path to the darshan trace file")
     ap.add_argument("-o", "--output", type=str, help="specifies different output path, default is ./trace_out")
     ap.add_argument("-t", "--timer", type=int, help="sets timer resolution, default is 1e9")
+    ap.add_argument("--format", choices=["otf2", "parquet"], default="otf2", help="otf2 archive or parquet files per rank (needs pyarrow), default is otf2")
+    slicing = ap.add_mutually_exclusive_group()
+    slicing.add_argument("--slices", type=int, metavar="N", help="write N otf2 archives of equal time windows to slices/ instead of one archive")
+    slicing.add_argument("--slice-duration", type=float, metavar="SECONDS", help="write an otf2 archive per time window of this many seconds to slices/ instead of one archive")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="number of processes used to decode ranks, default is 1")
+    ap.add_argument("--write-jobs", type=int, default=1, help="number of processes writing the otf2 event files of disjoint sets of ranks, or the time slices, default is 1")
+    ap.add_argument("--sort-memory", type=str, default="4G", help="ranks whose events take more memory are sorted in runs of this size spilled to disk, default is 4G")
+    ap.add_argument("--spill-dir", type=str, help="directory for the runs of the out of core sort, default is the system temp directory")
+    ap.add_argument("--max-memory", type=str, help="keep the memory of the conversion and its workers under this size, e.g. 8G, by decoding fewer ranks ahead and sorting large ranks out of core")
+    ap.add_argument("--resume", action="store_true", help="keep the written ranks in the output directory and continue an interrupted conversion")
+    ap.add_argument("--cache-dir", type=str, help="keep decoded ranks in this directory so later conversions of the same trace skip parsing it")
+    ap.add_argument("--cache-size", type=str, default="20G", help="least recently used traces are removed from the cache beyond this size, default is 20G")
+    ap.add_argument("--coalesce", type=float, metavar="GAP", help="merge contiguous I/O calls on the same handle that are at most GAP seconds apart into one operation")
+    ap.add_argument("--aggregate", type=float, metavar="BIN", help="write metrics per rank and file binned into BIN seconds instead of every call")
+    ap.add_argument("--pipeline", type=int, default=0, metavar="DEPTH", help="write ranks in a separate thread while the next ones are decoded, at most DEPTH decoded ranks are kept waiting, default is 0 (off)")
+    ap.add_argument("--progress", type=float, default=10, help="print progress every this many seconds, 0 turns it off, default is 10")
+    ap.add_argument("--profile", action="store_true", help="print time and peak memory per stage and event counters at the end")
+    ap.add_argument("--metrics-json", type=str, help="write time and peak memory per stage and event counters to this file")
+    add_filter_arguments(ap)
     args = ap.parse_args()
+    if (args.slices is not None or args.slice_duration is not None) and (args.format != "otf2" or args.aggregate is not None):
+        ap.error("time slices are otf2 archives of the events, they do not combine with --format parquet or --aggregate")
+    if (args.slices is not None and args.slices < 1) or (args.slice_duration is not None and args.slice_duration <= 0):
+        ap.error("the number and the duration of time slices have to be positive")
 
     fp_in = args.file
     fp_out = "./trace_out" if args.output is None else args.output
     timer_res = int(1e9) if args.timer is None else args.timer
 
-    if os.path.isdir(fp_out):
-        #exit(1)
-        subprocess.run(["rm", "-rf", fp_out])
+    cache = None if args.cache_dir is None else TraceCache(args.cache_dir, parse_size(args.cache_size))
+
+    write_otf2_trace(fp_in, fp_out, timer_res, jobs=args.jobs, event_filter=EventFilter.from_args(args), cache=cache,
+                     resume=args.resume, progress_interval=args.progress, coalesce_gap=args.coalesce,
+                     aggregate_bin=args.aggregate, pipeline_depth=args.pipeline,
+                     output_format=args.format, write_jobs=args.write_jobs, sort_memory=parse_size(args.sort_memory),
+                     spill_dir=args.spill_dir, max_memory=None if args.max_memory is None else parse_size(args.max_memory),
+                     slices=args.slices, slice_duration=args.slice_duration)
 
-    write_otf2_trace(fp_in, fp_out, timer_res)
+    if args.profile:
+        print(METRICS.report(), file=sys.stderr)
+    if args.metrics_json is not None:
+        METRICS.write_json(args.metrics_json)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,248 @@
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+
+import Events
+from definition_tables import DefinitionTables
+from event_table import NO_HANDLE, NO_OFFSET
+from external_sort import load_records, save_records
+from metrics import METRICS
+from otf2_backend import Otf2Backend
+from parallel_write import fork_worker, receive_worker
+
+# below the output directory: an otf2 archive per time window and the located events they are cut from
+SLICES_DIR = "slices"
+SPOOL_DIR = "slices.parts"
+
+
+def window_edges(first_start, last_end, slices=None, slice_duration=None):
+    # (start, end) of every window in seconds. slices windows of the same length cover the trace from its first
+    # call to its last end. windows of slice_duration are multiples of it since the start of the recording, from
+    # the one holding the first call to the one holding the last end. events before the first or after the last
+    # edge go into the first or the last window
+    if slices is not None:
+        edges = np.linspace(first_start, last_end, slices + 1).tolist()
+    else:
+        first = math.floor(first_start / slice_duration)
+        count = max(math.ceil(last_end / slice_duration) - first, 1)
+        edges = [(first + k) * slice_duration for k in range(count + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def window_rows(part, low, high):
+    # the rows of a location's part that take time in [low, high), cut at the edges. a row that started before
+    # low is reopened at low, a row running past high is closed at high. an I/O operation is one in every window
+    # it runs through, with the bytes of the time it spends there. other rows reopened at low are plain regions,
+    # like the later segments of overlap.resolve_overlaps
+    first = int(np.searchsorted(part.reach, low, side="left"))
+    last = int(np.searchsorted(part.start, high, side="left"))
+    rows = part.take(slice(first, last))
+    rows = rows.take((rows.end > low) | (rows.start >= low))
+    starts, ends = rows.start, rows.end
+    continued = starts < low
+    io = (continued | (ends > high)) & (rows.kind == Events.KIND_IO) & (ends > starts)
+    if io.any():
+        # the bytes up to an edge are the same on both sides of it, so the windows add up to the whole operation
+        duration = ends[io] - starts[io]
+        size = rows.size[io]
+        before = np.floor(size * ((np.maximum(starts[io], low) - starts[io]) / duration)).astype(size.dtype)
+        through = np.floor(size * ((np.minimum(ends[io], high) - starts[io]) / duration)).astype(size.dtype)
+        offset = rows.offset[io]
+        rows.columns["size"][io] = through - before
+        rows.columns["offset"][io] = np.where(offset != NO_OFFSET, offset + before, NO_OFFSET)
+        METRICS.count("slice_io_split", int(np.count_nonzero(io)))
+    rows.columns["start"] = np.maximum(starts, low)
+    rows.columns["end"] = np.minimum(ends, high)
+    reopened = continued & ~io
+    if reopened.any():
+        rows.columns["kind"][reopened] = Events.KIND_EVENT
+        rows.columns["io_handle"][reopened] = NO_HANDLE
+        METRICS.count("slice_events_reopened", int(np.count_nonzero(reopened)))
+    return rows
+
+
+class SlicedBackend:
+    # writes the converted ranks as one self contained otf2 archive per time window, slices/<k>/traces.otf2, for
+    # traces too large to open as a whole. the location tables are defined with ids only and spooled to disk as
+    # they come, the windows are known once the last rank is in. every window archive defines the locations of
+    # all ranks, the same in every window, but only the regions, files and handles its events use. times are
+    # those of the whole trace, so the windows line up. with write_jobs > 1 the windows are written by as many
+    # worker processes. with a checkpoint the spooled parts of the finished ranks are kept for a resumed conversion.
+
+    # the outputs a resumed conversion keeps, see checkpoint.clear_output
+    RESUMED_OUTPUTS = [SPOOL_DIR]
+    SPLIT_OVERLAPS = True
+
+    def __init__(self, fp_out, timer_res, dispatch, coalesce_gap=None, aggregate_bin=None, write_jobs=1, slices=None,
+                 slice_duration=None, checkpoint=None):
+        if aggregate_bin is not None:
+            raise ValueError("time slices are written from the events, not from aggregated metrics")
+        self.fp_out = fp_out
+        self.timer_res = timer_res
+        self.dispatch = dispatch
+        self.coalesce_gap = coalesce_gap
+        self.write_jobs = write_jobs
+        self.slices = slices
+        self.slice_duration = slice_duration
+        self.definitions = DefinitionTables(None, dispatch, None, None)
+        self.spool_path = os.path.join(fp_out, SPOOL_DIR)
+        self.slices_path = os.path.join(fp_out, SLICES_DIR)
+        # first_starts per rank and the spooled parts of every location in the order they were appended
+        self.ranks = {}
+        self.parts = {}
+        self.reach = {}
+        self.func_names = [info.name for info in dispatch]
+        self.first_start = math.inf
+        self.last_end = -math.inf
+        self.checkpoint = checkpoint
+        self.closed = False
+        os.makedirs(self.spool_path, exist_ok=True)
+        if checkpoint is not None:
+            self.resume()
+
+    def resume(self):
+        # the ids of files and handles, then the spooled parts of the finished ranks
+        for entry in self.checkpoint.definitions:
+            self.definitions.replay(entry)
+        for rank_id, state in self.checkpoint.done.items():
+            self.start_locations(rank_id, dict(state["first_starts"]))
+            for tid, count in state["parts"]:
+                for k in range(count):
+                    fp = self.part_path(rank_id, tid, k)
+                    part = load_records(fp, self.func_names, state["paths"])
+                    self.reach[(rank_id, tid)] = part.reach[-1]
+                    self.first_start = min(self.first_start, float(part.start[0]))
+                    self.last_end = max(self.last_end, float(part.reach[-1]))
+                    self.parts[(rank_id, tid)].append((fp, state["paths"]))
+
+    def part_path(self, rank_id, tid, k):
+        return os.path.join(self.spool_path, f"{rank_id}-{tid}-{k}.npy")
+
+    def write_metrics(self, rank_id, paths, binned):
+        raise ValueError("time slices are written from the events, not from aggregated metrics")
+
+    def start_locations(self, rank_id, first_starts):
+        self.ranks[rank_id] = dict(first_starts)
+        for tid in first_starts:
+            self.parts[(rank_id, tid)] = []
+
+    def append_events(self, rank_id, tid, table):
+        # the parts of a location are sorted by start one after the other. reach is the latest end up to every
+        # row, so the rows still open at a window's start are found by bisection like those starting in it
+        if len(table) == 0:
+            return
+        reach = np.maximum.accumulate(np.maximum(table.end, self.reach.get((rank_id, tid), -math.inf)))
+        self.reach[(rank_id, tid)] = reach[-1]
+        self.first_start = min(self.first_start, float(table.start[0]))
+        self.last_end = max(self.last_end, float(reach[-1]))
+
+        parts = self.parts[(rank_id, tid)]
+        fp = self.part_path(rank_id, tid, len(parts))
+        save_records(fp, type(table)(table.func_names, table.paths, dict(table.columns, reach=reach)))
+        parts.append((fp, table.paths))
+
+    def end_locations(self, rank_id):
+        if self.checkpoint is None:
+            return
+        parts = [[tid, len(self.parts[(rank_id, tid)])] for tid in self.ranks[rank_id]]
+        paths = next((paths for tid in self.ranks[rank_id] for _, paths in self.parts[(rank_id, tid)]), [])
+        self.checkpoint.finish_ranks(self.definitions.log, {rank_id: {
+            "first_starts": [[tid, float(start)] for tid, start in self.ranks[rank_id].items()], "parts": parts, "paths": paths}})
+
+    def write_locations(self, rank_id, threads):
+        self.start_locations(rank_id, {tid: table.start[0] for tid, table in threads.items()})
+        for tid, table in threads.items():
+            self.append_events(rank_id, tid, table)
+        self.end_locations(rank_id)
+
+    def write_window(self, k, low, high):
+        # the ids of files and handles in the window archive are its own, a handle is looked up by its rank, path,
+        # paradigm and slot. returns the number of events written
+        window = Otf2Backend(os.path.join(self.slices_path, f"{k:04d}"), self.timer_res, self.dispatch,
+                             coalesce_gap=self.coalesce_gap)
+        definitions = window.definitions
+        files, handles = self.definitions.files, self.definitions.handles
+        events = 0
+        try:
+            for rank_id, first_starts in self.ranks.items():
+                window.start_locations(rank_id, first_starts)
+                for tid in first_starts:
+                    for fp, paths in self.parts[(rank_id, tid)]:
+                        with METRICS.stage("slice"):
+                            rows = window_rows(load_records(fp, self.func_names, paths), low, high)
+                            if len(rows) == 0:
+                                continue
+                            definitions.define_regions(rows.func_id)
+                            has_handle = rows.io_handle != NO_HANDLE
+                            handle_ids = np.unique(rows.io_handle[has_handle])
+                            window_ids = np.array([definitions.handle_id(rank_id, definitions.file_id(files[file_id]), paradigm_id, slot)
+                                                   for _, file_id, paradigm_id, slot in (handles[h] for h in handle_ids.tolist())],
+                                                  dtype=rows.io_handle.dtype)
+                            if len(handle_ids):
+                                rows.columns["io_handle"][has_handle] = window_ids[np.searchsorted(handle_ids, rows.io_handle[has_handle])]
+                        with METRICS.stage("write"):
+                            window.append_events(rank_id, tid, rows)
+                        events += len(rows)
+        finally:
+            window.close()
+        return events
+
+    def write_windows(self, windows):
+        # forks up to write_jobs workers, a window each, or writes them in this process. returns the events per window
+        events = [None] * len(windows)
+        if self.write_jobs <= 1:
+            for k, (low, high) in enumerate(windows):
+                events[k] = self.write_window(k, low, high)
+            return events
+
+        running = []
+
+        def finish(k, process, receiver):
+            events[k] = receive_worker(process, receiver, f"time slice {k}")
+
+        try:
+            for k, (low, high) in enumerate(windows):
+                while len(running) >= self.write_jobs:
+                    finish(*running.pop(0))
+                running.append((k, *fork_worker(self.write_window, k, low, high)))
+            while running:
+                finish(*running.pop(0))
+        finally:
+            for _, process, _ in running:
+                process.join()
+        return events
+
+    def abort(self):
+        # a failed conversion writes no windows, a checkpoint keeps the parts of the finished ranks
+        if self.closed:
+            return
+        self.closed = True
+        if self.checkpoint is None:
+            shutil.rmtree(self.spool_path, ignore_errors=True)
+
+    def close(self):
+        # the windows are cut and written once every rank is spooled, slices/windows.json lists them
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.first_start > self.last_end:
+                self.first_start = self.last_end = 0.0
+            windows = window_edges(self.first_start, self.last_end, self.slices, self.slice_duration)
+            # the first and the last window are open ended
+            cuts = [(-math.inf if k == 0 else low, math.inf if k == len(windows) - 1 else high)
+                    for k, (low, high) in enumerate(windows)]
+            os.makedirs(self.slices_path, exist_ok=True)
+            events = self.write_windows(cuts)
+            with open(os.path.join(self.slices_path, "windows.json"), "w") as f:
+                json.dump([{"slice": k, "archive": os.path.join(f"{k:04d}", "traces.otf2"), "start": low, "end": high,
+                            "events": events[k]} for k, (low, high) in enumerate(windows)], f, indent=1)
+            METRICS.count("slices_written", len(windows))
+        except BaseException:
+            self.closed = False
+            self.abort()
+            raise
+        shutil.rmtree(self.spool_path, ignore_errors=True)
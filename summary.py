@@ -0,0 +1,208 @@
+import argparse
+import csv
+import functools
+import heapq
+import json
+import os
+import sys
+
+import numpy as np
+import otf2
+
+import Events
+import parallel
+import util
+from dispatch import build_dispatch_table
+from event_table import NO_HANDLE
+from filters import EventFilter, add_filter_arguments
+
+# bucket k of a size histogram holds sizes below 2 ** k and at least 2 ** (k - 1), bucket 0 holds empty calls
+HISTOGRAM_BUCKETS = 64
+
+READ = otf2.IoOperationMode.READ.value
+WRITE = otf2.IoOperationMode.WRITE.value
+
+
+def size_buckets(sizes):
+    # frexp returns the exponent e with size = m * 2 ** e and 0.5 <= m < 1, which is the bit length of the size
+    return np.frexp(sizes.astype(np.float64))[1].astype(np.int64)
+
+
+class Totals:
+    # bytes, operation counts, time in I/O calls and size histograms of a rank or a file
+
+    def __init__(self):
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.read_operations = 0
+        self.write_operations = 0
+        self.metadata_operations = 0
+        self.io_seconds = 0.0
+        self.read_histogram = np.zeros(HISTOGRAM_BUCKETS, dtype=np.int64)
+        self.write_histogram = np.zeros(HISTOGRAM_BUCKETS, dtype=np.int64)
+
+    def as_dict(self):
+        return {"read_bytes": self.read_bytes, "write_bytes": self.write_bytes, "read_operations": self.read_operations,
+                "write_operations": self.write_operations, "metadata_operations": self.metadata_operations,
+                "io_seconds": self.io_seconds, "read_size_histogram": np.trim_zeros(self.read_histogram, "b").tolist(),
+                "write_size_histogram": np.trim_zeros(self.write_histogram, "b").tolist()}
+
+
+class TraceSummary:
+    # everything is computed per rank table with bincounts over func_id, paradigm and path index, only the small
+    # per rank results are merged in python
+
+    def __init__(self, func_names, top=20):
+        self.func_names = func_names
+        self.top = top
+        self.ranks = {}
+        self.files = {}
+        self.function_seconds = np.zeros(len(func_names))
+        self.function_calls = np.zeros(len(func_names), dtype=np.int64)
+        self.paradigm_seconds = np.zeros(len(Events.PARADIGMS))
+        self.paradigm_calls = np.zeros(len(Events.PARADIGMS), dtype=np.int64)
+        self.slowest = []
+
+    def add_rank(self, rank_id, table):
+        duration = table.end - table.start
+        kind = table.kind
+        io = kind == Events.KIND_IO
+        read = io & (table.mode == READ)
+        write = io & (table.mode == WRITE)
+        metadata = (kind == Events.KIND_CREATE_HANDLE) | (kind == Events.KIND_DESTROY_HANDLE) | (kind == Events.KIND_SEEK)
+        buckets = size_buckets(table.size)
+
+        totals = self.ranks.setdefault(rank_id, Totals())
+        self.add_totals(totals, read, write, metadata, io, table.size, duration, buckets)
+
+        # per file, all columns at once grouped by path index
+        has_path = table.handle != NO_HANDLE
+        if has_path.any():
+            handle = table.handle[has_path]
+            path_count = len(table.paths)
+            sizes = table.size[has_path]
+            read_f, write_f, meta_f, io_f = read[has_path], write[has_path], metadata[has_path], io[has_path]
+            read_bytes = np.bincount(handle, weights=np.where(read_f, sizes, 0), minlength=path_count)
+            write_bytes = np.bincount(handle, weights=np.where(write_f, sizes, 0), minlength=path_count)
+            read_ops = np.bincount(handle, weights=read_f, minlength=path_count)
+            write_ops = np.bincount(handle, weights=write_f, minlength=path_count)
+            meta_ops = np.bincount(handle, weights=meta_f, minlength=path_count)
+            io_seconds = np.bincount(handle, weights=np.where(io_f, duration[has_path], 0), minlength=path_count)
+            cells = handle.astype(np.int64) * HISTOGRAM_BUCKETS + buckets[has_path]
+            read_histograms = np.bincount(cells[read_f], minlength=path_count * HISTOGRAM_BUCKETS).reshape(path_count, HISTOGRAM_BUCKETS)
+            write_histograms = np.bincount(cells[write_f], minlength=path_count * HISTOGRAM_BUCKETS).reshape(path_count, HISTOGRAM_BUCKETS)
+            for i, path_name in enumerate(table.paths):
+                file_totals = self.files.setdefault(path_name, Totals())
+                file_totals.read_bytes += int(read_bytes[i])
+                file_totals.write_bytes += int(write_bytes[i])
+                file_totals.read_operations += int(read_ops[i])
+                file_totals.write_operations += int(write_ops[i])
+                file_totals.metadata_operations += int(meta_ops[i])
+                file_totals.io_seconds += float(io_seconds[i])
+                file_totals.read_histogram += read_histograms[i]
+                file_totals.write_histogram += write_histograms[i]
+
+        self.function_seconds += np.bincount(table.func_id, weights=duration, minlength=len(self.func_names))
+        self.function_calls += np.bincount(table.func_id, minlength=len(self.func_names))
+        self.paradigm_seconds += np.bincount(table.paradigm, weights=duration, minlength=len(Events.PARADIGMS))
+        self.paradigm_calls += np.bincount(table.paradigm, minlength=len(Events.PARADIGMS))
+
+        if len(table):
+            candidates = np.argpartition(-duration, min(self.top, len(table)) - 1)[:self.top]
+            for i in candidates.tolist():
+                call = (float(duration[i]), rank_id, int(table.tid[i]), self.func_names[table.func_id[i]], float(table.start[i]),
+                        None if table.handle[i] == NO_HANDLE else table.paths[table.handle[i]], int(table.size[i]))
+                if len(self.slowest) < self.top:
+                    heapq.heappush(self.slowest, call)
+                else:
+                    heapq.heappushpop(self.slowest, call)
+
+    @staticmethod
+    def add_totals(totals, read, write, metadata, io, sizes, duration, buckets):
+        totals.read_bytes += int(sizes[read].sum())
+        totals.write_bytes += int(sizes[write].sum())
+        totals.read_operations += int(np.count_nonzero(read))
+        totals.write_operations += int(np.count_nonzero(write))
+        totals.metadata_operations += int(np.count_nonzero(metadata))
+        totals.io_seconds += float(duration[io].sum())
+        totals.read_histogram += np.bincount(buckets[read], minlength=HISTOGRAM_BUCKETS)
+        totals.write_histogram += np.bincount(buckets[write], minlength=HISTOGRAM_BUCKETS)
+
+    def as_dict(self):
+        return {
+            "ranks": {rank_id: totals.as_dict() for rank_id, totals in sorted(self.ranks.items())},
+            "files": {path_name: totals.as_dict() for path_name, totals in sorted(self.files.items())},
+            "functions": {name: {"calls": int(calls), "seconds": float(seconds)}
+                          for name, calls, seconds in zip(self.func_names, self.function_calls, self.function_seconds) if calls},
+            "paradigms": {paradigm or "other": {"calls": int(calls), "seconds": float(seconds)}
+                          for paradigm, calls, seconds in zip(Events.PARADIGMS, self.paradigm_calls, self.paradigm_seconds) if calls},
+            "slowest_calls": [{"seconds": seconds, "rank": rank_id, "tid": tid, "function": function, "start": start,
+                               "path": path_name, "size": size}
+                              for seconds, rank_id, tid, function, start, path_name, size in sorted(self.slowest, reverse=True)],
+        }
+
+    def write_json(self, f):
+        json.dump(self.as_dict(), f, indent=2)
+
+    def write_csv(self, fp):
+        # one file per section, histograms are written as space separated bucket counts
+        os.makedirs(fp, exist_ok=True)
+        summary = self.as_dict()
+        for section, key in (("ranks", "rank"), ("files", "path")):
+            with open(os.path.join(fp, f"{section}.csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                columns = list(Totals().as_dict())
+                writer.writerow([key] + columns)
+                for name, totals in summary[section].items():
+                    writer.writerow([name] + [" ".join(map(str, totals[c])) if isinstance(totals[c], list) else totals[c] for c in columns])
+        for section, key in (("functions", "function"), ("paradigms", "paradigm")):
+            with open(os.path.join(fp, f"{section}.csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([key, "calls", "seconds"])
+                for name, values in summary[section].items():
+                    writer.writerow([name, values["calls"], values["seconds"]])
+        with open(os.path.join(fp, "slowest_calls.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            columns = ["seconds", "rank", "tid", "function", "start", "path", "size"]
+            writer.writerow(columns)
+            for call in summary["slowest_calls"]:
+                writer.writerow([call[c] for c in columns])
+
+
+def summarize(fp_in, jobs=1, event_filter=None, top=20):
+    # every call is counted with its full duration, overlapping calls are not split
+    functions, reader, rank_count = util.get_stats_from_recorder(fp_in)
+    dispatch = build_dispatch_table(functions)
+    event_filter = EventFilter() if event_filter is None else event_filter
+    event_filter.apply(dispatch)
+
+    summary = TraceSummary(functions, top)
+    decode = functools.partial(util.get_rank_table, reader, dispatch=dispatch, event_filter=event_filter)
+    for rank_id, table in parallel.decode_ranks(decode, event_filter.ranks(rank_count), jobs):
+        summary.add_rank(rank_id, table)
+    return summary
+
+
+def main(argv=None):
+
+    ap = argparse.ArgumentParser(prog="recorder_to_otf2.py summary", description="bytes, operations, size histograms, time per function and the slowest calls of a recorder trace")
+    ap.add_argument("file", type=str, help="file path to the recorder trace directory")
+    ap.add_argument("-o", "--output", type=str, help="output file for json, output directory for csv, default is stdout for json")
+    ap.add_argument("--format", choices=["json", "csv"], default="json")
+    ap.add_argument("--top", type=int, default=20, help="number of slowest calls to list, default is 20")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="number of processes used to decode ranks, default is 1")
+    add_filter_arguments(ap)
+    args = ap.parse_args(argv)
+
+    summary = summarize(args.file, jobs=args.jobs, event_filter=EventFilter.from_args(args), top=args.top)
+    if args.format == "csv":
+        summary.write_csv("./summary" if args.output is None else args.output)
+    elif args.output is None:
+        summary.write_json(sys.stdout)
+    else:
+        with open(args.output, "w") as f:
+            summary.write_json(f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import array
+import os
+import random
+import struct
+
+import Events
+
+# every function the generator emits, the func_id of a record is its index in this list
+FUNCTIONS = ["open", "close", "read", "write", "pread", "pwrite", "readv", "writev", "lseek",
+             "fopen", "fclose", "fread", "fwrite", "fseek",
+             "MPI_File_write_at_all", "MPI_File_write_at", "MPI_Barrier", "MPI_Bcast",
+             "__xstat", "getcwd", "fsync", "H5Fflush"]
+
+POSIX_CALLS = ["read", "write", "pread", "pwrite", "readv", "writev", "lseek"]
+ISOC_CALLS = ["fread", "fwrite", "fseek"]
+OTHER_CALLS = ["MPI_Barrier", "MPI_Bcast", "__xstat", "getcwd", "fsync", "H5Fflush"]
+
+# an MPI call of depth n is recorded as the first n calls of this chain, each one nested in the one before
+MPI_CHAIN = ["MPI_File_write_at_all", "MPI_File_write_at", "pwrite", "lseek"]
+
+DEFAULT_MIX = {"POSIX": 0.5, "ISOC": 0.2, "MPI": 0.2, "OTHER": 0.1}
+
+
+def parse_mix(text):
+    # "POSIX=0.5,MPI=0.5"
+    mix = {}
+    for part in str(text).split(","):
+        if part.strip():
+            name, _, share = part.partition("=")
+            mix[name.strip().upper()] = float(share)
+    return mix
+
+
+class SyntheticRecord:
+    __slots__ = ("tstart", "tend", "level", "func_id", "tid", "arg_count", "args")
+
+    def __init__(self, tstart, tend, level, func_id, tid, args):
+        self.tstart = tstart
+        self.tend = tend
+        self.level = level
+        self.func_id = func_id
+        self.tid = tid
+        self.arg_count = len(args)
+        self.args = args
+
+
+class SyntheticGM:
+
+    def __init__(self, total_ranks):
+        self.total_ranks = total_ranks
+
+
+class SyntheticLM:
+
+    def __init__(self, total_records, filemap):
+        self.total_records = total_records
+        self.filemap = filemap
+
+
+class SyntheticTrace:
+    # stands in for recorder_viz.RecorderReader: funcs, GM.total_ranks, LMs[rank].total_records and filemap and
+    # records[rank][i] with the fields and undecoded bytes arguments the converter reads. the arguments follow
+    # Events.ARG_LAYOUTS, so every call takes the same decode path as in a real trace
+
+    def __init__(self, ranks=4, records_per_rank=10000, mix=None, depth=3, readv_chunks=4, threads=1,
+                 files_per_rank=4, seed=0):
+        self.funcs = list(FUNCTIONS)
+        self.func_ids = {name: func_id for func_id, name in enumerate(FUNCTIONS)}
+        self.mix = DEFAULT_MIX if mix is None else mix
+        self.depth = max(1, min(depth, len(MPI_CHAIN)))
+        self.readv_chunks = readv_chunks
+        self.threads = threads
+        self.files_per_rank = files_per_rank
+
+        self.GM = SyntheticGM(ranks)
+        self.records = []
+        self.LMs = []
+        for rank_id in range(ranks):
+            records, files = self.generate_rank(rank_id, records_per_rank, random.Random(seed * 1000003 + rank_id))
+            self.records.append(records)
+            self.LMs.append(SyntheticLM(len(records), files))
+
+    def make_args(self, name, path=None, size=0, offset=0, chunks=1, flags=0, mode="r"):
+        layout = Events.ARG_LAYOUTS.get(name)
+        if layout is None:
+            return [b"0x1", str(size).encode()]
+        positions = [j for value in layout.values() for j in (value if isinstance(value, tuple) else (value,))]
+        args = [b"0"] * (max(positions) + 1)
+        for key, value in layout.items():
+            if key == "path":
+                args[value] = path.encode()
+            elif key == "size":
+                # fread and fwrite record size and count, the converter multiplies them
+                args[value[0]] = str(size).encode()
+                for j in value[1:]:
+                    args[j] = b"1"
+            elif key == "flags":
+                args[value] = str(flags).encode()
+            elif key == "mode":
+                args[value] = mode.encode()
+            elif key in ("offset", "whence"):
+                args[value] = str(offset if key == "offset" else 0).encode()
+            elif key == "num_chunks":
+                args[value] = str(chunks).encode()
+        return args
+
+    def generate_rank(self, rank_id, count, rnd):
+        records = []
+        posix_files = [f"/scratch/rank{rank_id}/file{i}.dat" for i in range(self.files_per_rank)]
+        isoc_file = f"/home/user/log{rank_id}.txt"
+        shared_file = "/scratch/shared.dat"
+        tids = [1000 + rank_id * 16 + i for i in range(max(1, self.threads))]
+        paradigms = list(self.mix)
+        weights = [self.mix[p] for p in paradigms]
+        now = 0.001 * rnd.random()
+
+        def add(name, start, end, level, tid, args):
+            records.append(SyntheticRecord(start, end, level, self.func_ids[name], tid, args))
+
+        def call_time(duration):
+            nonlocal now
+            start = now
+            now += duration + rnd.uniform(1e-6, 5e-5)
+            return start, start + duration
+
+        # all files are opened first and closed at the end
+        for path in posix_files + [shared_file]:
+            add("open", *call_time(1e-5), 0, tids[0], self.make_args("open", path, flags=0o102))
+        add("fopen", *call_time(1e-5), 0, tids[0], self.make_args("fopen", isoc_file, mode="a+"))
+        offsets = {path: 0 for path in posix_files + [shared_file, isoc_file]}
+
+        while len(records) < count - len(posix_files) - 2:
+            paradigm = rnd.choices(paradigms, weights)[0]
+            tid = rnd.choice(tids)
+            size = rnd.choice([512, 4096, 65536, 1 << 20]) * rnd.randint(1, 4)
+
+            if paradigm == "POSIX":
+                name = rnd.choice(POSIX_CALLS)
+                path = rnd.choice(posix_files)
+                chunks = rnd.randint(1, self.readv_chunks) if name in ("readv", "writev") else 1
+                add(name, *call_time(size * 1e-10 + 2e-6), 0, tid,
+                    self.make_args(name, path, size=size, offset=offsets[path], chunks=chunks))
+                if name != "lseek":
+                    offsets[path] += size
+            elif paradigm == "ISOC":
+                name = rnd.choice(ISOC_CALLS)
+                add(name, *call_time(size * 1e-10 + 2e-6), 0, tid,
+                    self.make_args(name, isoc_file, size=size, offset=offsets[isoc_file]))
+                offsets[isoc_file] += size
+            elif paradigm == "MPI":
+                start, end = call_time(size * 1e-10 + 1e-5)
+                for level, name in enumerate(MPI_CHAIN[:self.depth]):
+                    add(name, start, end, level, tid, self.make_args(name, shared_file, size=size, offset=offsets[shared_file]))
+                    # the next call of the chain runs inside this one
+                    margin = (end - start) * 0.1
+                    start, end = start + margin, end - margin
+                offsets[shared_file] += size
+            else:
+                add(rnd.choice(OTHER_CALLS), *call_time(1e-6), 0, tid, [b"0x1"])
+
+        for path in posix_files + [shared_file]:
+            add("close", *call_time(1e-6), 0, tids[0], self.make_args("close", path))
+        add("fclose", *call_time(1e-6), 0, tids[0], self.make_args("fclose", isoc_file))
+
+        return records, set(posix_files + [shared_file, isoc_file])
+
+
+def write_recorder_trace(trace, fp, time_resolution=1e-7, rule_symbols=64):
+    # writes a trace in the per rank format of recorder_reader (recorder.mt, <rank>.cst, .cfg and .ts), so the
+    # native reader can be benchmarked without a recorder build. repeated calls become exponents, the calls are
+    # grouped into rules of rule_symbols symbols and repeated rules into an exponent of the start rule
+    os.makedirs(fp, exist_ok=True)
+    with open(os.path.join(fp, "recorder.mt"), "wb") as f:
+        f.write(struct.pack("i4xddii", trace.GM.total_ranks, 0.0, time_resolution, 0, 0))
+        f.write("".join(name + "\n" for name in trace.funcs).encode())
+
+    for rank_id, records in enumerate(trace.records):
+        signatures = {}
+        terminals = []
+        for record in records:
+            arg_str = b"".join(arg + b" " for arg in record.args)
+            key = struct.pack("<qBBBi", record.tid, record.func_id, record.level, record.arg_count, len(arg_str)) + arg_str
+            terminals.append(signatures.setdefault(key, len(signatures)))
+        with open(os.path.join(fp, f"{rank_id}.cst"), "wb") as f:
+            f.write(struct.pack("i", len(signatures)))
+            for terminal, key in enumerate(signatures):
+                f.write(struct.pack("ii", terminal, len(key)) + key)
+
+        symbols = []
+        for terminal in terminals:
+            if symbols and symbols[-1][0] == terminal:
+                symbols[-1][1] += 1
+            else:
+                symbols.append([terminal, 1])
+        rules = []
+        start_rule = []
+        for first in range(0, len(symbols), rule_symbols):
+            body = tuple(value for symbol in symbols[first:first + rule_symbols] for value in symbol)
+            if rules and rules[-1] == body:
+                start_rule[-1][1] += 1
+            else:
+                rules.append(body)
+                start_rule.append([-1 - len(rules), 1])
+        with open(os.path.join(fp, f"{rank_id}.cfg"), "wb") as f:
+            f.write(struct.pack("i", len(rules) + 1))
+            for rule_id, body in [(-1, tuple(value for symbol in start_rule for value in symbol))] + \
+                                 [(-2 - i, body) for i, body in enumerate(rules)]:
+                f.write(struct.pack(f"ii{len(body)}i", rule_id, len(body) // 2, *body))
+
+        # starts and ends in time_resolution ticks after the previous start
+        timestamps = []
+        previous = 0
+        for record in records:
+            start = max(round(record.tstart / time_resolution), previous)
+            end = max(round(record.tend / time_resolution), start)
+            timestamps += (start - previous, end - previous)
+            previous = start
+        with open(os.path.join(fp, f"{rank_id}.ts"), "wb") as f:
+            f.write(array.array("I", timestamps).tobytes())
@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+
+from event_table import COLUMNS, NO_HANDLE, NO_OFFSET, NO_VALUE, EventTable
+
+DEFAULTS = {"handle": NO_HANDLE, "offset": NO_OFFSET, "num_chunks": 1, "mode": NO_VALUE, "whence": NO_VALUE}
+
+
+def make_table(func_names=("f",), paths=(), **columns):
+    # an event table from lists of column values, columns that are not given get the value of an empty call
+    count = len(columns["start"])
+    return EventTable(list(func_names), list(paths), {
+        name: np.array(columns[name], dtype=dtype) if name in columns else np.full(count, DEFAULTS.get(name, 0), dtype=dtype)
+        for name, (_, dtype) in COLUMNS.items()})
+
+
+def assert_tables_equal(left, right):
+    assert left.paths == right.paths
+    assert sorted(left.columns) == sorted(right.columns)
+    for name in left.columns:
+        np.testing.assert_array_equal(left.columns[name], right.columns[name], err_msg=name)
+
+
+def read_archive(fp):
+    # the locations with their event counts, the clock properties and every event of an otf2 archive
+    import otf2
+    with otf2.reader.open(os.path.join(fp, "traces.otf2")) as trace:
+        locations = sorted((location.group.name, location.name, location.number_of_events)
+                           for location in trace.definitions.locations)
+        clock = trace.definitions.clock_properties
+        events = [(location.group.name, location.name, type(event).__name__, event.time,
+                   getattr(getattr(event, "region", None), "name", None), getattr(getattr(event, "handle", None), "name", None))
+                  for location, event in trace.events]
+        return locations, (clock.global_offset, clock.trace_length), events
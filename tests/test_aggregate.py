@@ -0,0 +1,45 @@
+import numpy as np
+import otf2
+
+import Events
+from aggregate import ALL_FILES, bin_rank
+from event_table import NO_HANDLE, NO_VALUE
+from helpers import make_table
+
+READ, WRITE = otf2.IoOperationMode.READ.value, otf2.IoOperationMode.WRITE.value
+
+
+def test_bins_of_a_rank():
+    # /a is opened, read over the edge of bin 0, seeked and closed in bin 3, /b is written without an open. nothing
+    # happens in bin 1 and only a barrier in bin 2
+    table = make_table(("open", "read", "write", "MPI_Barrier", "lseek", "close"), ("/a", "/b"),
+                       start=[0.1, 0.5, 0.7, 2.0, 3.2, 3.5], end=[0.2, 1.5, 0.8, 2.1, 3.3, 3.6],
+                       func_id=[0, 1, 2, 3, 4, 5],
+                       kind=[Events.KIND_CREATE_HANDLE, Events.KIND_IO, Events.KIND_IO, Events.KIND_EVENT,
+                             Events.KIND_SEEK, Events.KIND_DESTROY_HANDLE],
+                       mode=[0, READ, WRITE, NO_VALUE, NO_VALUE, NO_VALUE], size=[0, 100, 10, 0, 0, 0],
+                       handle=[0, 0, 1, NO_HANDLE, 0, 0])
+    binned = bin_rank(table, 1.0)
+
+    assert binned.groups.tolist() == [ALL_FILES, ALL_FILES, ALL_FILES, 0, 0, 1]
+    assert binned.bins.tolist() == [0, 2, 3, 0, 3, 0]
+    # read bytes, write bytes, read and write operations, metadata calls and open files
+    assert binned.deltas.tolist() == [[100, 10, 1, 1, 1, 1], [0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 2, -1],
+                                      [100, 0, 1, 0, 1, 1], [0, 0, 0, 0, 2, -1], [0, 10, 0, 1, 0, 0]]
+    # the values accumulate over the empty bins in between, per group
+    assert binned.values.tolist() == [[100, 10, 1, 1, 1, 1], [100, 10, 1, 1, 1, 1], [100, 10, 1, 1, 3, 0],
+                                      [100, 0, 1, 0, 1, 1], [100, 0, 1, 0, 3, 0], [0, 10, 0, 1, 0, 0]]
+    assert binned.idle_before.tolist() == [True, True, False, True, True, True]
+    assert binned.group_slices() == [(ALL_FILES, 0, 3), (0, 3, 5), (1, 5, 6)]
+
+
+def test_closes_of_files_opened_before_the_range_do_not_go_negative():
+    table = make_table(("close",), ("/a",), start=[0.5], end=[0.6], kind=[Events.KIND_DESTROY_HANDLE], handle=[0])
+    binned = bin_rank(table, 1.0)
+    np.testing.assert_array_equal(binned.values[:, -1], [0, 0])
+    np.testing.assert_array_equal(binned.deltas[:, -1], [-1, -1])
+
+
+def test_empty_rank():
+    binned = bin_rank(make_table(start=[]), 1.0)
+    assert len(binned.groups) == 0 and binned.values.shape == (0, 6)
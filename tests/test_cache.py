@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+import util
+from cache import TraceCache, trace_fingerprint
+from dispatch import build_dispatch_table
+from filters import EventFilter
+from helpers import read_archive
+from recorder_to_otf2 import write_otf2_trace
+from synthetic import SyntheticTrace, write_recorder_trace
+
+
+@pytest.fixture
+def recorder_trace(tmp_path):
+    fp = str(tmp_path / "recorder")
+    write_recorder_trace(SyntheticTrace(3, 600, seed=11), fp)
+    return fp
+
+
+def convert(fp_in, fp_out, cache, monkeypatch, **options):
+    # returns the ranks parsed from the recorder trace instead of taken from the cache
+    get_rank_table = util.get_rank_table
+    parsed = []
+
+    def counting(reader, rank_id, *args, **kwargs):
+        parsed.append(rank_id)
+        return get_rank_table(reader, rank_id, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(util, "get_rank_table", counting)
+        write_otf2_trace(fp_in, fp_out, int(1e9), cache=cache, **options)
+    return parsed
+
+
+def test_unchanged_trace_is_taken_from_the_cache(tmp_path, monkeypatch, recorder_trace):
+    cache = TraceCache(str(tmp_path / "cache"), 1 << 30)
+    assert convert(recorder_trace, str(tmp_path / "first"), cache, monkeypatch) == [0, 1, 2]
+    assert convert(recorder_trace, str(tmp_path / "second"), cache, monkeypatch) == []
+    assert read_archive(str(tmp_path / "second")) == read_archive(str(tmp_path / "first"))
+
+
+def test_changed_trace_is_parsed_again(tmp_path, monkeypatch, recorder_trace):
+    cache = TraceCache(str(tmp_path / "cache"), 1 << 30)
+    convert(recorder_trace, str(tmp_path / "first"), cache, monkeypatch)
+    # a rewritten file of the same size, the modification time tells it apart
+    path = os.path.join(recorder_trace, "1.ts")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert convert(recorder_trace, str(tmp_path / "second"), cache, monkeypatch) == [0, 1, 2]
+
+
+def test_fingerprint_covers_names_sizes_times_and_the_first_block(recorder_trace):
+    fingerprint = trace_fingerprint(recorder_trace)
+    path = os.path.join(recorder_trace, "0.cst")
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        first = f.read(1)
+        f.seek(0)
+        f.write(bytes([first[0] ^ 1]))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert trace_fingerprint(recorder_trace) != fingerprint
+    os.rename(path, path + ".moved")
+    assert trace_fingerprint(recorder_trace) != fingerprint
+
+
+def test_partly_cached_trace(tmp_path, monkeypatch, recorder_trace):
+    cache = TraceCache(str(tmp_path / "cache"), 1 << 30)
+    assert convert(recorder_trace, str(tmp_path / "first"), cache, monkeypatch,
+                   event_filter=EventFilter(include_ranks=[1])) == [1]
+    # the cached rank is filtered again, only the others are parsed
+    assert convert(recorder_trace, str(tmp_path / "all"), cache, monkeypatch) == [0, 2]
+    write_otf2_trace(recorder_trace, str(tmp_path / "uncached"), int(1e9))
+    assert read_archive(str(tmp_path / "all")) == read_archive(str(tmp_path / "uncached"))
+
+
+def test_least_recently_used_traces_are_evicted(tmp_path, recorder_trace):
+    cache = TraceCache(str(tmp_path / "cache"), 0)
+    reader = util.get_stats_from_recorder(recorder_trace)[1]
+    table = util.get_rank_table(reader, 0, build_dispatch_table(reader.funcs))
+    for age, key in enumerate(["old", "used", "new"]):
+        entry = cache.create(key, reader.funcs, 1)
+        entry.save_rank(0, table)
+        os.utime(os.path.join(cache.entry_path(key), "meta.json"), (age, age))
+    entry_size = sum(os.path.getsize(os.path.join(root, name))
+                     for root, _, names in os.walk(cache.entry_path("new")) for name in names)
+    # loading an entry marks it as used
+    assert cache.load("used") is not None
+    cache.max_bytes = 2 * entry_size
+    cache.evict(keep="new")
+    assert sorted(os.listdir(cache.cache_dir)) == ["new", "used"]
+    cache.max_bytes = 0
+    cache.evict(keep="new")
+    assert os.listdir(cache.cache_dir) == ["new"]
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+import util
+from checkpoint import CHECKPOINT_DIR
+from helpers import read_archive
+from recorder_to_otf2 import write_otf2_trace
+from synthetic import SyntheticTrace, write_recorder_trace
+
+RANKS = 6
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt(fp_in, fp_out, monkeypatch, fail_rank, **options):
+    # the conversion stops while rank fail_rank is decoded
+    decode_rank = util.decode_rank
+
+    def failing(reader, rank_id, *args, **kwargs):
+        if rank_id == fail_rank:
+            raise Interrupted()
+        return decode_rank(reader, rank_id, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(util, "decode_rank", failing)
+        with pytest.raises(Interrupted):
+            write_otf2_trace(fp_in, fp_out, int(1e9), resume=True, **options)
+
+
+def resume(fp_in, fp_out, monkeypatch, **options):
+    # returns the ranks the resumed conversion decodes
+    decode_rank = util.decode_rank
+    decoded = []
+
+    def counting(reader, rank_id, *args, **kwargs):
+        decoded.append(rank_id)
+        return decode_rank(reader, rank_id, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(util, "decode_rank", counting)
+        write_otf2_trace(fp_in, fp_out, int(1e9), resume=True, **options)
+    assert not os.path.exists(os.path.join(fp_out, CHECKPOINT_DIR))
+    return decoded
+
+
+def convert_interrupted(fp_in, fp_out, monkeypatch, fail_rank, **options):
+    interrupt(fp_in, fp_out, monkeypatch, fail_rank, **options)
+    return resume(fp_in, fp_out, monkeypatch, **options)
+
+
+@pytest.fixture
+def recorder_trace(tmp_path):
+    # small ranks, far below parallel_write.PART_EVENTS together, every one of them is done once it is written
+    fp = str(tmp_path / "recorder")
+    write_recorder_trace(SyntheticTrace(RANKS, 800, threads=2, files_per_rank=2, seed=6), fp)
+    return fp
+
+
+@pytest.mark.parametrize("options", [{}, {"write_jobs": 2}, {"aggregate_bin": 0.001}, {"sort_memory": 4096}])
+def test_resumed_archive_matches_a_fresh_one(tmp_path, monkeypatch, recorder_trace, options):
+    fresh, resumed = str(tmp_path / "fresh"), str(tmp_path / "resumed")
+    write_otf2_trace(recorder_trace, fresh, int(1e9), **options)
+    decoded = convert_interrupted(recorder_trace, resumed, monkeypatch, 3, **options)
+    assert decoded == [3, 4, 5]
+    assert read_archive(resumed) == read_archive(fresh)
+
+
+def test_small_ranks_are_not_converted_again(tmp_path, monkeypatch, recorder_trace, capsys):
+    fp_out = str(tmp_path / "out")
+    interrupt(recorder_trace, fp_out, monkeypatch, 2)
+    assert "resuming" not in capsys.readouterr().out
+    assert resume(recorder_trace, fp_out, monkeypatch) == [2, 3, 4, 5]
+    assert f"resuming, 2 of {RANKS} ranks are already written" in capsys.readouterr().out
+
+
+def test_resumed_parquet_matches_a_fresh_one(tmp_path, monkeypatch, recorder_trace):
+    pq = pytest.importorskip("pyarrow.parquet")
+    fresh, resumed = str(tmp_path / "fresh"), str(tmp_path / "resumed")
+    write_otf2_trace(recorder_trace, fresh, int(1e9), output_format="parquet")
+    assert convert_interrupted(recorder_trace, resumed, monkeypatch, 2, output_format="parquet") == [2, 3, 4, 5]
+    for name in ["events", "files.parquet", "handles.parquet"]:
+        assert pq.read_table(os.path.join(resumed, name)).equals(pq.read_table(os.path.join(fresh, name)))
+
+
+def test_resumed_slices_match_fresh_ones(tmp_path, monkeypatch, recorder_trace):
+    fresh, resumed = str(tmp_path / "fresh"), str(tmp_path / "resumed")
+    write_otf2_trace(recorder_trace, fresh, int(1e9), slices=3)
+    assert convert_interrupted(recorder_trace, resumed, monkeypatch, 4, slices=3) == [4, 5]
+    for k in range(3):
+        assert read_archive(os.path.join(resumed, "slices", f"{k:04d}")) == read_archive(os.path.join(fresh, "slices", f"{k:04d}"))
+
+
+def test_other_options_start_over(tmp_path, monkeypatch, recorder_trace):
+    fp_out = str(tmp_path / "out")
+    interrupt(recorder_trace, fp_out, monkeypatch, 3)
+    assert resume(recorder_trace, fp_out, monkeypatch, coalesce_gap=1e-3) == list(range(RANKS))
@@ -0,0 +1,69 @@
+import numpy as np
+
+import Events
+from coalesce import ChunkCoalescer, coalesce_io, merge_mask
+from event_table import EventTable
+from helpers import assert_tables_equal, make_table
+
+IO = Events.KIND_IO
+
+
+def io_table(starts, ends, offsets, sizes, handles=None, func_ids=None, kinds=None):
+    count = len(starts)
+    table = make_table(("write", "read"), ("/a",), start=starts, end=ends, offset=offsets, size=sizes,
+                       kind=[IO] * count if kinds is None else kinds, handle=[0] * count,
+                       func_id=[0] * count if func_ids is None else func_ids)
+    table.columns["io_handle"] = np.array([0] * count if handles is None else handles, dtype=np.int32)
+    return table
+
+
+def test_merge_mask():
+    table = io_table(starts=[0.0, 1.1, 2.2, 10.0, 11.1, 12.2],
+                     ends=[1.0, 2.0, 3.0, 11.0, 12.0, 13.0],
+                     offsets=[0, 10, 20, 30, 45, 55],
+                     sizes=[10, 10, 10, 10, 10, 10],
+                     handles=[0, 0, 0, 0, 0, 1])
+    # a gap of 7 seconds, an offset that skips 5 bytes and another handle
+    np.testing.assert_array_equal(merge_mask(table, 0.5), [True, True, False, False, False])
+
+
+def test_merge_mask_keeps_functions_and_kinds_apart():
+    table = io_table(starts=[0.0, 1.0, 2.0], ends=[1.0, 2.0, 3.0], offsets=[0, 10, 20], sizes=[10, 10, 10],
+                     func_ids=[0, 1, 1], kinds=[IO, IO, Events.KIND_SEEK])
+    assert not merge_mask(table, 1.0).any()
+
+
+def test_coalesce_io():
+    table = io_table(starts=[0.0, 1.0, 2.0, 3.0], ends=[1.0, 2.0, 3.0, 4.0], offsets=[0, 10, 20, 100],
+                     sizes=[10, 10, 10, 5])
+    merged = coalesce_io(table, 0.0)
+    np.testing.assert_array_equal(merged.start, [0.0, 3.0])
+    np.testing.assert_array_equal(merged.end, [3.0, 4.0])
+    np.testing.assert_array_equal(merged.size, [30, 5])
+    np.testing.assert_array_equal(merged.offset, [0, 100])
+    np.testing.assert_array_equal(merged.calls, [3, 1])
+
+
+def test_coalesce_io_without_merges_returns_the_table():
+    table = io_table(starts=[0.0, 5.0], ends=[1.0, 6.0], offsets=[0, 10], sizes=[10, 10])
+    assert coalesce_io(table, 1.0) is table
+
+
+def test_chunk_coalescer_matches_whole_table():
+    rng = np.random.default_rng(0)
+    count = 500
+    starts = np.cumsum(rng.uniform(0.5, 1.5, count))
+    sizes = rng.integers(1, 4, count) * 10
+    # every fourth call jumps ahead in the file
+    offsets = np.cumsum(sizes) - sizes + np.where(rng.random(count) < 0.25, 1000, 0).cumsum()
+    table = io_table(starts.tolist(), (starts + 0.4).tolist(), offsets.tolist(), sizes.tolist())
+    whole = coalesce_io(table, 1.0)
+    for chunk in (1, 7, 64, 499):
+        coalescer = ChunkCoalescer(1.0)
+        parts = [coalescer.add(table.take(slice(first, first + chunk))) for first in range(0, count, chunk)]
+        parts.append(coalescer.flush())
+        parts = [part for part in parts if part is not None and len(part)]
+        for part in parts:
+            if "calls" not in part.columns:
+                part.columns["calls"] = np.ones(len(part), dtype=np.int32)
+        assert_tables_equal(EventTable.concat(parts), whole)
@@ -0,0 +1,32 @@
+import Events
+from definition_tables import DefinitionTables
+from dispatch import build_dispatch_table
+from helpers import make_table
+
+FUNCS = ["fopen", "fseek", "fwrite", "fclose", "open", "close"]
+
+
+def calls(names, path_ids):
+    dispatch = build_dispatch_table(FUNCS)
+    infos = [dispatch[FUNCS.index(name)] for name in names]
+    return dispatch, make_table(FUNCS, ["/a", "/b"], start=[float(i) for i in range(len(names))],
+                                end=[i + 0.5 for i in range(len(names))], func_id=[info.func_id for info in infos],
+                                kind=[info.kind for info in infos], paradigm=[info.paradigm_id for info in infos],
+                                mode=[0 if info.kind == Events.KIND_CREATE_HANDLE else -1 for info in infos],
+                                handle=path_ids)
+
+
+def test_a_stream_is_one_handle_from_fopen_to_fclose():
+    # fseek is recorded as POSIX and fclose without a paradigm, both work on the stream fopen opened
+    dispatch, table = calls(["fopen", "fseek", "fwrite", "fclose"] * 2, [0] * 8)
+    definitions = DefinitionTables(None, dispatch, None, None)
+    assert definitions.assign_handles(0, table).tolist() == [0] * 8
+    assert definitions.handles == [(0, 0, Events.PARADIGM_IDS["ISOC"], 0)]
+
+
+def test_open_files_get_their_own_slots():
+    dispatch, table = calls(["open", "fopen", "fseek", "close", "fclose", "fopen", "fclose"], [0, 0, 0, 0, 0, 1, 1])
+    definitions = DefinitionTables(None, dispatch, None, None)
+    assert definitions.assign_handles(0, table).tolist() == [0, 1, 1, 0, 1, 2, 2]
+    posix, isoc = Events.PARADIGM_IDS["POSIX"], Events.PARADIGM_IDS["ISOC"]
+    assert definitions.handles == [(0, 0, posix, 0), (0, 0, isoc, 1), (0, 1, isoc, 0)]
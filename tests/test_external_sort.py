@@ -0,0 +1,69 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from event_table import EventTable
+from external_sort import SortedRank, merge_sorted
+from helpers import assert_tables_equal, make_table
+
+
+def random_table(count, seed, tids=(1,)):
+    # few distinct starts, so there are many ties
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, count // 4 + 1, count).astype(np.float64)
+    return make_table(start=starts, end=starts + 0.5, tid=rng.choice(tids, count), size=np.arange(count))
+
+
+def chunks(table, size):
+    for first in range(0, len(table), size):
+        yield table.take(slice(first, first + size))
+
+
+@pytest.mark.parametrize("chunk_events", [1, 3, 50, 1000])
+def test_merge_sorted_is_a_stable_sort(chunk_events):
+    table = random_table(600, seed=chunk_events)
+    runs = [table.take(slice(first, first + 150)).sort() for first in range(0, len(table), 150)]
+    streams = [chunks(run, 40) for run in runs]
+    merged = EventTable.concat(list(merge_sorted(streams, chunk_events)))
+    # rows with the same start keep the order of the runs, which is the order of the table
+    assert_tables_equal(merged, table.sort())
+
+
+def test_merge_sorted_with_empty_streams():
+    table = random_table(100, seed=1).sort()
+    merged = EventTable.concat(list(merge_sorted([iter([]), chunks(table, 7), iter([])], 16)))
+    assert_tables_equal(merged, table)
+
+
+def test_sorted_rank_passes_sorted_threads_through():
+    table = EventTable.concat([random_table(300, seed, tids=(tid,)).sort() for seed, tid in ((1, 1), (2, 2))])
+    rank = SortedRank(table, 100)
+    try:
+        assert rank.path is None
+        assert_tables_equal(EventTable.concat(list(rank.tables())), table.sort())
+    finally:
+        rank.remove()
+
+
+def test_sorted_rank_spills_unsorted_runs(tmp_path):
+    table = random_table(1000, seed=5, tids=(1, 2, 3))
+    rank = SortedRank(table, 128, spill_dir=str(tmp_path))
+    try:
+        assert rank.path is not None and len(rank.runs) == 8
+        assert rank.first_starts == {tid: float(table.start[table.tid == tid].min()) for tid in (1, 2, 3)}
+        assert_tables_equal(EventTable.concat(list(rank.tables())), table.sort())
+    finally:
+        rank.remove()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spilled_rank_is_pickled_without_its_events(tmp_path):
+    table = random_table(1000, seed=6, tids=(1, 2))
+    rank = SortedRank(table, 128, spill_dir=str(tmp_path))
+    try:
+        data = pickle.dumps(rank)
+        assert len(data) < table.nbytes // 4
+        assert_tables_equal(EventTable.concat(list(pickle.loads(data).tables())), table.sort())
+    finally:
+        rank.remove()
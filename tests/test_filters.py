@@ -0,0 +1,37 @@
+import pytest
+
+from dispatch import build_dispatch_table
+from filters import EventFilter, parse_rank_set, parse_time_range
+
+FUNCTIONS = ["open", "read", "fopen", "MPI_Bcast", "MPI_Barrier", "__xstat"]
+
+
+def selected(event_filter):
+    dispatch = build_dispatch_table(FUNCTIONS)
+    return [info.name for info, keep in zip(dispatch, event_filter.function_mask(dispatch)) if keep]
+
+
+@pytest.mark.parametrize("path, kept", [("/scratch", True), ("/scratch/a.dat", True), ("/scratch2/a.dat", False),
+                                        ("/scratchy", False), ("/home/a", False)])
+def test_path_prefixes_end_at_a_separator(path, kept):
+    assert EventFilter(include_paths=["/scratch"]).select_path(path.encode()) == kept
+    assert EventFilter(include_paths=["/scratch/"]).select_path(path) == kept
+    assert EventFilter(exclude_paths=["/scratch"]).select_path(path) == (not kept)
+
+
+def test_default_excludes():
+    assert selected(EventFilter()) == ["open", "read", "fopen", "MPI_Barrier"]
+    assert selected(EventFilter(include_paradigms=["MPI"])) == ["MPI_Barrier"]
+
+
+def test_function_include_overrides_default_excludes():
+    assert selected(EventFilter(include_functions=["MPI_*"])) == ["MPI_Bcast", "MPI_Barrier"]
+    assert selected(EventFilter(include_functions=["__xstat"], include_paradigms=["POSIX"])) == ["open", "read", "__xstat"]
+    # explicit excludes still win
+    assert selected(EventFilter(include_functions=["MPI_*"], exclude_functions=["MPI_Bcast"])) == ["MPI_Barrier"]
+
+
+def test_parse_rank_set_and_time_range():
+    assert parse_rank_set("0-3,8, 10-11") == {0, 1, 2, 3, 8, 10, 11}
+    assert parse_time_range("120:") == (120.0, float("inf"))
+    assert parse_time_range(":300") == (0.0, 300.0)
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+import memory_budget
+import parallel
+from helpers import make_table
+from memory_budget import DEFAULT_EVENT_BYTES, TABLE_COPIES, MemoryBudget
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    # the measured memory of the process and its workers, set by the test
+    measured = [0]
+    monkeypatch.setattr(memory_budget, "process_rss", lambda pid="self": measured[0])
+    return measured
+
+
+def test_admits_a_rank_when_nothing_is_in_flight(rss):
+    budget = MemoryBudget(1000)
+    assert budget.admit(0, 10 ** 6)
+    assert not budget.admit(1, 1)
+    budget.release(0)
+    assert budget.admit(1, 1)
+
+
+def test_admits_by_reservations_or_measured_memory(rss):
+    event_bytes = DEFAULT_EVENT_BYTES * TABLE_COPIES
+    budget = MemoryBudget(25 * event_bytes)
+    assert budget.admit(0, 10) and budget.admit(1, 10)
+    assert not budget.admit(2, 10)
+    assert budget.admit(2, 5)
+    budget.release(1)
+    budget.release(2)
+    rss[0] = 20 * event_bytes
+    assert not budget.admit(1, 10)
+    rss[0] = 0
+    assert budget.admit(1, 10)
+
+
+def test_observe_follows_the_largest_estimate(rss, monkeypatch):
+    table = make_table(["read"], [], start=[0.0] * 100, end=[1.0] * 100)
+    measured = table.nbytes / len(table) * TABLE_COPIES
+    budget = MemoryBudget(1 << 30)
+    budget.observe(table)
+    assert budget.rank_bytes(1000) == int(1000 * max(DEFAULT_EVENT_BYTES * TABLE_COPIES, measured))
+
+    # with a lower first estimate the measured bytes per event take over, a smaller rank does not lower them
+    monkeypatch.setattr(memory_budget, "DEFAULT_EVENT_BYTES", 1)
+    budget = MemoryBudget(1 << 30)
+    budget.observe(make_table(["read"], [], start=[]))
+    assert budget.rank_bytes(1000) == 1000 * TABLE_COPIES
+    budget.observe(table)
+    assert budget.rank_bytes(1000) == int(1000 * measured)
+    assert budget.largest_rank == 100
+    budget.observe(table.take([0]))
+    assert budget.rank_bytes(1000) == int(1000 * measured)
+    assert budget.largest_rank == 100
+
+
+def test_wait_admit_blocks_until_released(rss):
+    budget = MemoryBudget(1000)
+    budget.wait_admit(0, 10)
+    waiter = threading.Thread(target=budget.wait_admit, args=(1, 10))
+    waiter.start()
+    waiter.join(0.3)
+    assert waiter.is_alive()
+    budget.release(0)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert list(budget.reserved) == [1]
+
+
+def test_sort_memory_and_read_batch(rss):
+    budget = MemoryBudget(1 << 30)
+    assert budget.sort_memory(None) == 1 << 28
+    assert budget.sort_memory(1000) == 1000
+    rss[0] = 1 << 30
+    assert budget.sort_memory(None) == 1 << 20
+    assert budget.read_batch() == 1 << 16
+    assert MemoryBudget(1 << 20).read_batch() == 1 << 12
+    assert MemoryBudget(1 << 40).read_batch() == 1 << 20
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_decode_ranks_admits_ranks_by_the_budget(rss, jobs):
+    # every rank needs more than the budget, so only one may be in flight at a time
+    budget = MemoryBudget(1000)
+    in_flight = []
+    for rank_id, result in parallel.decode_ranks(lambda rank_id: rank_id * 10, range(5), jobs, budget=budget,
+                                                 rank_events=lambda rank_id: 100):
+        assert result == rank_id * 10
+        in_flight.append(sorted(budget.reserved))
+        budget.release(rank_id)
+    assert in_flight == [[0], [1], [2], [3], [4]]
+    assert not budget.reserved
@@ -0,0 +1,40 @@
+import io
+import os
+
+import numpy as np
+
+from metrics import Metrics, Progress, peak_rss_mb
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+
+def test_stage_records_the_peak_it_raised():
+    metrics = Metrics()
+    # 64 MB beyond whatever peak the tests before reached
+    grow_mb = int(peak_rss_mb() - current_rss_mb()) + 64
+    with metrics.stage("grow"):
+        block = np.ones(grow_mb << 20, dtype=np.uint8)
+        del block
+    # the pages are free again, a stage below the earlier peak does not raise it
+    with metrics.stage("reuse"):
+        block = np.ones(16 << 20, dtype=np.uint8)
+        del block
+    assert metrics.stages["grow"][2] >= 48
+    assert metrics.stages["reuse"][2] < 8
+
+
+def test_progress_reports_while_records_are_counted():
+    metrics = Metrics()
+    stream = io.StringIO()
+    progress = Progress(metrics, 4, 1e-9, stream=stream)
+    metrics.count("records_read", 1000)
+    assert stream.getvalue().startswith("0/4 ranks, 1000 records")
+    assert "eta" not in stream.getvalue()
+    progress.rank_done()
+    assert "eta" in stream.getvalue().splitlines()[-1]
+    progress.close()
+    metrics.count("records_read", 1000)
+    assert len(stream.getvalue().splitlines()) == 2
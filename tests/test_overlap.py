@@ -0,0 +1,86 @@
+import numpy as np
+
+import Events
+from helpers import make_table
+from overlap import resolve_overlaps, resolve_rank_overlaps
+
+IO, EVENT = Events.KIND_IO, Events.KIND_EVENT
+NAMES = ("MPI_File_write_all", "pwrite", "lseek", "read")
+
+
+def calls(*rows, tid=None):
+    # rows of (function, start, end, level, kind)
+    names, starts, ends, levels, kinds = zip(*rows)
+    columns = dict(func_id=[NAMES.index(name) for name in names], start=starts, end=ends, level=levels, kind=kinds,
+                   size=[100] * len(rows))
+    if tid is not None:
+        columns["tid"] = tid
+    return make_table(NAMES, **columns)
+
+
+def segments(table):
+    return [(NAMES[func_id], start, end, kind) for func_id, start, end, kind
+            in zip(table.func_id.tolist(), table.start.tolist(), table.end.tolist(), table.kind.tolist())]
+
+
+def test_sequential_calls_are_not_copied():
+    table = calls(("read", 0.0, 1.0, 0, IO), ("read", 1.0, 2.0, 0, IO), ("read", 3.0, 3.0, 0, IO))
+    assert resolve_overlaps(table) is table
+
+
+def test_child_cuts_its_parent():
+    table = calls(("MPI_File_write_all", 0.0, 10.0, 0, IO), ("pwrite", 2.0, 5.0, 1, IO))
+    assert segments(resolve_overlaps(table)) == [
+        ("MPI_File_write_all", 0.0, 2.0, IO), ("pwrite", 2.0, 5.0, IO), ("MPI_File_write_all", 5.0, 10.0, EVENT)]
+
+
+def test_three_levels():
+    table = calls(("MPI_File_write_all", 0.0, 10.0, 0, IO), ("pwrite", 1.0, 9.0, 1, IO), ("lseek", 2.0, 3.0, 2, EVENT),
+                  ("read", 11.0, 12.0, 0, IO))
+    assert segments(resolve_overlaps(table)) == [
+        ("MPI_File_write_all", 0.0, 1.0, IO), ("pwrite", 1.0, 2.0, IO), ("lseek", 2.0, 3.0, EVENT),
+        ("pwrite", 3.0, 9.0, EVENT), ("MPI_File_write_all", 9.0, 10.0, EVENT), ("read", 11.0, 12.0, IO)]
+
+
+def test_shared_start_moves_the_io_record_to_the_first_segment_with_a_length():
+    table = calls(("MPI_File_write_all", 0.0, 10.0, 0, IO), ("pwrite", 0.0, 4.0, 1, IO), ("lseek", 0.0, 1.0, 2, EVENT))
+    resolved = resolve_overlaps(table)
+    assert segments(resolved) == [
+        ("lseek", 0.0, 1.0, EVENT), ("pwrite", 1.0, 4.0, IO), ("MPI_File_write_all", 4.0, 10.0, IO)]
+    assert np.all(resolved.end > resolved.start)
+
+
+def test_shared_end_drops_the_empty_tail():
+    table = calls(("MPI_File_write_all", 0.0, 10.0, 0, IO), ("pwrite", 5.0, 10.0, 1, IO))
+    assert segments(resolve_overlaps(table)) == [("MPI_File_write_all", 0.0, 5.0, IO), ("pwrite", 5.0, 10.0, IO)]
+
+
+def test_fully_covered_parent_keeps_one_empty_segment():
+    table = calls(("MPI_File_write_all", 0.0, 10.0, 0, IO), ("pwrite", 0.0, 10.0, 1, IO))
+    assert segments(resolve_overlaps(table)) == [("pwrite", 0.0, 10.0, IO), ("MPI_File_write_all", 10.0, 10.0, IO)]
+
+
+def test_empty_calls_are_kept():
+    table = calls(("MPI_File_write_all", 0.0, 10.0, 0, IO), ("lseek", 3.0, 3.0, 1, EVENT))
+    assert segments(resolve_overlaps(table)) == [
+        ("MPI_File_write_all", 0.0, 3.0, IO), ("lseek", 3.0, 3.0, EVENT), ("MPI_File_write_all", 3.0, 10.0, EVENT)]
+
+
+def test_use_levels():
+    # two overlapping calls on the same level: with levels the first one is cut where the second one starts,
+    # without them the second one is nested into the first one
+    table = calls(("read", 0.0, 4.0, 0, IO), ("pwrite", 2.0, 6.0, 0, IO))
+    assert segments(resolve_overlaps(table)) == [("read", 0.0, 2.0, IO), ("pwrite", 2.0, 6.0, IO)]
+    assert segments(resolve_overlaps(table, use_levels=False)) == [
+        ("read", 0.0, 2.0, IO), ("pwrite", 2.0, 6.0, IO)]
+    nested = calls(("read", 0.0, 6.0, 0, IO), ("pwrite", 2.0, 4.0, 0, IO))
+    assert segments(resolve_overlaps(nested)) == [("read", 0.0, 2.0, IO), ("pwrite", 2.0, 4.0, IO)]
+    assert segments(resolve_overlaps(nested, use_levels=False)) == [
+        ("read", 0.0, 2.0, IO), ("pwrite", 2.0, 4.0, IO), ("read", 4.0, 6.0, EVENT)]
+
+
+def test_threads_are_resolved_on_their_own():
+    table = calls(("MPI_File_write_all", 0.0, 10.0, 0, IO), ("pwrite", 2.0, 5.0, 0, IO), tid=[1, 2])
+    assert resolve_rank_overlaps(table).start.tolist() == [0.0, 2.0]
+    assert segments(resolve_rank_overlaps(table, by_thread=False)) == [
+        ("MPI_File_write_all", 0.0, 2.0, IO), ("pwrite", 2.0, 5.0, IO), ("MPI_File_write_all", 5.0, 10.0, EVENT)]
@@ -0,0 +1,71 @@
+import functools
+import os
+import time
+
+import pytest
+
+import parallel
+import util
+from dispatch import build_dispatch_table
+from event_table import EventTable
+from external_sort import SortedRank
+from helpers import assert_tables_equal, make_table, read_archive
+from recorder_to_otf2 import write_otf2_trace
+from synthetic import SyntheticTrace
+
+
+def decode_all(trace, jobs):
+    decode = functools.partial(util.decode_rank, trace, dispatch=build_dispatch_table(trace.funcs))
+    return list(parallel.decode_ranks(decode, range(trace.GM.total_ranks), jobs))
+
+
+def test_decode_in_pool_matches_serial():
+    trace = SyntheticTrace(5, 2000, threads=2, seed=3)
+    serial = decode_all(trace, 1)
+    pooled = decode_all(trace, 3)
+    assert [rank_id for rank_id, _ in pooled] == list(range(5))
+    for (_, left), (_, right) in zip(serial, pooled):
+        assert_tables_equal(left, right)
+
+
+def test_decode_throughput_scales_with_cores():
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    if cores < 2:
+        pytest.skip("needs at least two cores")
+    jobs = min(cores, 4)
+    trace = SyntheticTrace(4 * jobs, 20000, seed=1)
+
+    def throughput(jobs):
+        start = time.perf_counter()
+        decode_all(trace, jobs)
+        return trace.GM.total_ranks / (time.perf_counter() - start)
+
+    serial = throughput(1)
+    pooled = throughput(jobs)
+    # the ranks are pickled back to this process, a third of every added core is enough
+    assert pooled >= serial * (1 + (jobs - 1) / 3)
+
+
+def test_large_ranks_are_sorted_in_the_workers(tmp_path):
+    # the ranks come back from the workers as spilled runs and are written the same as in memory
+    serial, pooled = str(tmp_path / "serial"), str(tmp_path / "pooled")
+    write_otf2_trace(SyntheticTrace(3, 1500, threads=2, seed=7), serial, int(1e9))
+    write_otf2_trace(SyntheticTrace(3, 1500, threads=2, seed=7), pooled, int(1e9), jobs=2, sort_memory=4096,
+                     spill_dir=str(tmp_path))
+    assert read_archive(pooled) == read_archive(serial)
+    assert sorted(os.listdir(tmp_path)) == ["pooled", "serial"]
+
+
+def test_spilled_ranks_come_back_from_the_workers(tmp_path):
+    # threads that alternate row by row cannot be passed through, the runs are spilled in the workers
+    tables = {rank_id: make_table(start=[float(i // 2) for i in range(1000)], end=[i // 2 + 0.5 for i in range(1000)],
+                                  tid=[i % 2 for i in range(1000)], size=list(range(1000))) for rank_id in range(3)}
+
+    def decode(rank_id):
+        return SortedRank(tables[rank_id], 128, spill_dir=str(tmp_path))
+
+    for rank_id, rank in parallel.decode_ranks(decode, range(3), 2):
+        assert rank.runs is not None
+        assert_tables_equal(EventTable.concat(list(rank.tables())), tables[rank_id].sort())
+        rank.remove()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,38 @@
+import collections
+import os
+
+import parallel_write
+from helpers import read_archive
+from recorder_to_otf2 import write_otf2_trace
+from synthetic import SyntheticTrace
+
+
+def test_workers_write_the_same_archive(tmp_path, monkeypatch):
+    # small parts, so the ranks are spread over several workers
+    monkeypatch.setattr(parallel_write, "PART_EVENTS", 2000)
+    serial, pooled = str(tmp_path / "serial"), str(tmp_path / "pooled")
+    write_otf2_trace(SyntheticTrace(4, 1500, threads=2, seed=5), serial, int(1e9))
+    write_otf2_trace(SyntheticTrace(4, 1500, threads=2, seed=5), pooled, int(1e9), write_jobs=2)
+
+    locations, clock, events = read_archive(pooled)
+    assert (locations, clock, events) == read_archive(serial)
+    assert sum(count for _, _, count in locations) == len(events)
+    assert not os.path.exists(os.path.join(pooled, parallel_write.PARTS_DIR))
+
+
+def test_moved_events_match_their_definitions(tmp_path, monkeypatch):
+    # the event counts of the locations and the time span of the archive are set through internals of the otf2
+    # bindings, a change of them has to show up as counts or a clock that do not match the events read back
+    assert parallel_write.BINDINGS_SUPPORTED
+    monkeypatch.setattr(parallel_write, "PART_EVENTS", 2000)
+    pooled = str(tmp_path / "pooled")
+    write_otf2_trace(SyntheticTrace(4, 1500, threads=2, seed=7), pooled, int(1e9), write_jobs=2)
+
+    locations, (global_offset, trace_length), events = read_archive(pooled)
+    read = collections.Counter((group, name) for group, name, *_ in events)
+    assert len(locations) == 8
+    assert {(group, name): count for group, name, count in locations} == read
+    times = [time for _, _, _, time, _, _ in events]
+    assert (global_offset, trace_length) == (min(times), max(times) - min(times))
+    assert sorted(name for name in os.listdir(os.path.join(pooled, "traces")) if name.endswith(".evt")) == \
+           sorted(f"{ref}.evt" for ref in range(8))
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import util
+from dispatch import build_dispatch_table
+from filters import EventFilter
+from recorder_to_otf2 import write_otf2_trace
+from synthetic import SyntheticTrace
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_a_row_per_call(tmp_path):
+    # nested MPI and POSIX calls are whole rows, not the segments otf2 needs
+    trace = SyntheticTrace(2, 2000, depth=3, seed=8)
+    write_otf2_trace(trace, str(tmp_path), int(1e9), output_format="parquet")
+    dispatch = build_dispatch_table(trace.funcs)
+    EventFilter().apply(dispatch)
+    for rank_id in range(2):
+        calls = util.get_rank_table(trace, rank_id, dispatch).sort()
+        rows = pq.read_table(os.path.join(tmp_path, "events", f"rank={rank_id}")).to_pydict()
+        assert rows["start"] == calls.start.tolist()
+        assert rows["end"] == calls.end.tolist()
+        # whence is only set for seeks
+        assert all((whence is None) == (kind != "seek") for whence, kind in zip(rows["whence"], rows["kind"]))
@@ -0,0 +1,66 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+from pipeline import run_pipelined
+
+
+def test_items_are_consumed_in_order_in_the_writer_thread():
+    consumed = []
+    run_pipelined(((i, i * i) for i in range(20)), lambda i, square: consumed.append((i, square,
+                                                                                      threading.current_thread())), 3)
+    assert [(i, square) for i, square, _ in consumed] == [(i, i * i) for i in range(20)]
+    assert {thread for _, _, thread in consumed} != {threading.current_thread()}
+
+
+def test_a_failing_consumer_stops_the_producer():
+    def consume(i):
+        if i == 3:
+            raise ValueError("write failed")
+
+    produced = []
+
+    def items():
+        for i in itertools.count():
+            produced.append(i)
+            yield (i,)
+
+    with pytest.raises(ValueError, match="write failed"):
+        run_pipelined(items(), consume, 2)
+    assert len(produced) < 100
+
+
+def test_a_failing_producer_is_raised_after_the_writer_finished():
+    consumed = []
+
+    def items():
+        yield (0,)
+        yield (1,)
+        raise ValueError("decode failed")
+
+    with pytest.raises(ValueError, match="decode failed"):
+        run_pipelined(items(), consumed.append, 4)
+    assert consumed == [0, 1]
+    assert [thread.name for thread in threading.enumerate()].count("writer") == 0
+
+
+@pytest.mark.parametrize("depth", [1, 3])
+def test_at_most_depth_items_are_in_flight(depth):
+    # besides the queue one item can be in the writer and one in the producer blocked on the queue
+    produced, started, in_flight = [0], [0], []
+
+    def items():
+        for i in range(30):
+            produced[0] += 1
+            in_flight.append(produced[0] - started[0])
+            yield (i,)
+
+    def consume(i):
+        started[0] += 1
+        time.sleep(0.005)
+
+    run_pipelined(items(), consume, depth)
+    assert started[0] == 30
+    assert max(in_flight) <= depth + 2
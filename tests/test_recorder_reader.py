@@ -0,0 +1,65 @@
+import os
+import sys
+
+import numpy as np
+
+import util
+from dispatch import build_dispatch_table
+from filters import EventFilter
+from recorder_reader import START_RULE, Grammar, RecorderTrace, is_native_trace
+from recorder_to_otf2 import write_otf2_trace
+from synthetic import SyntheticTrace, write_recorder_trace
+
+TIME_RESOLUTION = 1e-7
+
+
+def test_native_round_trip(tmp_path):
+    synthetic = SyntheticTrace(3, 3000, threads=2, seed=4)
+    write_recorder_trace(synthetic, str(tmp_path), TIME_RESOLUTION, rule_symbols=16)
+    assert is_native_trace(str(tmp_path))
+
+    # a small batch size, so the expansion of the grammar runs over many batches
+    native = RecorderTrace(str(tmp_path), batch_size=257)
+    assert native.funcs == synthetic.funcs
+    assert native.GM.total_ranks == 3
+    dispatch = build_dispatch_table(synthetic.funcs)
+    for rank_id in range(3):
+        assert native.LMs[rank_id].total_records == synthetic.LMs[rank_id].total_records
+        assert native.grammar(rank_id).length(START_RULE) == len(synthetic.records[rank_id])
+        expected = util.get_rank_table(synthetic, rank_id, dispatch)
+        table = util.get_rank_table(native, rank_id, dispatch)
+        assert len(table) == len(expected)
+        # the native trace stores the times in ticks of the time resolution
+        np.testing.assert_allclose(table.start, expected.start, atol=TIME_RESOLUTION)
+        np.testing.assert_allclose(table.end, expected.end, atol=2 * TIME_RESOLUTION)
+        assert [table.paths[h] if h >= 0 else None for h in table.handle.tolist()] == \
+               [expected.paths[h] if h >= 0 else None for h in expected.handle.tolist()]
+        for name in ("tid", "func_id", "level", "kind", "paradigm", "size", "offset", "num_chunks", "mode", "whence"):
+            np.testing.assert_array_equal(table.columns[name], expected.columns[name], err_msg=name)
+
+
+def test_other_directories_are_not_native(tmp_path):
+    assert not is_native_trace(str(tmp_path))
+
+
+def test_only_the_converted_ranks_are_read(tmp_path):
+    trace_path, out = str(tmp_path / "trace"), str(tmp_path / "out")
+    write_recorder_trace(SyntheticTrace(3, 500, seed=2), trace_path, TIME_RESOLUTION)
+    for extension in ("cst", "cfg", "ts"):
+        os.remove(os.path.join(trace_path, f"1.{extension}"))
+    native = RecorderTrace(trace_path)
+    assert native.GM.total_ranks == 3 and not native.parsed
+    write_otf2_trace(trace_path, out, int(1e9), event_filter=EventFilter(include_ranks=[0, 2]))
+    assert os.path.isfile(os.path.join(out, "traces.otf2"))
+
+
+def test_deeply_nested_rules():
+    # every rule repeats the one below it twice, deeper than the recursion limit
+    depth = sys.getrecursionlimit() + 100
+    rules = {-depth: (np.array([0, 1], dtype=np.int32), np.array([1, 1], dtype=np.int64))}
+    for rule_id in range(-depth + 1, 0):
+        rules[rule_id] = (np.array([rule_id - 1, 2], dtype=np.int32), np.array([1, 1], dtype=np.int64))
+    grammar = Grammar(rules, batch_size=64)
+    assert grammar.length(START_RULE) == 2 + (depth - 1)
+    terminals = np.concatenate(list(grammar.batches()))
+    np.testing.assert_array_equal(terminals, [0, 1] + [2] * (depth - 1))
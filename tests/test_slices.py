@@ -0,0 +1,45 @@
+import math
+import os
+
+import numpy as np
+
+import Events
+from event_table import NO_HANDLE
+from helpers import make_table, read_archive
+from recorder_to_otf2 import write_otf2_trace
+from slices import window_edges, window_rows
+from synthetic import SyntheticTrace
+
+
+def test_window_edges():
+    assert window_edges(1.0, 5.0, slices=2) == [(1.0, 3.0), (3.0, 5.0)]
+    # multiples of the duration from the window of the first call on
+    assert window_edges(25.0, 41.0, slice_duration=10.0) == [(20.0, 30.0), (30.0, 40.0), (40.0, 50.0)]
+    assert window_edges(0.0, 0.0, slice_duration=10.0) == [(0.0, 10.0)]
+
+
+def test_window_rows_split_io_by_time():
+    # an I/O operation, a region and a seek running over the edges at 4 and 8
+    part = make_table(("pwrite", "MPI_Barrier", "lseek"), ("/a",), start=[0.0, 2.0, 3.0], end=[10.0, 12.0, 5.0],
+                      func_id=[0, 1, 2], kind=[Events.KIND_IO, Events.KIND_EVENT, Events.KIND_SEEK],
+                      size=[100, 0, 0], offset=[1000, 0, 0], handle=[0, NO_HANDLE, 0])
+    part.columns["io_handle"] = np.array([0, NO_HANDLE, 0], dtype=np.int32)
+    part.columns["reach"] = np.maximum.accumulate(part.end)
+
+    windows = [window_rows(part, low, high) for low, high in [(-math.inf, 4.0), (4.0, 8.0), (8.0, math.inf)]]
+    assert [rows.start.tolist() for rows in windows] == [[0.0, 2.0, 3.0], [4.0, 4.0, 4.0], [8.0, 8.0]]
+    assert [rows.end.tolist() for rows in windows] == [[4.0, 4.0, 4.0], [8.0, 8.0, 5.0], [10.0, 12.0]]
+    # the bytes of every window add up to those of the operation
+    assert [rows.size[0] for rows in windows] == [40, 40, 20]
+    assert [rows.offset[0] for rows in windows] == [1000, 1040, 1080]
+    assert [rows.kind[0] for rows in windows] == [Events.KIND_IO] * 3
+    # the seek stays in the window it started in, it is a plain region after the edge
+    assert windows[1].kind[2] == Events.KIND_EVENT and windows[1].io_handle[2] == NO_HANDLE
+
+
+def test_windows_written_by_workers(tmp_path):
+    serial, pooled = str(tmp_path / "serial"), str(tmp_path / "pooled")
+    write_otf2_trace(SyntheticTrace(3, 1000, threads=2, seed=9), serial, int(1e9), slices=3)
+    write_otf2_trace(SyntheticTrace(3, 1000, threads=2, seed=9), pooled, int(1e9), slices=3, write_jobs=2)
+    for k in range(3):
+        assert read_archive(os.path.join(pooled, "slices", f"{k:04d}")) == read_archive(os.path.join(serial, "slices", f"{k:04d}"))
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import os
+
+import otf2
+
+from dispatch import build_dispatch_table
+from event_table import NO_HANDLE, NO_VALUE
+from helpers import make_table
+from summary import TraceSummary
+
+FUNCS = ["read", "write", "open", "MPI_Barrier"]
+READ, WRITE = otf2.IoOperationMode.READ.value, otf2.IoOperationMode.WRITE.value
+
+
+def calls(paths, rows):
+    # rows are (function, start, end, path index, size)
+    dispatch = build_dispatch_table(FUNCS)
+    infos = [dispatch[FUNCS.index(name)] for name, *_ in rows]
+    return make_table(FUNCS, paths, func_id=[info.func_id for info in infos], kind=[info.kind for info in infos],
+                      paradigm=[info.paradigm_id for info in infos],
+                      mode=[{"read": READ, "write": WRITE}.get(info.name, NO_VALUE) for info in infos],
+                      start=[row[1] for row in rows], end=[row[2] for row in rows], handle=[row[3] for row in rows],
+                      size=[row[4] for row in rows])
+
+
+def summary():
+    summary = TraceSummary(FUNCS, top=2)
+    summary.add_rank(0, calls(["/a", "/b"], [("read", 0.0, 1.0, 0, 100), ("read", 1.0, 1.5, 0, 1),
+                                             ("write", 2.0, 2.25, 1, 4096), ("open", 3.0, 3.125, 0, 0),
+                                             ("MPI_Barrier", 4.0, 6.0, NO_HANDLE, 0)]))
+    summary.add_rank(1, calls(["/a"], [("write", 0.0, 0.5, 0, 0)]))
+    return summary
+
+
+def test_totals_histograms_and_slowest_calls():
+    result = summary().as_dict()
+    rank = result["ranks"][0]
+    assert (rank["read_bytes"], rank["write_bytes"], rank["read_operations"], rank["write_operations"],
+            rank["metadata_operations"], rank["io_seconds"]) == (101, 4096, 2, 1, 1, 1.75)
+    # bucket k holds sizes in [2 ** (k - 1), 2 ** k), bucket 0 empty calls
+    assert rank["read_size_histogram"] == [0, 1, 0, 0, 0, 0, 0, 1]
+    assert rank["write_size_histogram"] == [0] * 13 + [1]
+
+    a, b = result["files"]["/a"], result["files"]["/b"]
+    assert (a["read_bytes"], a["write_bytes"], a["write_operations"], a["metadata_operations"]) == (101, 0, 1, 1)
+    assert a["write_size_histogram"] == [1]
+    assert (b["write_bytes"], b["read_operations"]) == (4096, 0)
+
+    assert result["functions"]["read"] == {"calls": 2, "seconds": 1.5}
+    assert result["functions"]["MPI_Barrier"] == {"calls": 1, "seconds": 2.0}
+    assert result["paradigms"] == {"MPI": {"calls": 1, "seconds": 2.0}, "POSIX": {"calls": 5, "seconds": 2.375}}
+    assert [(call["function"], call["seconds"], call["path"]) for call in result["slowest_calls"]] == \
+           [("MPI_Barrier", 2.0, None), ("read", 1.0, "/a")]
+
+
+def test_json_and_csv(tmp_path):
+    f = io.StringIO()
+    summary().write_json(f)
+    assert json.loads(f.getvalue())["ranks"]["1"]["write_operations"] == 1
+
+    summary().write_csv(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["files.csv", "functions.csv", "paradigms.csv", "ranks.csv", "slowest_calls.csv"]
+    with open(tmp_path / "ranks.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["rank"] for row in rows] == ["0", "1"]
+    assert rows[0]["read_size_histogram"] == "0 1 0 0 0 0 0 1"
+    with open(tmp_path / "slowest_calls.csv", newline="") as f:
+        assert [row["function"] for row in csv.DictReader(f)] == ["MPI_Barrier", "read"]
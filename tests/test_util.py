@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from dispatch import build_dispatch_table
+from filters import EventFilter
+from recorder_reader import RecorderTrace
+from synthetic import SyntheticTrace, write_recorder_trace
+from util import first_record_after, get_rank_table, split_evenly
+
+
+@pytest.mark.parametrize("size, num_chunks", [(0, 1), (10, 1), (10, 3), (3, 4), (1 << 20, 7)])
+def test_split_evenly(size, num_chunks):
+    chunks = split_evenly(size, num_chunks)
+    assert len(chunks) == num_chunks
+    assert sum(chunks) == size
+    assert max(chunks) - min(chunks) <= 1
+    assert chunks == sorted(chunks)
+
+
+class Record:
+    def __init__(self, tstart):
+        self.tstart = tstart
+
+
+@pytest.mark.parametrize("start_time, first", [(0.0, 0), (1.0, 0), (2.0, 1), (2.5, 3), (3.0, 3), (4.0, 4)])
+def test_first_record_after(start_time, first):
+    records = [Record(t) for t in (1.0, 2.0, 2.0, 3.0)]
+    assert first_record_after(records, len(records), start_time) == first
+    assert first_record_after(records, 2, 3.0) == 2
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_time_range_includes_the_start_and_excludes_the_end(tmp_path, native):
+    trace = SyntheticTrace(1, 2000, threads=2, seed=6)
+    if native:
+        write_recorder_trace(trace, str(tmp_path))
+        trace = RecorderTrace(str(tmp_path), batch_size=100)
+    dispatch = build_dispatch_table(trace.funcs)
+    full = get_rank_table(trace, 0, dispatch)
+    # the bounds are the start times of calls, so both edges are hit exactly
+    starts = np.unique(full.start)
+    window_start, window_end = starts[len(starts) // 4], starts[len(starts) // 2]
+
+    table = get_rank_table(trace, 0, dispatch, EventFilter(time_range=(window_start, window_end)))
+    expected = full.take(np.flatnonzero((full.start >= window_start) & (full.start < window_end)))
+    # the path table only holds the paths of the calls read
+    assert [table.paths[h] if h >= 0 else None for h in table.handle.tolist()] == \
+           [expected.paths[h] if h >= 0 else None for h in expected.handle.tolist()]
+    for name in ("tid", "func_id", "start", "end", "size", "offset"):
+        np.testing.assert_array_equal(table.columns[name], expected.columns[name], err_msg=name)
+    assert table.start.min() == window_start
+    assert table.start.max() < window_end
+
+    for empty in ((window_start, window_start), (starts[-1] + 1, np.inf), (0.0, starts[0])):
+        assert len(get_rank_table(trace, 0, dispatch, EventFilter(time_range=empty))) == 0
@@ -1,36 +1,178 @@
-import recorder_viz
-from Events import Event
+import numpy as np
+
+import Events
+from event_table import EventTable, EventTableBuilder
+from metrics import METRICS
+from overlap import resolve_rank_overlaps
+from recorder_reader import RecorderTrace, is_native_trace
+
+# records of recorder_viz are counted as read in batches of this many
+COUNT_BATCH = 1 << 16
 
 
 def get_stats_from_recorder(fp):
-    events = []
-    reader = recorder_viz.RecorderReader(fp)
-    func_names = reader.funcs
-    files = set()
-    for lm in reader.LMs:
-        files = files.union(lm.filemap)
+    # fp is a recorder directory or an already opened reader, e.g. a synthetic.SyntheticTrace. traces with one
+    # cst, cfg and ts file per rank are read lazily by recorder_reader, anything else is loaded by recorder_viz.
+    # the files are defined while the ranks are decoded, so opening the trace reads no rank
+    if isinstance(fp, str) and is_native_trace(fp):
+        with METRICS.stage("load"):
+            reader = RecorderTrace(fp)
+    elif isinstance(fp, str):
+        import recorder_viz
+        with METRICS.stage("load"):
+            reader = recorder_viz.RecorderReader(fp)
+    else:
+        reader = fp
+    return reader.funcs, reader, reader.GM.total_ranks
+
+
+def get_rank_table(reader, rank_id, dispatch, event_filter=None):
+    # the records of a single rank are decoded straight into the columns of an event table. arguments are only
+    # touched for the positions listed in the function's layout, skipped records and records of functions
+    # without a layout never touch them at all
+    if isinstance(reader, RecorderTrace):
+        return get_native_rank_table(reader, rank_id, dispatch, event_filter)
+    builder = EventTableBuilder(reader.funcs)
+    records = reader.records[rank_id]
+    path_filter = event_filter is not None and event_filter.has_path_rules
+    first, last = 0, reader.LMs[rank_id].total_records
+    window_end = float("inf")
+    if event_filter is not None and event_filter.time_range is not None:
+        # recorder writes the records of a rank in start time order, so the window is found by bisection
+        first = first_record_after(records, last, event_filter.time_range[0])
+        window_end = event_filter.time_range[1]
+
+    read = last - first
+    for i in range(first, last):
+
+        record = records[i]
+        if record.tstart >= window_end:
+            read = i - first
+            break
+        # counted a batch at a time, so the progress report sees a large rank advance
+        if (i - first) % COUNT_BATCH == COUNT_BATCH - 1:
+            METRICS.count("records_read", COUNT_BATCH)
+        info = dispatch[record.func_id]
+        if info.skipped:
+            continue
+
+        if path_filter and "path" in info.layout and record.arg_count > info.layout["path"] \
+                and not event_filter.select_path(record.args[info.layout["path"]]):
+            continue
+
+        if info.required_args == 0 or record.arg_count < info.required_args:
+            builder.append(rank_id, record.tid, info.func_id, record.level, Events.KIND_EVENT if info.required_args else info.kind,
+                           info.paradigm_id, record.tstart, record.tend)
+        else:
+            builder.append_record(rank_id, info, record.tstart, record.tend, record.level, record.tid, record.args)
+
+    table = builder.build()
+    METRICS.count("records_read", read % COUNT_BATCH)
+    METRICS.count("records_filtered", read - len(table))
+    return table
+
+
+def get_native_rank_table(reader, rank_id, dispatch, event_filter=None):
+    # everything but the timestamps of a call is given by its call signature, so every signature is decoded once
+    # into a template row, or dropped, and the calls of the rank are the template rows gathered by their cst index
+    signatures = reader.signatures(rank_id)
+    builder = EventTableBuilder(reader.funcs)
+    path_filter = event_filter is not None and event_filter.has_path_rules
+    template_rows = np.full(len(signatures), -1, dtype=np.int64)
+    for i, (tid, func_id, level, args) in enumerate(zip(signatures.tids.tolist(), signatures.func_ids.tolist(),
+                                                        signatures.levels.tolist(), signatures.args)):
+        # user functions have ids beyond the function list
+        if func_id >= len(dispatch) or dispatch[func_id].skipped:
+            continue
+        info = dispatch[func_id]
+        if path_filter and "path" in info.layout and len(args) > info.layout["path"] \
+                and not event_filter.select_path(args[info.layout["path"]]):
+            continue
+        template_rows[i] = len(builder.arrays["start"])
+        if info.required_args == 0 or len(args) < info.required_args:
+            builder.append(rank_id, tid, info.func_id, level, Events.KIND_EVENT if info.required_args else info.kind,
+                           info.paradigm_id, 0.0, 0.0)
+        else:
+            builder.append_record(rank_id, info, 0.0, 0.0, level, tid, args)
+    templates = builder.build()
+
+    window_start, window_end = -np.inf, np.inf
+    if event_filter is not None and event_filter.time_range is not None:
+        window_start, window_end = event_filter.time_range
+    parts = []
+    read = 0
+    for terminals, starts, ends in reader.batches(rank_id):
+        # the starts of a rank never decrease, the window ends with the first call starting after it
+        if starts[0] >= window_end:
+            break
+        in_window = (starts >= window_start) & (starts < window_end)
+        read += int(np.count_nonzero(in_window))
+        METRICS.count("records_read", int(np.count_nonzero(in_window)))
+        rows = template_rows[terminals]
+        keep = in_window & (rows >= 0)
+        part = templates.take(rows[keep])
+        part.columns["start"] = starts[keep]
+        part.columns["end"] = ends[keep]
+        parts.append(part)
+
+    table = EventTable.concat(parts) if parts else EventTable.empty(reader.funcs, templates.paths)
+    METRICS.count("records_filtered", read - len(table))
+    return table
+
+
+def first_record_after(records, count, start_time):
+    # index of the first record that starts at or after start_time
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if records[middle].tstart < start_time:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def resolve_overlaps(table, split_overlaps=True):
+    # without split_overlaps nested calls are kept whole and the table is only sorted by start
+    if not split_overlaps:
+        with METRICS.stage("sort"):
+            return table.sort()
+    with METRICS.stage("overlap"):
+        resolved = resolve_rank_overlaps(table)
+    METRICS.count("overlap_splits", len(resolved) - len(table))
+    return resolved
+
+
+def filter_table(table, dispatch, event_filter):
+    filtered = event_filter.filter_table(table, dispatch)
+    METRICS.count("records_read", len(table))
+    METRICS.count("records_filtered", len(table) - len(filtered))
+    return filtered
 
-    for rank_id, rank in enumerate(range(reader.GM.total_ranks)):
-        records = reader.records[rank]
-        for i in range(reader.LMs[rank].total_records):
 
-            record = records[i]
-            start_time, end_time, level, function, tid, arg_count, args = record.tstart, record.tend, record.level, func_names[record.func_id], record.tid, record.arg_count, record.args
-            largs = []
-            for j in range(arg_count):
-                largs.append(args[j])
+def decode_rank(reader, rank_id, dispatch, event_filter=None, split_overlaps=True):
+    with METRICS.stage("decode"):
+        table = get_rank_table(reader, rank_id, dispatch, event_filter)
+    return resolve_overlaps(table, split_overlaps)
 
-            events.append(Event.get_event(rank_id, function, start_time, end_time, level, tid, largs))
 
-    return files, func_names, events, reader.GM.total_ranks
+def decode_cached_rank(cached_trace, reader, rank_id, raw_dispatch, dispatch, event_filter, split_overlaps=True):
+    # the cache holds the unfiltered table of a rank, so conversions with other filters can use it as well.
+    # ranks that are not cached yet are decoded from the reader and added
+    with METRICS.stage("decode"):
+        if cached_trace.has_rank(rank_id):
+            table = filter_table(cached_trace.get_rank_table(rank_id), dispatch, event_filter)
+        else:
+            table = get_rank_table(reader, rank_id, raw_dispatch)
+            cached_trace.save_rank(rank_id, table)
+            # get_rank_table counted the records as read already
+            filtered = event_filter.filter_table(table, dispatch)
+            METRICS.count("records_filtered", len(table) - len(filtered))
+            table = filtered
+    return resolve_overlaps(table, split_overlaps)
 
 
 def split_evenly(size: int, num_chunks: int) -> list[int]:
-    part_size = size // num_chunks
-    residue = size % num_chunks
-    factors = [part_size for x in range(num_chunks)]
-    i = 0
-    while residue > 0:
-        factors[i] += 1
-        residue -= 1
-    return sorted(factors)
+    # the remainder is spread over the last chunks, so the list is sorted without sorting it
+    part_size, residue = divmod(size, num_chunks)
+    return [part_size] * (num_chunks - residue) + [part_size + 1] * residue